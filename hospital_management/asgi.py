@@ -0,0 +1,20 @@
+"""
+ASGI config for hospital_management project.
+
+Serve with any ASGI server, e.g. ``uvicorn hospital_management.asgi:application``.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_management.settings')
+# Route the booking AJAX endpoints to their async views
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', 'on')
+
+django_application = get_asgi_application()
+
+# Needs the app registry that get_asgi_application() just set up
+from hospital_system.fastpath import with_fast_paths  # noqa: E402
+
+application = with_fast_paths(django_application)
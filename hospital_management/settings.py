@@ -31,6 +31,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'hospital_system.assets.StaticAssetMiddleware',
+    'hospital_system.querymetrics.QueryMetricsMiddleware',
+    'hospital_system.refdata.ReferenceVersionsMiddleware',
+    # Before SessionMiddleware: replayed responses keep the session cookie
+    'hospital_system.idempotency.IdempotencyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,22 +57,109 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'hospital_system.refdata.reference_data',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'hospital_management.wsgi.application'
+ASGI_APPLICATION = 'hospital_management.asgi.application'
+
+# Serve the booking AJAX endpoints with their async views. asgi.py sets
+# DJANGO_ASYNC_VIEWS=on; under WSGI the sync views are cheaper.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', 'off').lower() in ('1', 'on', 'true', 'yes')
 
 
 # Database
+# DJANGO_DB_TUNING=off falls back to SQLite's defaults and a new connection
+# per request, e.g. to compare against with `manage.py bench_db_concurrency`.
+DB_TUNING = os.environ.get('DJANGO_DB_TUNING', 'on').lower() not in ('0', 'off', 'false', 'no')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        # Reuse connections across requests; health checks replace dead ones.
+        # Not under ASGI: async views query from short-lived threads, and a
+        # persistent connection would outlive its thread.
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 0 if ASYNC_VIEWS else 600)) if DB_TUNING else 0,
+        'CONN_HEALTH_CHECKS': DB_TUNING,
     }
 }
 
+# Issued on every new SQLite connection (hospital_system/dbtuning.py).
+# WAL lets readers run alongside a writer; NORMAL sync is durable in WAL
+# mode except for the last commits on power loss; writers wait up to
+# busy_timeout ms for the lock instead of failing.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('DJANGO_SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,  # KiB, i.e. about 20 MB per connection
+    'temp_store': 'MEMORY',
+} if DB_TUNING else {}
+
+
+# Cache
+# Every worker process must see the same cache: reference-data versions, whole
+# pages, sessions and logged-in users are invalidated through it. By default it
+# is a table in a SQLite database of its own next to the main one (created by
+# `manage.py migrate`), shared by every process on the host and never waiting
+# on the main database's write lock. DJANGO_CACHE_URL=redis://host:6379/0 or
+# memcached://host:11211 shares it across hosts; locmem:// keeps it in each
+# process, which is only correct with a single process.
+CACHE_URL = os.environ.get('DJANGO_CACHE_URL', '')
+
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_URL[len('memcached://'):].split(','),
+        }
+    }
+elif CACHE_URL.startswith('locmem://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'arogya-default',
+        }
+    }
+else:
+    DATABASES['cache'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DJANGO_CACHE_DB_NAME', BASE_DIR / 'cache.sqlite3'),
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': DB_TUNING,
+    }
+    DATABASE_ROUTERS = ['hospital_system.dbrouters.CacheRouter']
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'hospital_cache',
+            # Culling counts the rows on every write; keep it rare
+            'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 4},
+        }
+    }
+
+
+# Sessions and authentication
+# cached_db reads sessions from CACHES and writes them through to the
+# database; DJANGO_SESSION_ENGINE=signed_cookies keeps them in the client's
+# cookie instead, and db is Django's default. CachedModelBackend serves the
+# logged-in User and Patient from the cache (hospital_system/identity.py).
+# With the default DatabaseCache both are still SELECTs, on the cache database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('DJANGO_SESSION_ENGINE', 'cached_db')
+AUTHENTICATION_BACKENDS = ['hospital_system.identity.CachedModelBackend']
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -98,9 +190,26 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic minifies CSS/JS, writes content-hashed copies plus a manifest
+# that {% static %} resolves through, and precompresses them (.gz, and .br if
+# the optional brotli package is installed). hospital_system.assets serves
+# them with far-future caching; run collectstatic before starting with DEBUG off
+# (until then pages link the unhashed names, as under the test runner).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'hospital_system.assets.MinifiedManifestStorage',
+    },
+}
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploaded doctor/department images are scaled down to fit this many pixels
+# (longest side); see hospital_system/imaging.py
+IMAGE_MAX_DIMENSION = 1600
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -1,10 +1,18 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .adminperf import PerformanceModeAdmin, forget_count
+from .availability import BLOCKING_STATUSES
+from .bookings import SlotUnavailable
+from .imaging import image_url
+from .jobs import requeue
 from .models import (
     Hospital, Department, Doctor, Patient, Appointment,
-    Service, Infrastructure, Testimonial
+    Service, Infrastructure, Testimonial, WeeklyShift, ScheduleException, Job
 )
+from .signals import schedules_changed
 
 
 # Inline admin for Patient linked to User
@@ -41,24 +49,52 @@ class DepartmentAdmin(admin.ModelAdmin):
     def get_image_preview(self, obj):
         if obj.image:
             from django.utils.html import format_html
-            return format_html('<img src="{}" width="50" height="50" style="border-radius: 5px;" />', obj.image.url)
+            return format_html('<img src="{}" width="50" height="50" style="border-radius: 5px;" />', image_url(obj, 128))
         return 'No image'
     get_image_preview.short_description = 'Image Preview'
 
 
+# Doctor schedule inlines
+class WeeklyShiftInline(admin.TabularInline):
+    model = WeeklyShift
+    fields = ('weekday', 'start_time', 'end_time')
+    extra = 0
+
+
+class ScheduleExceptionInline(admin.TabularInline):
+    model = ScheduleException
+    fields = ('date', 'start_time', 'end_time', 'reason')
+    extra = 0
+
+    def get_queryset(self, request):
+        # Past exceptions no longer affect bookings
+        return super().get_queryset(request).filter(date__gte=timezone.localdate())
+
+
 @admin.register(Doctor)
-class DoctorAdmin(admin.ModelAdmin):
+class DoctorAdmin(PerformanceModeAdmin):
     list_display = ('name', 'specialization', 'experience_years', 'consultation_fee', 'is_available', 'get_image_preview')
     search_fields = ('name', 'qualification')
     list_filter = ('specialization', 'is_available', 'gender')
+    performance_select_related = ('specialization',)
+    department_filter_field = 'specialization'
     readonly_fields = ('name', 'email', 'phone', 'get_image_preview')
     fields = ('name', 'email', 'phone', 'qualification', 'specialization', 'experience_years', 
-              'consultation_fee', 'gender', 'availability', 'bio', 'image', 'get_image_preview', 'is_available')
+              'consultation_fee', 'gender', 'availability', 'slot_minutes', 'bio', 'image', 'get_image_preview',
+              'is_available')
+    inlines = (WeeklyShiftInline, ScheduleExceptionInline)
+
+    def save_related(self, request, form, formsets, change):
+        # Shifts entered along with a new doctor replace the default ones
+        # read from its availability (see signals.create_default_shifts)
+        if not change and any(formset.model is WeeklyShift and formset.has_changed() for formset in formsets):
+            form.instance.weekly_shifts.all().delete()
+        super().save_related(request, form, formsets, change)
     
     def get_image_preview(self, obj):
         if obj.image:
             from django.utils.html import format_html
-            return format_html('<img src="{}" width="100" height="100" style="border-radius: 5px;" />', obj.image.url)
+            return format_html('<img src="{}" width="100" height="100" style="border-radius: 5px;" />', image_url(obj, 320))
         return 'No image'
     get_image_preview.short_description = 'Image Preview'
 
@@ -72,18 +108,26 @@ class PatientAdmin(admin.ModelAdmin):
 
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
-    list_display = ('patient_name', 'doctor', 'appointment_date', 'appointment_time', 'status')
+class AppointmentAdmin(PerformanceModeAdmin):
+    list_display = ('patient_name', 'doctor', 'appointment_date', 'appointment_time', 'duration_minutes', 'status')
     search_fields = ('patient_name', 'patient_email', 'doctor__name')
-    list_filter = ('status', 'appointment_date', 'department')
+    list_filter = ('status', 'department')
+    date_hierarchy = 'appointment_date'
     readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('patient',)
+    actions = ('mark_scheduled', 'mark_completed', 'mark_cancelled', 'mark_no_show')
+    performance_select_related = ('doctor',)
+    performance_autocomplete_fields = ('doctor', 'department', 'service')
+    department_filter_field = 'department'
+    indexed_date_hierarchy = True
     
     fieldsets = (
         ('Patient Information', {
-            'fields': ('patient_name', 'patient_email', 'patient_phone')
+            'fields': ('patient', 'patient_name', 'patient_email', 'patient_phone')
         }),
         ('Appointment Details', {
-            'fields': ('doctor', 'department', 'appointment_date', 'appointment_time', 'reason')
+            'fields': ('doctor', 'department', 'service', 'appointment_date', 'appointment_time', 'duration_minutes',
+                       'reason')
         }),
         ('Status', {
             'fields': ('status', 'notes')
@@ -94,12 +138,70 @@ class AppointmentAdmin(admin.ModelAdmin):
         }),
     )
 
+    # Bulk status changes: one UPDATE however many rows are selected, except
+    # for a blocking status, which must not make two appointments overlap
+    def set_status(self, request, queryset, status):
+        if status in BLOCKING_STATUSES:
+            return self.block_slots(request, queryset, status)
+        with transaction.atomic():
+            # Read before the UPDATE: the selection may be filtered on status
+            doctor_ids = list(queryset.order_by().values_list('doctor_id', flat=True).distinct())
+            updated = queryset.exclude(status=status).update(status=status, updated_at=timezone.now())
+            # update() sends no signals
+            schedules_changed(doctor_ids)
+        self.message_user(
+            request, f'{updated} appointment(s) marked {dict(Appointment.STATUS_CHOICES)[status].lower()}.',
+            messages.SUCCESS,
+        )
+
+    def block_slots(self, request, queryset, status):
+        """Set a blocking status row by row, so each is checked for overlaps"""
+        updated = skipped = 0
+        for appointment in queryset.exclude(status=status).order_by('appointment_date', 'appointment_time'):
+            appointment.status = status
+            try:
+                appointment.save(update_fields=['status', 'updated_at'])
+            except SlotUnavailable:
+                skipped += 1
+            else:
+                updated += 1
+        label = dict(Appointment.STATUS_CHOICES)[status].lower()
+        self.message_user(request, f'{updated} appointment(s) marked {label}.', messages.SUCCESS)
+        if skipped:
+            self.message_user(
+                request, f'{skipped} appointment(s) not marked {label}: they overlap another appointment '
+                         f'of the same doctor.',
+                messages.WARNING,
+            )
+
+    @admin.action(description='Mark selected appointments as scheduled')
+    def mark_scheduled(self, request, queryset):
+        self.set_status(request, queryset, 'scheduled')
+
+    @admin.action(description='Mark selected appointments as completed')
+    def mark_completed(self, request, queryset):
+        self.set_status(request, queryset, 'completed')
+
+    @admin.action(description='Mark selected appointments as cancelled')
+    def mark_cancelled(self, request, queryset):
+        self.set_status(request, queryset, 'cancelled')
+
+    @admin.action(description='Mark selected appointments as no-show')
+    def mark_no_show(self, request, queryset):
+        self.set_status(request, queryset, 'no-show')
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        forget_count(Appointment)
+
 
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'department', 'cost_estimate')
+class ServiceAdmin(PerformanceModeAdmin):
+    list_display = ('name', 'department', 'duration_minutes', 'cost_estimate')
     search_fields = ('name',)
     list_filter = ('department',)
+    performance_select_related = ('department',)
+    department_filter_field = 'department'
 
 
 @admin.register(Infrastructure)
@@ -109,8 +211,25 @@ class InfrastructureAdmin(admin.ModelAdmin):
 
 
 @admin.register(Testimonial)
-class TestimonialAdmin(admin.ModelAdmin):
+class TestimonialAdmin(PerformanceModeAdmin):
     list_display = ('patient_name', 'rating', 'doctor', 'is_published', 'created_at')
     search_fields = ('patient_name', 'patient_message')
     list_filter = ('rating', 'is_published', 'created_at')
     readonly_fields = ('created_at',)
+    performance_select_related = ('doctor',)
+    performance_autocomplete_fields = ('doctor',)
+
+
+# Background jobs: failed ("dead") jobs stay here with their last traceback
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'attempts', 'max_attempts', 'available_at', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('task',)
+    readonly_fields = ('attempts', 'claimed_by', 'last_error', 'created_at', 'finished_at')
+    actions = ('requeue_jobs',)
+
+    @admin.action(description='Requeue selected jobs')
+    def requeue_jobs(self, request, queryset):
+        requeued = requeue(queryset)
+        self.message_user(request, f'{requeued} job(s) queued again.', messages.SUCCESS)
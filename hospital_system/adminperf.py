@@ -0,0 +1,209 @@
+"""
+Admin performance mode for large tables.
+
+``PerformanceModeAdmin`` keeps changelists and change forms responsive with
+millions of appointments. It joins the foreign keys a changelist displays,
+replaces foreign-key ``<select>`` widgets with autocomplete, takes department
+filter choices from the reference data cache, and skips the unfiltered
+"N total" count. The unfiltered row count that paginates the first page is
+cached for ``ADMIN_COUNT_CACHE_TIMEOUT`` seconds, or read from the planner's
+statistics on PostgreSQL. Date hierarchy drill-downs probe the date index once
+per year, month or day instead of scanning every row. Set
+``ADMIN_PERFORMANCE_MODE = False`` to get the stock behaviour back, e.g. to
+compare against with ``manage.py bench_admin``.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, QuerySet
+from django.utils.functional import cached_property
+
+from .refdata import get_departments
+
+
+COUNT_CACHE_PREFIX = 'adminperf:count'
+
+
+def performance_mode():
+    return getattr(settings, 'ADMIN_PERFORMANCE_MODE', True)
+
+
+# Counting
+def estimated_count(queryset):
+    """Row count of an unfiltered queryset, allowed to lag behind writes"""
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 (or 0) until the table has been vacuumed or analyzed
+        if row and row[0] >= getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000):
+            return row[0]
+    key = f'{COUNT_CACHE_PREFIX}:{queryset.db}:{model._meta.label_lower}'
+    return cache.get_or_set(key, queryset.count, getattr(settings, 'ADMIN_COUNT_CACHE_TIMEOUT', 300))
+
+
+def forget_count(model, using='default'):
+    cache.delete(f'{COUNT_CACHE_PREFIX}:{using}:{model._meta.label_lower}')
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that counts an unfiltered changelist with ``estimated_count``
+
+    Filtered and searched changelists are counted exactly: their filters
+    bound the work.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if performance_mode() and isinstance(queryset, QuerySet) and not queryset.query.where:
+            return estimated_count(queryset)
+        return super().count
+
+
+# Date hierarchy
+class IndexedDatesQuerySet(QuerySet):
+    """QuerySet whose ``dates()`` probes an index instead of scanning
+
+    The admin date hierarchy lists the distinct years, months or days that
+    have rows with ``SELECT DISTINCT`` over a date function, which reads
+    every row. Here each candidate bucket between the first and last date is
+    an ``exists()`` on a date range: one index seek per bucket.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # The date hierarchy asks for the MIN() and MAX() of its field before
+        # calling dates(); answer both from one bounds lookup
+        field_name = None if args else _min_max_field(list(kwargs.values()))
+        if field_name:
+            return dict(zip(kwargs, self._bounds(field_name)))
+        return super().aggregate(*args, **kwargs)
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        first, last = self._bounds(field_name)
+        if first is None:
+            return []
+        found = [
+            start for start, end in _buckets(first, last, kind)
+            if self.filter(**{f'{field_name}__range': (start, end)}).exists()
+        ]
+        return found if order == 'ASC' else found[::-1]
+
+    def _bounds(self, field_name):
+        """(first, last) value of ``field_name``, remembered for this queryset"""
+        cache = self.__dict__.setdefault('_bounds_cache', {})
+        if field_name not in cache:
+            if self.query.where:
+                bounds = super().aggregate(first=Min(field_name), last=Max(field_name))
+            else:
+                # Without a WHERE clause SQLite answers a lone MIN() or MAX()
+                # with one index seek, but scans the table for both at once
+                bounds = super().aggregate(first=Min(field_name))
+                bounds.update(super().aggregate(last=Max(field_name)))
+            cache[field_name] = (bounds['first'], bounds['last'])
+        return cache[field_name]
+
+
+def _min_max_field(aggregates):
+    """Field name of ``[Min(field), Max(field)]``, else None"""
+    if [type(aggregate) for aggregate in aggregates] != [Min, Max]:
+        return None
+    sources = [aggregate.get_source_expressions() for aggregate in aggregates]
+    if any(aggregate.filter for aggregate in aggregates) or sources[0] != sources[1] or len(sources[0]) != 1:
+        return None
+    return getattr(sources[0][0], 'name', None)
+
+
+def _buckets(first, last, kind):
+    """(first day, last day) of each year, month or day from ``first`` to ``last``"""
+    if kind == 'day':
+        day = first
+        while day <= last:
+            yield day, day
+            day += timedelta(days=1)
+        return
+    start = date(first.year, 1 if kind == 'year' else first.month, 1)
+    while start <= last:
+        if kind == 'year':
+            following = date(start.year + 1, 1, 1)
+        else:
+            following = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        yield start, following - timedelta(days=1)
+        start = following
+
+
+# Filters
+def department_filter(field_name):
+    """List filter on a Department foreign key with choices from the reference data cache"""
+
+    class DepartmentFilter(admin.SimpleListFilter):
+        title = 'department'
+        parameter_name = f'{field_name}__id__exact'
+
+        def lookups(self, request, model_admin):
+            return [(str(department.pk), department.name) for department in get_departments()]
+
+        def queryset(self, request, queryset):
+            if not self.value():
+                return queryset
+            try:
+                return queryset.filter(**{f'{field_name}_id': int(self.value())})
+            except ValueError as e:
+                raise IncorrectLookupParameters(e)
+
+    return DepartmentFilter
+
+
+class PerformanceModeAdmin(admin.ModelAdmin):
+    """ModelAdmin with the large-table behaviour described above
+
+    Subclasses declare ``performance_select_related`` (foreign keys the
+    changelist shows), ``performance_autocomplete_fields``,
+    ``department_filter_field`` (the Department foreign key in
+    ``list_filter`` to serve from the cache) and ``indexed_date_hierarchy``
+    when ``date_hierarchy`` names an indexed field.
+    """
+
+    paginator = EstimatedCountPaginator
+    performance_select_related = ()
+    performance_autocomplete_fields = ()
+    department_filter_field = None
+    indexed_date_hierarchy = False
+
+    @property
+    def show_full_result_count(self):
+        return not performance_mode()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if performance_mode() and self.indexed_date_hierarchy and self.date_hierarchy:
+            queryset = IndexedDatesQuerySet(self.model, queryset.query, using=queryset.db)
+        return queryset
+
+    def get_list_select_related(self, request):
+        if performance_mode() and self.performance_select_related:
+            return self.performance_select_related
+        return super().get_list_select_related(request)
+
+    def get_autocomplete_fields(self, request):
+        if performance_mode():
+            return tuple(super().get_autocomplete_fields(request)) + tuple(self.performance_autocomplete_fields)
+        return super().get_autocomplete_fields(request)
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if performance_mode() and self.department_filter_field:
+            return [
+                department_filter(self.department_filter_field) if entry == self.department_filter_field else entry
+                for entry in list_filter
+            ]
+        return list_filter
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class HospitalSystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hospital_system'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import checks, signals  # noqa: F401
+        from .dbrouters import create_cache_table
+        from .dbtuning import apply_sqlite_pragmas
+        from .querymetrics import install_request_recorder
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='hospital_system.sqlite_pragmas')
+        connection_created.connect(install_request_recorder, dispatch_uid='hospital_system.request_recorder')
+        post_migrate.connect(create_cache_table, sender=self, dispatch_uid='hospital_system.cache_table')
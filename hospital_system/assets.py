@@ -0,0 +1,291 @@
+"""
+Static asset build and serving.
+
+``collectstatic`` with ``MinifiedManifestStorage`` minifies CSS and JS, writes
+content-hashed copies (``style.3f2a9c1b4e7d.css``) listed in
+``staticfiles.json`` so ``{% static %}`` resolves to them, and precompresses
+text assets as ``.gz`` (and ``.br`` when the optional ``brotli`` package is
+installed). ``StaticAssetMiddleware`` serves ``STATIC_ROOT`` without a
+separate web server: it picks the smallest encoding the client accepts and
+marks hashed files immutable for a year. Before the first ``collectstatic``
+there is no manifest, and ``{% static %}`` falls back to unhashed names.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+MINIFIERS = {}
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+
+# Minification
+def _minifier(extension):
+    def register(func):
+        MINIFIERS[extension] = func
+        return func
+    return register
+
+
+def _scan(text, on_code, regex_allowed=None):
+    """Split ``text`` into code and literal/comment chunks
+
+    Strings (and regex literals, for JS) are kept verbatim, comments are
+    dropped unless they start with ``/*!`` (licence headers), and code chunks
+    are passed through ``on_code``.
+    """
+    out = []
+    code = []
+    i, n = 0, len(text)
+
+    def flush():
+        if code:
+            out.append(on_code(''.join(code)))
+            code.clear()
+
+    while i < n:
+        ch = text[i]
+        nxt = text[i + 1] if i + 1 < n else ''
+        if ch == '/' and nxt == '*':
+            end = text.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            if text.startswith('/*!', i):
+                flush()
+                out.append(text[i:end])
+            else:
+                code.append(' ')
+            i = end
+        elif ch == '/' and nxt == '/' and regex_allowed is not None:
+            end = text.find('\n', i)
+            i = n if end == -1 else end
+        elif ch in '"\'`' or (ch == '/' and regex_allowed is not None
+                               and regex_allowed((out[-1] if out else '') + ''.join(code))):
+            flush()
+            j = i + 1
+            in_class = False
+            while j < n:
+                if text[j] == '\\':
+                    j += 2
+                    continue
+                if ch == '/' and text[j] == '[':
+                    in_class = True
+                elif ch == '/' and text[j] == ']':
+                    in_class = False
+                elif text[j] == ch and not in_class:
+                    break
+                elif text[j] == '\n' and ch in '"\'':
+                    break
+                j += 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        else:
+            code.append(ch)
+            i += 1
+    flush()
+    return ''.join(out)
+
+
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_CSS_COLON = re.compile(r':\s+')
+_CSS_SEMICOLON = re.compile(r';}')
+
+
+@_minifier('.css')
+def minify_css(text):
+    def code(chunk):
+        chunk = _CSS_SPACE.sub(' ', chunk)
+        chunk = _CSS_PUNCTUATION.sub(r'\1', chunk)
+        # Only after colons: a space before one is a descendant selector
+        chunk = _CSS_COLON.sub(':', chunk)
+        return _CSS_SEMICOLON.sub('}', chunk)
+    return _scan(text, code).strip()
+
+
+_JS_REGEX_PRECEDES = re.compile(r'(?:^|[(,=:\[!&|?{};+\-*%<>~^]|\breturn|\btypeof|\bcase|\bdo|\belse)\s*$')
+_JS_LINE_SPACE = re.compile(r'[ \t]+')
+_JS_BLANK_LINES = re.compile(r'\s*\n\s*')
+
+
+@_minifier('.js')
+def minify_js(text):
+    """Strip comments, indentation and blank lines
+
+    Line breaks are kept, so automatic semicolon insertion behaves exactly as
+    in the source; this is not a mangling minifier.
+    """
+    def code(chunk):
+        chunk = _JS_LINE_SPACE.sub(' ', chunk)
+        return _JS_BLANK_LINES.sub('\n', chunk)
+
+    def regex_allowed(preceding):
+        return bool(_JS_REGEX_PRECEDES.search(preceding))
+
+    return _scan(text, code, regex_allowed).strip() + '\n'
+
+
+# Compression
+def compressed_variants(content):
+    """(extension, bytes) for each encoding that actually shrinks ``content``"""
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content, quality=11)))
+    return [(ext, data) for ext, data in variants if len(data) < len(content)]
+
+
+def _is_project_storage(storage):
+    """True for the finder storage of a STATICFILES_DIRS entry"""
+    location = getattr(storage, 'location', None)
+    if not location:
+        return False
+    roots = [entry[1] if isinstance(entry, (list, tuple)) else entry for entry in settings.STATICFILES_DIRS]
+    return os.path.realpath(location) in {os.path.realpath(root) for root in roots}
+
+
+class MinifiedManifestStorage(ManifestStaticFilesStorage):
+    """Manifest storage that minifies before hashing and precompresses after
+
+    Until ``collectstatic`` has written a manifest, names resolve to the
+    plain source names, so pages still render with DEBUG off (the test
+    suite, or a checkout started without collecting).
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            for name, (storage, path) in paths.items():
+                minify = MINIFIERS.get(os.path.splitext(name)[1])
+                # Only the project's own assets: app assets (admin) ship as built
+                if minify is None or '.min.' in name or not _is_project_storage(storage):
+                    continue
+                with storage.open(path) as f:
+                    minified = minify(f.read().decode('utf-8'))
+                if self.exists(name):
+                    self.delete(name)
+                self._save(name, ContentFile(minified.encode('utf-8')))
+                # Hash (and rewrite URLs in) the minified copy, not the source
+                paths[name] = (self, name)
+
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        if not dry_run:
+            for name in set(self.hashed_files.values()):
+                if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                    self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as f:
+            content = f.read()
+        for extension, data in compressed_variants(content):
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            self._save(name + extension, ContentFile(data))
+
+
+# Serving
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _accepted_encodings(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = set()
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+class StaticAssetMiddleware:
+    """Serve collected static files with precompressed variants and cache headers"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.root = str(settings.STATIC_ROOT) if settings.STATIC_ROOT else None
+        self._immutable = None
+
+    def immutable_names(self):
+        if self._immutable is None:
+            hashed = getattr(staticfiles_storage, 'hashed_files', None) or {}
+            self._immutable = set(hashed.values())
+        return self._immutable
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.handles(request):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.handles(request):
+            # File system checks and open() off the event loop
+            response = await sync_to_async(self.serve, thread_sensitive=False)(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def handles(self, request):
+        return bool(self.root) and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except ValueError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        immutable = name in self.immutable_names()
+        if not immutable and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            return HttpResponseNotModified()
+
+        content_type, _ = mimetypes.guess_type(path)
+        serve_path, encoding = path, None
+        accepted = _accepted_encodings(request)
+        for token, extension in ENCODINGS:
+            if token in accepted and os.path.isfile(path + extension):
+                serve_path, encoding = path + extension, token
+                break
+
+        response = FileResponse(open(serve_path, 'rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if os.path.isfile(path + '.gz') or os.path.isfile(path + '.br'):
+            patch_vary_headers(response, ['Accept-Encoding'])
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        return response
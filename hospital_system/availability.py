@@ -0,0 +1,701 @@
+"""
+Slot availability engine.
+
+Times of day are bits: bit ``i`` of a day's mask stands for the time
+``i * SLOT_UNIT_MINUTES`` minutes after midnight. The hours a doctor works
+and the slot starts their schedule offers come precomputed in a
+``DoctorSchedule`` (masks per weekday and per exception date, see
+``schedules.py``). Bookings are intervals, since appointments carry their own
+length: each doctor's booked days are ``DayBookings``, sorted intervals that
+answer "does [start, end) overlap a booking" with one binary search and also
+keep an occupied-units bitset. Short-lived slot holds (``SlotHold``, see
+``holds.py``) occupy time exactly like bookings until they expire. Grids are
+loaded with a single query per doctor the first time they are needed and are
+then kept in step with ``Appointment`` and ``SlotHold`` saves and deletes
+through the signal handlers in ``signals.py``; holds drop out of a loaded grid
+on their own when their time is up. Answering "which start times fit an appointment this long"
+or "which stretches of the day are free" is then a few bit operations
+instead of a query per request.
+"""
+import heapq
+import threading
+import time as _time
+from bisect import bisect_left, bisect_right
+from datetime import date as _date, datetime, time as _time_of_day, timedelta
+
+from django.conf import settings
+
+from .refdata import aget_doctor_schedule, get_doctor_schedule, get_doctor_schedules
+
+
+# Slots start and end on multiples of this many minutes
+SLOT_UNIT_MINUTES = 5
+UNITS_PER_DAY = 24 * 60 // SLOT_UNIT_MINUTES
+
+# The hours every doctor was bookable before per-doctor schedules: 30-minute
+# slots from 9 AM to 5 PM, Monday to Saturday. Schedules fall back to them
+# when a doctor's availability text cannot be read.
+DEFAULT_SLOT_MINUTES = 30
+DEFAULT_WEEKDAYS = (0, 1, 2, 3, 4, 5)
+DEFAULT_HOURS = (_time_of_day(9), _time_of_day(17))
+
+SLOT_TIMES = tuple(
+    f"{hour:02d}:{minute:02d}"
+    for hour in range(DEFAULT_HOURS[0].hour, DEFAULT_HOURS[1].hour)
+    for minute in range(0, 60, DEFAULT_SLOT_MINUTES)
+)
+
+_LABELS = tuple(
+    f"{unit * SLOT_UNIT_MINUTES // 60:02d}:{unit * SLOT_UNIT_MINUTES % 60:02d}"
+    for unit in range(UNITS_PER_DAY)
+)
+
+# Status values that occupy a slot
+BLOCKING_STATUSES = ('scheduled',)
+
+
+def schedule_label(doctor_id):
+    """Version label bumped whenever a doctor's booked or offered slots change"""
+    return f'hospital_system.appointment.doctor.{doctor_id}'
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, _date):
+        return value
+    return _date.fromisoformat(str(value))
+
+
+def _minutes(value):
+    """Minutes after midnight of a time value (time object or 'HH:MM' string)"""
+    if isinstance(value, _time_of_day):
+        return value.hour * 60 + value.minute
+    hours, minutes = str(value)[:5].split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def time_label(minutes):
+    """'HH:MM' for minutes after midnight; the end of the day is '24:00'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def interval(value, minutes):
+    """(start, end) minutes after midnight of ``minutes`` starting at ``value``"""
+    start = _minutes(value)
+    return start, start + minutes
+
+
+def _as_units(minutes):
+    """Slot units needed to hold ``minutes``, rounded up"""
+    return max(1, -(-int(minutes) // SLOT_UNIT_MINUTES))
+
+
+def slot_bit(value):
+    """Bit for a time value, or 0 when the time is not on the slot grid"""
+    try:
+        minutes = _minutes(value)
+    except ValueError:
+        return 0
+    if minutes % SLOT_UNIT_MINUTES or not 0 <= minutes < 24 * 60:
+        return 0
+    return 1 << minutes // SLOT_UNIT_MINUTES
+
+
+def span_bits(start, end):
+    """Bits of every slot unit that [start, end) minutes touches"""
+    first = start // SLOT_UNIT_MINUTES
+    last = -(-end // SLOT_UNIT_MINUTES)
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def mask_to_times(mask):
+    """Expand a bitset of slot starts into the list of 'HH:MM' labels"""
+    times = []
+    while mask:
+        low = mask & -mask
+        times.append(_LABELS[low.bit_length() - 1])
+        mask ^= low
+    return times
+
+
+def mask_to_spans(mask):
+    """(start, end) minutes of each run of set bits in ``mask``"""
+    spans = []
+    while mask:
+        low = mask & -mask
+        # Adding the lowest bit carries through the run to the bit after it
+        carry = mask + low
+        high = carry & -carry
+        spans.append(((low.bit_length() - 1) * SLOT_UNIT_MINUTES, (high.bit_length() - 1) * SLOT_UNIT_MINUTES))
+        mask &= carry
+    return spans
+
+
+def _runs(mask, units):
+    """Bits of ``mask`` that start ``units`` consecutive set bits"""
+    length = 1
+    while length < units:
+        step = min(length, units - length)
+        mask &= mask >> step
+        length += step
+    return mask
+
+
+class DayBookings:
+    """One doctor's booked intervals on one day, in minutes after midnight
+
+    Intervals are sorted by start, and ``reach[i]`` is the latest end among
+    the first ``i + 1`` of them, so whether [start, end) overlaps a booking
+    is a single binary search however many bookings the day holds (and stays
+    right when old rows overlap each other). ``mask`` is the same bookings as
+    a bitset of occupied slot units, for the schedule's bit operations.
+    """
+    __slots__ = ('starts', 'ends', 'reach', 'mask')
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _ in intervals]
+        self.ends = [end for _, end in intervals]
+        self.reach = []
+        self._update_reach(0)
+        self._update_mask()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _update_reach(self, i):
+        """Recompute ``reach`` from entry ``i`` on, until it stops changing"""
+        latest = self.reach[i - 1] if i else -1
+        for j in range(i, len(self.ends)):
+            if self.ends[j] > latest:
+                latest = self.ends[j]
+            if j < len(self.reach):
+                if self.reach[j] == latest:
+                    return
+                self.reach[j] = latest
+            else:
+                self.reach.append(latest)
+
+    def _clear(self, start, end):
+        """Unset the units of a removed [start, end) that no other booking covers"""
+        self.mask &= ~span_bits(start, end)
+        low = start - start % SLOT_UNIT_MINUTES
+        high = -(-end // SLOT_UNIT_MINUTES) * SLOT_UNIT_MINUTES
+        # Bookings sharing those units start before ``high`` and end after ``low``
+        i = bisect_left(self.starts, high)
+        while i > 0 and self.reach[i - 1] > low:
+            i -= 1
+            if self.ends[i] > low:
+                self.mask |= span_bits(self.starts[i], self.ends[i])
+
+    def overlaps(self, start, end):
+        """Whether [start, end) overlaps any booking"""
+        # Bookings starting before ``end`` are the first i; one of them
+        # overlaps exactly when the latest of their ends is after ``start``
+        i = bisect_left(self.starts, end)
+        return i > 0 and self.reach[i - 1] > start
+
+    def add(self, start, end):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.reach.insert(i, max(self.reach[i - 1], end) if i else end)
+        # Later entries only change until one already reaches past ``end``
+        i += 1
+        while i < len(self.reach) and self.reach[i] < end:
+            self.reach[i] = end
+            i += 1
+        self.mask |= span_bits(start, end)
+
+    def remove(self, start, end):
+        """Drop one booking of [start, end); False if there is none"""
+        i = bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.ends[i] == end:
+                del self.starts[i]
+                del self.ends[i]
+                del self.reach[i]
+                self._update_reach(i)
+                self._clear(start, end)
+                return True
+            i += 1
+        return False
+
+    def _update_mask(self):
+        mask = 0
+        for start, end in zip(self.starts, self.ends):
+            mask |= span_bits(start, end)
+        self.mask = mask
+
+
+def day_bookings(rows):
+    """``{date: DayBookings}`` from (date, time, duration minutes) rows"""
+    intervals = {}
+    for day, value, minutes in rows:
+        intervals.setdefault(day, []).append(interval(value, minutes))
+    return {day: DayBookings(pairs) for day, pairs in intervals.items()}
+
+
+def occupied_rows(*fields, **filters):
+    """(*fields, date, time, minutes, hold token, hold expiry) of blocking
+    appointments and live holds matching ``filters``, as one UNION query
+
+    Appointment rows have no token or expiry.
+    """
+    from django.db.models import CharField, DateTimeField, Value
+    from django.utils import timezone
+    from .models import Appointment, SlotHold
+
+    columns = (*fields, 'appointment_date', 'appointment_time', 'duration_minutes')
+    appointments = Appointment.objects.filter(status__in=BLOCKING_STATUSES, **filters).order_by().values_list(
+        *columns, Value(None, output_field=CharField()), Value(None, output_field=DateTimeField()),
+    )
+    holds = SlotHold.objects.filter(expires_at__gt=timezone.now(), **filters).order_by().values_list(
+        *columns, 'token', 'expires_at',
+    )
+    return appointments.union(holds, all=True)
+
+
+def day_bookings_and_holds(rows):
+    """(``{date: DayBookings}``, ``{token: (date, start, end, expiry)}``) from
+    ``occupied_rows`` rows; held intervals are in the bookings too"""
+    intervals, holds = {}, {}
+    for day, value, minutes, token, expires_at in rows:
+        start, end = interval(value, minutes)
+        intervals.setdefault(day, []).append((start, end))
+        if token is not None:
+            holds[token] = (day, start, end, expires_at.timestamp())
+    return {day: DayBookings(pairs) for day, pairs in intervals.items()}, holds
+
+
+class DoctorSchedule:
+    """The hours a doctor works and the slot starts they offer, precomputed
+    per weekday and exception date
+
+    ``weekly`` maps a weekday (0 is Monday), and ``exceptions`` a date, to
+    (start, end) working windows as times. An exception date without windows
+    is a day off. Overlapping windows are merged, and slot starts are laid
+    every ``slot_minutes`` from the start of each window. Each day keeps
+    three bitsets: those starts, the working hours in slot units, and the
+    starts from which one ``slot_minutes`` slot fits in the hours. An
+    appointment of any length may start on any of the starts from which it
+    fits in the hours without overlapping a booking.
+    """
+    __slots__ = ('slot_units', 'weekly', 'exceptions')
+
+    def __init__(self, slot_minutes, weekly=None, exceptions=None):
+        self.slot_units = _as_units(slot_minutes)
+        weekly = weekly or {}
+        self.weekly = tuple(self._day(weekly.get(weekday, ())) for weekday in range(7))
+        self.exceptions = {day: self._day(windows) for day, windows in (exceptions or {}).items()}
+
+    @property
+    def slot_minutes(self):
+        return self.slot_units * SLOT_UNIT_MINUTES
+
+    def _day(self, windows):
+        """(slot starts, working hours, starts offered for one slot) bitsets"""
+        merged = []
+        for start, end in sorted((_minutes(start), _minutes(end)) for start, end in windows):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        starts = hours = 0
+        for start, end in merged:
+            first = -(-start // SLOT_UNIT_MINUTES)
+            last = end // SLOT_UNIT_MINUTES
+            if last <= first:
+                continue
+            hours |= ((1 << (last - first)) - 1) << first
+            for unit in range(first, last, self.slot_units):
+                starts |= 1 << unit
+        return starts, hours, starts & _runs(hours, self.slot_units)
+
+    def _masks(self, day):
+        masks = self.exceptions.get(day)
+        return self.weekly[day.weekday()] if masks is None else masks
+
+    def offered_mask(self, day):
+        return self._masks(day)[2]
+
+    def free_mask(self, day, occupied, minutes=None):
+        """Starts on ``day`` from which ``minutes`` (default one slot) fit in
+        the working hours clear of the ``occupied`` units"""
+        starts, hours, offered = self._masks(day)
+        units = self.slot_units if minutes is None else _as_units(minutes)
+        if not offered and units == self.slot_units:
+            return 0
+        if not occupied and units == self.slot_units:
+            return offered
+        return starts & _runs(hours & ~occupied, units)
+
+    def free_spans(self, day, occupied, minutes=None):
+        """(start, end) minutes of each free stretch of working time on
+        ``day`` at least ``minutes`` (default one slot) long"""
+        units = self.slot_units if minutes is None else _as_units(minutes)
+        return [
+            (start, end) for start, end in mask_to_spans(self._masks(day)[1] & ~occupied)
+            if end - start >= units * SLOT_UNIT_MINUTES
+        ]
+
+    def fits(self, day, start, minutes):
+        """Whether ``start`` is a slot start on ``day`` and [start, start +
+        minutes) lies within the working hours"""
+        if start % SLOT_UNIT_MINUTES:
+            return False
+        starts, hours, _ = self._masks(day)
+        span = span_bits(start, start + minutes)
+        return bool(starts >> start // SLOT_UNIT_MINUTES & 1) and hours & span == span
+
+
+class _DoctorGrid:
+    __slots__ = ('loaded_from', 'loaded_until', 'loaded_at', 'days', 'schedule', 'holds', 'expiry')
+
+    def __init__(self, loaded_from, loaded_at, loaded_until=None):
+        self.loaded_from = loaded_from
+        self.loaded_until = loaded_until
+        self.loaded_at = loaded_at
+        self.days = {}
+        self.schedule = None
+        # token -> (day, start, end) of live holds, and (expiry, token) heap
+        self.holds = {}
+        self.expiry = []
+
+    def add(self, day, start, end):
+        bookings = self.days.get(day)
+        if bookings is None:
+            bookings = self.days[day] = DayBookings()
+        bookings.add(start, end)
+
+    def remove(self, day, start, end):
+        bookings = self.days.get(day)
+        if bookings is not None:
+            bookings.remove(start, end)
+            if not bookings:
+                del self.days[day]
+
+    def hold(self, token, day, start, end, expires):
+        if token in self.holds:
+            return
+        self.holds[token] = (day, start, end)
+        heapq.heappush(self.expiry, (expires, token))
+        self.add(day, start, end)
+
+    def release_hold(self, token):
+        held = self.holds.pop(token, None)
+        if held is not None:
+            self.remove(*held)
+
+    def expire(self, now):
+        # Released holds stay in the heap until their time comes: popping
+        # them then is a no-op
+        expiry = self.expiry
+        while expiry and expiry[0][0] <= now:
+            self.release_hold(heapq.heappop(expiry)[1])
+
+    def occupied(self, day):
+        bookings = self.days.get(day)
+        return bookings.mask if bookings else 0
+
+    def free_mask(self, day, minutes=None):
+        return self.schedule.free_mask(day, self.occupied(day), minutes)
+
+    def free_gaps(self, day, minutes=None):
+        spans = self.schedule.free_spans(day, self.occupied(day), minutes)
+        return [(time_label(start), time_label(end)) for start, end in spans]
+
+    def covers(self, start, end):
+        if start < self.loaded_from:
+            return False
+        return self.loaded_until is None or end <= self.loaded_until
+
+
+class SlotIndex:
+    """In-process per-doctor, per-day index of booked intervals
+
+    Each doctor's grid also holds the ``DoctorSchedule`` it was loaded with,
+    so free slots need no further lookups until the grid expires. Lengths
+    are in minutes; left out, they default to the doctor's slot length.
+
+    A grid covers the dates from today (or the earliest day asked for) to
+    ``SLOT_INDEX_WINDOW_DAYS`` ahead (or the latest day asked for). ``_lock``
+    only guards the dict of grids; a missing grid is read from the database
+    under one of ``_doctor_locks``, chosen by doctor id, which the in-process
+    booking and hold updates of that doctor take too, so none of them can
+    slip in between the read and the grid's install.
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._grids = {}
+        self._lock = threading.RLock()
+        # Striped: a lock per doctor would grow with every doctor ever loaded
+        self._doctor_locks = [threading.RLock() for _ in range(64)]
+
+    @property
+    def ttl(self):
+        # Bounds staleness when another process books a slot (or edits the
+        # schedule) of a doctor this process has already loaded.
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'SLOT_INDEX_TTL', 60)
+
+    @property
+    def window_days(self):
+        return getattr(settings, 'SLOT_INDEX_WINDOW_DAYS', 60)
+
+    # Queries
+    def booked_mask(self, doctor_id, day):
+        """Bitset of the slot units booked on ``day``"""
+        day = _as_date(day)
+        return self._grid(doctor_id, day).occupied(day)
+
+    def free_mask(self, doctor_id, day, minutes=None):
+        day = _as_date(day)
+        return self._grid(doctor_id, day).free_mask(day, minutes)
+
+    def free_slots(self, doctor_id, day, minutes=None):
+        """Free 'HH:MM' start times for a doctor on one day"""
+        return mask_to_times(self.free_mask(doctor_id, day, minutes))
+
+    def free_gaps(self, doctor_id, day, minutes=None):
+        """('HH:MM', 'HH:MM') stretches of free working time at least ``minutes`` long"""
+        day = _as_date(day)
+        return self._grid(doctor_id, day).free_gaps(day, minutes)
+
+    def free_masks_range(self, doctor_id, start, end, minutes=None):
+        """Map each day in [start, end] to its bitset of free start times"""
+        start, end = _as_date(start), _as_date(end)
+        grid = self._grid(doctor_id, start, end)
+        result = {}
+        day = start
+        while day <= end:
+            result[day] = grid.free_mask(day, minutes)
+            day += timedelta(days=1)
+        return result
+
+    def free_slots_range(self, doctor_id, start, end, minutes=None):
+        """Map each day in [start, end] to its list of free 'HH:MM' start times"""
+        return {
+            day: mask_to_times(mask)
+            for day, mask in self.free_masks_range(doctor_id, start, end, minutes).items()
+        }
+
+    async def afree_slots(self, doctor_id, day, minutes=None):
+        """Async free_slots: answers from memory, loads a missing grid with the async ORM"""
+        day = _as_date(day)
+        grid = await self._agrid(doctor_id, day)
+        return mask_to_times(grid.free_mask(day, minutes))
+
+    async def afree_gaps(self, doctor_id, day, minutes=None):
+        day = _as_date(day)
+        grid = await self._agrid(doctor_id, day)
+        return grid.free_gaps(day, minutes)
+
+    def is_free(self, doctor_id, day, value, minutes=None, hold=None):
+        """Whether an appointment of ``minutes`` can start at ``value``: on the
+        doctor's slot grid, within working hours and overlapping no booking
+
+        ``hold`` is the caller's own hold token: the time it holds does not
+        count against the caller.
+        """
+        day = _as_date(day)
+        grid = self._grid(doctor_id, day)
+        start, end = interval(value, minutes or grid.schedule.slot_minutes)
+        if not grid.schedule.fits(day, start, end - start):
+            return False
+        bookings = grid.days.get(day)
+        if not (bookings and bookings.overlaps(start, end)):
+            return True
+        held = grid.holds.get(hold) if hold else None
+        if held is None or held[0] != day:
+            return False
+        # Rare (a patient moving their hold): scan the day without it
+        return not any(
+            booked_start < end and start < booked_end
+            for booked_start, booked_end in zip(bookings.starts, bookings.ends)
+            if (booked_start, booked_end) != held[1:]
+        )
+
+    # Maintenance
+    def book(self, doctor_id, day, value, minutes=DEFAULT_SLOT_MINUTES):
+        self._apply(doctor_id, day, value, minutes, True)
+
+    def release(self, doctor_id, day, value, minutes=DEFAULT_SLOT_MINUTES):
+        self._apply(doctor_id, day, value, minutes, False)
+
+    def hold(self, doctor_id, token, day, value, minutes, expires_at):
+        """Treat [value, value + minutes) as booked until ``expires_at``"""
+        if doctor_id is None or not minutes:
+            return
+        day = _as_date(day)
+        start, end = interval(value, minutes)
+        with self._doctor_lock(doctor_id), self._lock:
+            grid = self._grids.get(int(doctor_id))
+            if grid is not None and grid.covers(day, day):
+                grid.hold(token, day, start, end, expires_at.timestamp())
+
+    def release_hold(self, doctor_id, token):
+        if doctor_id is None:
+            return
+        with self._doctor_lock(doctor_id), self._lock:
+            grid = self._grids.get(int(doctor_id))
+            if grid is not None:
+                grid.release_hold(token)
+
+    def prime(self, doctor_id, loaded_from, days, schedule, loaded_until=None, holds=None):
+        """Install a grid built elsewhere (e.g. from one grouped query)
+
+        ``days`` maps dates in [loaded_from, loaded_until] to ``DayBookings``
+        (see ``day_bookings``); ``loaded_until=None`` means every later date
+        was read too. ``schedule`` is the doctor's ``DoctorSchedule``.
+        ``holds`` maps hold tokens to (date, start, end, expiry timestamp) of
+        intervals in ``days`` that are only held (see
+        ``day_bookings_and_holds``).
+        """
+        if loaded_until is not None:
+            loaded_until = _as_date(loaded_until)
+        grid = _DoctorGrid(_as_date(loaded_from), _time.monotonic(), loaded_until)
+        grid.days = {day: bookings for day, bookings in days.items() if bookings}
+        grid.schedule = schedule
+        self._install_holds(grid, holds)
+        with self._lock:
+            self._grids[int(doctor_id)] = grid
+
+    def invalidate(self, doctor_id=None):
+        """Drop loaded grids so they are rebuilt from the database on next use"""
+        with self._lock:
+            if doctor_id is None:
+                self._grids.clear()
+            else:
+                self._grids.pop(int(doctor_id), None)
+
+    def _apply(self, doctor_id, day, value, minutes, booked):
+        if doctor_id is None or not minutes:
+            return
+        day = _as_date(day)
+        start, end = interval(value, minutes)
+        with self._doctor_lock(doctor_id), self._lock:
+            grid = self._grids.get(int(doctor_id))
+            # Grids that were never loaded (or that don't reach back to this
+            # day) pick the change up from the database when they are.
+            if grid is None or not grid.covers(day, day):
+                return
+            if booked:
+                grid.add(day, start, end)
+            else:
+                grid.remove(day, start, end)
+
+    @staticmethod
+    def _install_holds(grid, holds):
+        for token, (day, start, end, expires) in (holds or {}).items():
+            grid.holds[token] = (day, start, end)
+            grid.expiry.append((expires, token))
+        heapq.heapify(grid.expiry)
+
+    def _load(self, grid, rows):
+        grid.days, holds = day_bookings_and_holds(rows)
+        self._install_holds(grid, holds)
+
+    def _fresh(self, doctor_id, day, until, now):
+        grid = self._grids.get(doctor_id)
+        if grid is not None and now - grid.loaded_at < self.ttl and grid.covers(day, until or day):
+            if grid.expiry:
+                grid.expire(_time.time())
+            return grid
+        return None
+
+    def _doctor_lock(self, doctor_id):
+        return self._doctor_locks[int(doctor_id) % len(self._doctor_locks)]
+
+    def _window(self, doctor_id, day, until):
+        """Dates a new grid for ``doctor_id`` reads: the request's, and the old grid's"""
+        today = _date.today()
+        loaded_from = min(day, today)
+        loaded_until = max(until or day, today + timedelta(days=self.window_days))
+        grid = self._grids.get(doctor_id)
+        if grid is not None:
+            loaded_from = min(loaded_from, grid.loaded_from)
+            if grid.loaded_until is not None:
+                loaded_until = max(loaded_until, grid.loaded_until)
+        return loaded_from, loaded_until
+
+    def _grid(self, doctor_id, day, until=None):
+        doctor_id = int(doctor_id)
+        with self._lock:
+            grid = self._fresh(doctor_id, day, until, _time.monotonic())
+            if grid is not None:
+                return grid
+        with self._doctor_lock(doctor_id):
+            with self._lock:
+                # Loaded by another thread while this one waited
+                grid = self._fresh(doctor_id, day, until, _time.monotonic())
+                if grid is not None:
+                    return grid
+                loaded_from, loaded_until = self._window(doctor_id, day, until)
+            grid = _DoctorGrid(loaded_from, _time.monotonic(), loaded_until)
+            self._load(grid, self._rows(doctor_id, loaded_from, loaded_until))
+            grid.schedule = get_doctor_schedule(doctor_id)
+            with self._lock:
+                self._grids[doctor_id] = grid
+            return grid
+
+    async def _agrid(self, doctor_id, day):
+        doctor_id = int(doctor_id)
+        now = _time.monotonic()
+        with self._lock:
+            grid = self._fresh(doctor_id, day, None, now)
+            if grid is not None:
+                return grid
+            loaded_from, loaded_until = self._window(doctor_id, day, None)
+        # No lock can be held across the await: a booking saved in this
+        # process while the grid loads can be missed until the grid expires
+        # (ttl), exactly like a booking made by another process.
+        grid = _DoctorGrid(loaded_from, now, loaded_until)
+        self._load(grid, [row async for row in self._rows(doctor_id, loaded_from, loaded_until)])
+        grid.schedule = await aget_doctor_schedule(doctor_id)
+        with self._lock:
+            self._grids[doctor_id] = grid
+        return grid
+
+    @staticmethod
+    def _rows(doctor_id, loaded_from, loaded_until):
+        return occupied_rows(doctor_id=doctor_id, appointment_date__range=(loaded_from, loaded_until))
+
+
+slot_index = SlotIndex()
+
+
+def availability_matrix(doctor_ids, dates, minutes=None):
+    """Free start-time bitsets for several doctors over a set of dates
+
+    Returns ``{doctor_id: [free_mask, ...]}`` with one mask per entry of
+    ``dates``, for appointments of ``minutes`` (default each doctor's slot
+    length). All doctors are read with one query over ``Appointment`` and
+    ``SlotHold`` (and their schedules with three, when not cached), and the
+    resulting grids are installed in ``slot_index`` for later lookups.
+    """
+    doctor_ids = [int(d) for d in doctor_ids]
+    dates = [_as_date(d) for d in dates]
+    if not doctor_ids or not dates:
+        return {doctor_id: [] for doctor_id in doctor_ids}
+
+    start, end = min(dates), max(dates)
+    schedules = get_doctor_schedules(doctor_ids)
+    rows = {doctor_id: [] for doctor_id in doctor_ids}
+    for doctor_id, *row in occupied_rows(
+        'doctor_id', doctor_id__in=doctor_ids, appointment_date__range=(start, end),
+    ):
+        rows[doctor_id].append(row)
+
+    matrix = {}
+    for doctor_id, doctor_rows in rows.items():
+        schedule = schedules[doctor_id]
+        days, holds = day_bookings_and_holds(doctor_rows)
+        slot_index.prime(doctor_id, start, days, schedule, loaded_until=end, holds=holds)
+        matrix[doctor_id] = [
+            schedule.free_mask(day, days[day].mask if day in days else 0, minutes) for day in dates
+        ]
+    return matrix
@@ -0,0 +1,124 @@
+"""
+Overlap-free booking.
+
+The (doctor, date, time) unique constraint only stops two appointments from
+starting at the same moment. Appointments have lengths, so a one-hour visit
+at 9:00 and a half-hour one at 9:30 collide without sharing a start time.
+Every write that leaves an appointment blocking its doctor's time therefore
+checks the doctor's day first, in the same transaction as the write:
+``Appointment.save()`` through ``overlap_checked``, and the bulk import and
+the admin's status action through ``lock_doctors`` and ``booked_intervals``.
+The doctor's row is locked before the day's bookings are read, so two
+concurrent bookings of one doctor run one after the other and the second
+sees the first.
+
+SQLite has no row locks. ``lock_doctors`` writes to the doctor rows instead,
+which takes the database's write lock up front: concurrent bookings queue on
+``busy_timeout`` (see ``dbtuning.py``) rather than both reading the day
+before either writes.
+
+Live slot holds (see ``holds.py``) count as bookings here: an appointment
+cannot take time someone else is holding.
+"""
+from contextlib import contextmanager
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+
+from .availability import BLOCKING_STATUSES, DayBookings, interval, time_label
+
+
+# Fields whose change can make an appointment overlap another
+SLOT_FIELDS = ('status', 'doctor_id', 'appointment_date', 'appointment_time', 'duration_minutes')
+_UPDATE_FIELDS = frozenset(SLOT_FIELDS) | {'doctor'}
+
+
+class SlotUnavailable(IntegrityError):
+    """The appointment would overlap another blocking appointment of its doctor"""
+
+
+def lock_doctors(doctor_ids, using='default'):
+    """Hold off other bookings of ``doctor_ids`` until the transaction ends"""
+    from .models import Doctor
+
+    doctor_ids = sorted({int(doctor_id) for doctor_id in doctor_ids})
+    if not doctor_ids:
+        return
+    doctors = Doctor.objects.using(using).filter(pk__in=doctor_ids)
+    if connections[using].features.has_select_for_update:
+        # In id order, so two transactions locking overlapping sets cannot deadlock
+        list(doctors.order_by('pk').select_for_update().values_list('pk', flat=True))
+    else:
+        doctors.update(slot_minutes=F('slot_minutes'))
+
+
+def booked_intervals(doctor_id, day, exclude=None, using='default', exclude_hold=None):
+    """``DayBookings`` of the doctor's blocking appointments and live holds on
+    ``day``, leaving out appointment ``exclude`` and hold ``exclude_hold``"""
+    from django.utils import timezone
+    from .models import Appointment, SlotHold
+
+    rows = Appointment.objects.using(using).filter(
+        doctor_id=doctor_id, appointment_date=day, status__in=BLOCKING_STATUSES,
+    )
+    if exclude is not None:
+        rows = rows.exclude(pk=exclude)
+    holds = SlotHold.objects.using(using).filter(
+        doctor_id=doctor_id, appointment_date=day, expires_at__gt=timezone.now(),
+    )
+    if exclude_hold is not None:
+        holds = holds.exclude(token=exclude_hold)
+    columns = ('appointment_time', 'duration_minutes')
+    return DayBookings(
+        interval(value, minutes)
+        for value, minutes in rows.order_by().values_list(*columns).union(
+            holds.order_by().values_list(*columns), all=True,
+        )
+    )
+
+
+def needs_overlap_check(appointment, update_fields=None):
+    """Whether saving ``appointment`` could make it overlap another booking"""
+    if update_fields is not None and not _UPDATE_FIELDS.intersection(update_fields):
+        return False
+    # Deferred fields would each cost a query to read
+    if any(field not in appointment.__dict__ for field in SLOT_FIELDS):
+        return False
+    if appointment.status not in BLOCKING_STATUSES:
+        return False
+    if not (appointment.doctor_id and appointment.appointment_date and appointment.appointment_time):
+        return False
+    # Unchanged since it was loaded (signals.py remembers the slot)
+    saved = getattr(appointment, '_saved_slot_key', None)
+    return saved != (
+        appointment.doctor_id, appointment.appointment_date, appointment.appointment_time,
+        appointment.duration_minutes,
+    )
+
+
+def overlaps_booking(appointment, using='default'):
+    start, end = interval(appointment.appointment_time, appointment.duration_minutes)
+    bookings = booked_intervals(appointment.doctor_id, appointment.appointment_date, appointment.pk, using)
+    return bookings.overlaps(start, end)
+
+
+def check_available(appointment, using='default'):
+    """Raise SlotUnavailable if ``appointment`` overlaps a booking of its doctor"""
+    if overlaps_booking(appointment, using):
+        start, end = interval(appointment.appointment_time, appointment.duration_minutes)
+        raise SlotUnavailable(
+            f'{appointment.appointment_date} {time_label(start)}-{time_label(end)} overlaps another '
+            f'appointment of doctor {appointment.doctor_id}'
+        )
+
+
+@contextmanager
+def overlap_checked(appointment, using='default', update_fields=None):
+    """Run the save in the block after locking the doctor and checking the day"""
+    if not needs_overlap_check(appointment, update_fields):
+        yield
+        return
+    with transaction.atomic(using=using):
+        lock_doctors([appointment.doctor_id], using)
+        check_available(appointment, using)
+        yield
@@ -0,0 +1,20 @@
+"""
+System checks for deployment settings the caching layers depend on.
+"""
+from django.core.checks import Tags, Warning, register
+
+from .refdata import cache_is_shared
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [Warning(
+        "CACHES['default'] is local to each process.",
+        hint='Reference-data versions and other invalidations are not seen by the other worker '
+             'processes, so they keep serving data an admin has changed, and the full-page and '
+             'identity caches are turned off. Only run a single process, or use the default database cache or '
+             'DJANGO_CACHE_URL (see settings.py).',
+        id='hospital_system.W001',
+    )]
@@ -0,0 +1,388 @@
+"""
+Deterministic synthetic data for load testing (``seed_data --doctors ...``).
+
+Every generated row is a pure function of ``(seed, index)``: fields come from
+a 64-bit hash of the row number rather than from a shared random stream, so a
+patient's name, email and phone can be recomputed for any appointment without
+keeping patients in memory, and the same arguments always produce the same
+dataset. The ``*_rows`` functions yield one tuple of ``*_FIELDS`` values per
+row, already in database form, and ``insert_rows`` writes a chunk of them with
+a single ``executemany``: at millions of rows, building model instances and
+letting ``bulk_create`` prepare every value costs several times more than the
+database work itself.
+
+Appointments are generated doctor by doctor in (date, time) order, each doctor
+taking a skewed share of the total and distinct slot starts among those its
+shifts offer over the booking days, one slot long. So no two of a doctor's
+appointments overlap, every one is a time the booking form could have
+offered, and inserts stay close to append-only on the
+``(doctor, appointment_date, appointment_time)`` index.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import time, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.utils import timezone
+
+from .availability import DoctorSchedule, mask_to_times
+from .schedules import shifts_from_availability
+
+
+FIRST_NAMES = [
+    'Aarav', 'Priya', 'Rahul', 'Sneha', 'Vikram', 'Anita', 'Karan', 'Meera', 'Arjun', 'Divya',
+    'Rohan', 'Kavya', 'Aditya', 'Pooja', 'Siddharth', 'Neha', 'Manish', 'Lakshmi', 'Harsh', 'Isha',
+    'Nikhil', 'Ananya', 'Suresh', 'Ritu', 'Gaurav', 'Shreya', 'Amit', 'Nisha', 'Varun', 'Tanvi',
+]
+LAST_NAMES = [
+    'Sharma', 'Patel', 'Rao', 'Iyer', 'Gupta', 'Reddy', 'Nair', 'Mehta', 'Singh', 'Das',
+    'Joshi', 'Kulkarni', 'Banerjee', 'Menon', 'Chopra', 'Desai', 'Pillai', 'Shah', 'Verma', 'Bose',
+]
+QUALIFICATIONS = ['MBBS', 'MBBS, MD', 'MBBS, MD', 'MBBS, MS', 'MBBS, DM', 'MBBS, MCh', 'MBBS, DNB']
+AVAILABILITY = ['Monday to Saturday', 'Mon-Fri, 10:00-16:00', 'Mon, Wed, Fri', 'Tue, Thu, Sat', 'Mon-Sat, 09:00-13:00']
+# Most doctors keep the default half hour
+SLOT_LENGTHS = [30, 30, 30, 30, 15, 20, 45, 60]
+FOCUS_AREAS = [
+    'minimally invasive procedures', 'preventive care', 'chronic disease management', 'critical care',
+    'paediatric cases', 'geriatric care', 'diagnostic imaging', 'robotic surgery', 'sports injuries',
+    'transplant care', 'rehabilitation', 'second opinions',
+]
+# Roughly the population frequency of each group
+BLOOD_GROUPS = ['O+'] * 37 + ['B+'] * 32 + ['A+'] * 22 + ['AB+'] * 6 + ['O-', 'B-', 'A-']
+CITIES = ['Ahmedabad', 'Surat', 'Vadodara', 'Rajkot', 'Gandhinagar', 'Mumbai', 'Pune', 'Jaipur']
+REASONS = [
+    'Routine check-up', 'Follow-up visit', 'Chest pain', 'Persistent headache', 'Back pain',
+    'Fever and cough', 'Review of test results', 'Joint pain', 'Abdominal pain', 'Breathlessness',
+    'Pre-operative assessment', 'Post-operative review', 'Medication review', 'Second opinion',
+]
+MESSAGES = {
+    5: ['Excellent care and friendly staff.', 'The doctor explained everything clearly. Highly recommended.',
+        'Very smooth experience from booking to consultation.'],
+    4: ['Good consultation, though the wait was a little long.', 'Knowledgeable doctor and helpful staff.',
+        'Satisfied with the treatment overall.'],
+    3: ['Treatment was fine but the process felt rushed.', 'Average experience, long queue at the reception.'],
+    2: ['Waited over an hour past my appointment time.', 'The consultation felt too short for my problem.'],
+    1: ['Appointment was rescheduled twice without notice.', 'Not happy with how my concerns were handled.'],
+}
+
+PATIENT_FIELDS = ('name', 'email', 'phone', 'date_of_birth', 'gender', 'blood_group', 'address')
+DOCTOR_FIELDS = (
+    'name', 'email', 'phone', 'qualification', 'specialization', 'experience_years',
+    'consultation_fee', 'gender', 'availability', 'slot_minutes', 'bio', 'is_available',
+)
+SHIFT_FIELDS = ('doctor', 'weekday', 'start_time', 'end_time')
+APPOINTMENT_FIELDS = (
+    'patient', 'patient_name', 'patient_email', 'patient_phone', 'doctor', 'department',
+    'appointment_date', 'appointment_time', 'duration_minutes', 'reason', 'status',
+)
+TESTIMONIAL_FIELDS = ('patient_name', 'patient_message', 'rating', 'doctor', 'is_published')
+
+MASK64 = (1 << 64) - 1
+# Appointments end this many days after today, matching the booking window
+FUTURE_DAYS = 30
+
+
+def mix(seed, index, stream=0):
+    """64-bit hash of a row number (splitmix64 finaliser)"""
+    z = (seed * 0x9E3779B97F4A7C15 + index * 0xBF58476D1CE4E5B9 + stream * 0x94D049BB133111EB) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def _pick(options, h):
+    return options[h % len(options)]
+
+
+def _fraction(h):
+    """Uniform float in [0, 1) from the low 53 bits of a hash"""
+    return (h & ((1 << 53) - 1)) / (1 << 53)
+
+
+# Patients
+def patient_fields(seed, index):
+    """Contact fields of generated patient ``index`` (also used on appointments)"""
+    h = mix(seed, index, 1)
+    first, last = _pick(FIRST_NAMES, h), _pick(LAST_NAMES, h >> 8)
+    return {
+        'name': f'{first} {last}',
+        'email': f'{first.lower()}.{last.lower()}.{index}@example.com',
+        'phone': f'9{(h >> 16) % 10 ** 9:09d}',
+    }
+
+
+def patient_rows(seed, count, today):
+    for index in range(count):
+        h = mix(seed, index, 2)
+        contact = patient_fields(seed, index)
+        yield (
+            contact['name'], contact['email'], contact['phone'],
+            (today - timedelta(days=365 + h % (85 * 365))).isoformat(),
+            'MF'[(h >> 20) & 1],
+            _pick(BLOOD_GROUPS, h >> 24),
+            f'{1 + (h >> 32) % 400}, Sector {1 + (h >> 40) % 30}, {_pick(CITIES, h >> 48)}',
+        )
+
+
+# Doctors
+def doctor_hours(seed, index):
+    """(availability text, slot minutes) of generated doctor ``index``"""
+    return _pick(AVAILABILITY, mix(seed, index, 3) >> 54), _pick(SLOT_LENGTHS, mix(seed, index, 8))
+
+
+def doctor_rows(seed, count, departments):
+    """``departments`` is a list of (pk, name) pairs"""
+    for index in range(count):
+        h = mix(seed, index, 3)
+        first, last = _pick(FIRST_NAMES, h), _pick(LAST_NAMES, h >> 8)
+        department_id, department_name = _pick(departments, h >> 16)
+        experience = 1 + (h >> 24) % 35
+        qualification = _pick(QUALIFICATIONS, h >> 32)
+        availability, slot_minutes = doctor_hours(seed, index)
+        yield (
+            f'Dr. {first} {last}',
+            f'dr.{first.lower()}.{last.lower()}.{index}@example.com',
+            f'8{(h >> 36) % 10 ** 9:09d}',
+            qualification,
+            department_id,
+            experience,
+            # Fees grow with seniority, in steps of 50
+            str(Decimal(300 + 50 * (experience // 3 + (h >> 44) % 8))),
+            'MF'[(h >> 52) & 1],
+            availability,
+            slot_minutes,
+            f'{qualification} with {experience} years in {department_name}, '
+            f'with a focus on {_pick(FOCUS_AREAS, h >> 58)}.',
+            (h >> 60) % 20 != 0,
+        )
+
+
+def shift_rows(doctors):
+    """Weekly shifts read from each doctor's availability text
+
+    ``doctors`` is a sequence of (pk, availability) pairs.
+    """
+    for doctor_id, availability in doctors:
+        for weekday, start, end in shifts_from_availability(availability):
+            yield doctor_id, weekday, start.isoformat(), end.isoformat()
+
+
+def _doctor_weight(seed, index):
+    """Relative booking demand of a doctor: a few are much busier than most"""
+    return 0.2 + _fraction(mix(seed, index, 4)) ** 3 * 4
+
+
+# Appointments
+def booking_days(today, days):
+    """The ``days`` most recent bookable dates up to FUTURE_DAYS ahead (no Sundays)"""
+    result = []
+    day = today + timedelta(days=FUTURE_DAYS)
+    while len(result) < days:
+        if day.weekday() != 6:
+            result.append(day)
+        day -= timedelta(days=1)
+    result.reverse()
+    return result
+
+
+def slot_cells(availability, slot_minutes, calendar):
+    """[(date, 'HH:MM:SS'), ...] of every slot start a doctor's shifts offer on ``calendar``
+
+    Cut the way the booking form cuts them (``DoctorSchedule``), in order.
+    """
+    weekly = defaultdict(list)
+    for weekday, start, end in shifts_from_availability(availability):
+        weekly[weekday].append((start, end))
+    schedule = DoctorSchedule(slot_minutes, weekly)
+    times, cells = {}, []
+    for day in calendar:
+        if day.weekday() not in times:
+            times[day.weekday()] = [
+                time.fromisoformat(label).isoformat() for label in mask_to_times(schedule.offered_mask(day))
+            ]
+        cells.extend((day, value) for value in times[day.weekday()])
+    return cells
+
+
+def appointment_capacity(seed, doctors, today, days):
+    """How many appointments ``doctors`` generated doctors have room for"""
+    calendar = booking_days(today, days)
+    sizes, total = {}, 0
+    for index in range(doctors):
+        hours = doctor_hours(seed, index)
+        if hours not in sizes:
+            sizes[hours] = len(slot_cells(*hours, calendar))
+        total += sizes[hours]
+    return total
+
+
+def appointment_quotas(seed, count, capacities):
+    """Yield each doctor's appointment count, skewed by demand and capped at its capacity
+
+    Two passes over hashed weights. Quotas follow the running share of the
+    total weight, so whatever a capped doctor cannot take falls to the doctors
+    after it and the counts always sum to ``count``.
+    """
+    total_weight = sum(_doctor_weight(seed, index) for index in range(len(capacities)))
+    assigned, weight_so_far = 0, 0.0
+    capacity_after = sum(capacities)
+    for index, cells in enumerate(capacities):
+        capacity_after -= cells
+        weight_so_far += _doctor_weight(seed, index)
+        remaining = count - assigned
+        quota = min(cells, remaining, max(0, round(count * weight_so_far / total_weight) - assigned))
+        # Never leave more than the doctors after this one can hold
+        quota = max(quota, remaining - capacity_after)
+        assigned += quota
+        yield quota
+
+
+def appointment_rows(seed, count, doctors, patients, today, days):
+    """Appointments for generated doctors
+
+    ``doctors`` is a sequence of (pk, department pk, availability text, slot
+    minutes) tuples and ``patients`` a sequence of patient pks (empty: guest
+    bookings). Each row's contact fields match the generated patient it
+    belongs to.
+    """
+    calendar = booking_days(today, days)
+    # Slot starts per distinct (availability, slot minutes): a handful in all
+    grids = {}
+    for _, _, availability, slot_minutes in doctors:
+        if (availability, slot_minutes) not in grids:
+            grids[availability, slot_minutes] = slot_cells(availability, slot_minutes, calendar)
+    capacities = [len(grids[availability, slot_minutes]) for _, _, availability, slot_minutes in doctors]
+    if count > sum(capacities):
+        raise ValueError(
+            f'{count} appointments do not fit the {sum(capacities)} slots {len(doctors)} doctors offer '
+            f'over {len(calendar)} days'
+        )
+    patient_count = len(patients) or max(1, count // 8)
+
+    number = 0
+    quotas = appointment_quotas(seed, count, capacities)
+    for index, ((doctor_id, department_id, availability, slot_minutes), quota) in enumerate(zip(doctors, quotas)):
+        if not quota:
+            continue
+        cells = grids[availability, slot_minutes]
+        # Distinct slot starts of this doctor, in calendar order
+        picks = _sample(mix(seed, index, 5), len(cells), quota)
+        for cell in picks:
+            h = mix(seed, number, 6)
+            day, value = cells[cell]
+            patient_index = h % patient_count
+            roll = (h >> 32) % 100
+            if day >= today:
+                status = 'cancelled' if roll < 8 else 'scheduled'
+            else:
+                status = 'cancelled' if roll < 8 else 'no-show' if roll < 14 else 'completed'
+            contact = patient_fields(seed, patient_index)
+            yield (
+                patients[patient_index] if patients else None,
+                contact['name'], contact['email'], contact['phone'],
+                doctor_id, department_id,
+                day.isoformat(), value, slot_minutes,
+                _pick(REASONS, h >> 40),
+                status,
+            )
+            number += 1
+
+
+def _sample(h, population, k):
+    """Sorted ``k`` distinct integers from ``range(population)``
+
+    Floyd's algorithm, seeded from ``h`` so a doctor's picks depend only on
+    the seed and its index.
+    """
+    chosen = set()
+    for j in range(population - k, population):
+        h = mix(h, j, 7)
+        t = h % (j + 1)
+        chosen.add(j if t in chosen else t)
+    return sorted(chosen)
+
+
+# Testimonials
+def testimonial_rows(seed, count, doctors, patient_count):
+    """Reviews of ``doctors`` (a sequence of pks) with J-shaped ratings
+
+    Each doctor has a hashed quality between 3.9 and 5.1 stars and ratings
+    scatter around it, plus a few percent of one- and two-star reviews from
+    visits that went wrong, so five stars is the most common rating, four
+    close behind and the middle of the scale is sparse, as on real review sites.
+    """
+    patient_count = max(1, patient_count)
+    for index in range(count):
+        h = mix(seed, index, 8)
+        doctor_index = h % len(doctors)
+        bad_visit = mix(seed, index, 12)
+        if bad_visit % 100 < 6:
+            rating = 1 + (bad_visit >> 8) % 2
+        else:
+            quality = 3.9 + 1.2 * _fraction(mix(seed, doctor_index, 9))
+            # Sum of two uniforms: triangular noise in [-1.2, 1.2)
+            noise = 1.2 * (_fraction(mix(seed, index, 10)) + _fraction(mix(seed, index, 11)) - 1)
+            rating = max(1, min(5, round(quality + noise)))
+        patient = patient_fields(seed, (h >> 24) % patient_count)
+        yield (
+            patient['name'],
+            _pick(MESSAGES[rating], h >> 48),
+            rating,
+            doctors[doctor_index],
+            # Moderators publish most good reviews and fewer of the bad ones
+            (h >> 56) % 10 < (9 if rating >= 3 else 4),
+        )
+
+
+# Writing
+def insert_rows(model, fields, rows):
+    """INSERT ``rows`` (tuples of ``fields`` values) with one executemany
+
+    Every other concrete column gets its default, prepared once per call, and
+    ``auto_now``/``auto_now_add`` timestamps are set to the current time.
+    """
+    now = timezone.now()
+    columns, constants = [], []
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        if field.name in fields:
+            continue
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            value = now
+        else:
+            value = field.get_default()
+        columns.append(field.column)
+        constants.append(field.get_db_prep_save(value, connection))
+    columns = [model._meta.get_field(name).column for name in fields] + columns
+    constants = tuple(constants)
+
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [row + constants for row in rows])
+
+
+@contextmanager
+def deferred_indexes(model):
+    """Drop ``model``'s Meta.indexes for the duration of a bulk load
+
+    Building an index once over the loaded table is far cheaper than keeping
+    it up to date through millions of inserts in random key order. Unique
+    constraints and foreign key indexes stay in place.
+    """
+    indexes = list(model._meta.indexes)
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(model, index)
@@ -0,0 +1,43 @@
+"""
+Database routing for the cache database.
+
+With the default ``DatabaseCache`` (see ``CACHES`` in settings.py) cache
+entries live in the ``cache`` database, a SQLite file of their own: every
+process on the host shares them, and cache writes never queue behind a
+booking holding the main database's write lock. Nothing else goes there.
+``create_cache_table`` runs after ``migrate``, so setting up the main
+database sets up the cache too.
+"""
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS
+
+
+CACHE_DATABASE = 'cache'
+
+# app_label of the models DatabaseCache reads and writes through
+_CACHE_APP_LABEL = 'django_cache'
+
+
+class CacheRouter:
+    """Send DatabaseCache queries to the cache database and nothing else"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == _CACHE_APP_LABEL:
+            return CACHE_DATABASE
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, **hints):
+        if app_label == _CACHE_APP_LABEL:
+            return db == CACHE_DATABASE
+        if db == CACHE_DATABASE:
+            return False
+        return None
+
+
+def create_cache_table(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate handler: create the cache table along with the main schema"""
+    if using == DEFAULT_DB_ALIAS and CACHE_DATABASE in settings.DATABASES:
+        call_command('createcachetable', database=CACHE_DATABASE, verbosity=0)
@@ -0,0 +1,46 @@
+"""
+SQLite connection tuning.
+
+``apply_sqlite_pragmas`` runs on Django's ``connection_created`` signal and
+issues ``settings.SQLITE_PRAGMAS`` on every new SQLite connection. With the
+defaults in settings.py the database runs in WAL mode, so readers no longer
+wait for a writer to commit and concurrent bookings queue on
+``busy_timeout`` instead of failing with "database is locked".
+"""
+from django.conf import settings
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def configure_connection(connection, pragmas):
+    """Apply ``pragmas`` to a DB-API connection (Django's or a raw sqlite3 one)"""
+    cursor = connection.cursor()
+    try:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+def current_pragmas(connection, names):
+    """Values of the given pragmas as seen by ``connection``"""
+    values = {}
+    cursor = connection.cursor()
+    try:
+        for name in names:
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    finally:
+        cursor.close()
+    return values
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if pragmas:
+        configure_connection(connection.connection, pragmas)
@@ -0,0 +1,145 @@
+"""
+Concurrent HTTP fetching for bulk image imports (``add_ai_images``).
+
+``Downloader`` runs a bounded thread pool with a per-host concurrency limit,
+reuses one ``requests.Session`` (keep-alive connections) per worker thread
+and retries connection errors, timeouts, 429 and 5xx responses with
+exponential backoff, honouring ``Retry-After``. Identical URLs are fetched
+once. ``Checkpoint`` persists which rows are done, and the content hash of
+every stored image, so an interrupted import resumes where it stopped and
+identical images are stored only once.
+"""
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+
+
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class FetchResult:
+    def __init__(self, url, content=None, status=None, error=None, attempts=0):
+        self.url = url
+        self.content = content
+        self.status = status
+        self.error = error
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.content is not None
+
+    @property
+    def digest(self):
+        return hashlib.sha256(self.content).hexdigest() if self.content is not None else None
+
+
+class Downloader:
+    def __init__(self, workers=8, per_host=4, retries=3, backoff=0.5, timeout=10):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self._host_limits = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._host_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _host_limit(self, url):
+        with self._host_lock:
+            return self._host_limits[urlsplit(url).netloc]
+
+    def _delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), 60.0)
+        # Full jitter keeps retrying workers from hitting the host in lockstep
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def fetch(self, url):
+        """GET ``url`` with retries; never raises"""
+        result = FetchResult(url)
+        for attempt in range(self.retries + 1):
+            result.attempts = attempt + 1
+            response = None
+            try:
+                with self._host_limit(url):
+                    response = self._session().get(url, timeout=self.timeout)
+                result.status = response.status_code
+                if response.status_code == 200:
+                    result.content = response.content
+                    result.error = None
+                    return result
+                result.error = f'HTTP {response.status_code}'
+                if response.status_code not in RETRY_STATUSES:
+                    return result
+            except requests.RequestException as e:
+                result.error = str(e) or e.__class__.__name__
+            if attempt < self.retries:
+                time.sleep(self._delay(attempt, response))
+        return result
+
+    def fetch_all(self, urls):
+        """Yield a FetchResult per distinct URL, in completion order"""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self.fetch, url) for url in dict.fromkeys(urls)]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+class Checkpoint:
+    """JSON record of finished rows and stored image hashes, saved atomically"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        self.failed = {}
+        self.stored = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.done = data.get('done', {})
+            self.failed = data.get('failed', {})
+            self.stored = data.get('stored', {})
+
+    def mark_done(self, key, name):
+        self.done[key] = name
+        self.failed.pop(key, None)
+
+    def mark_failed(self, key, error, status=None):
+        self.failed[key] = {'error': error, 'status': status}
+
+    def is_permanent_failure(self, key):
+        """True when the row's URL answered with an error retrying will not fix"""
+        status = self.failed.get(key, {}).get('status')
+        return status is not None and status not in RETRY_STATUSES
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'done': self.done, 'failed': self.failed, 'stored': self.stored}, f)
+        os.replace(temp_path, self.path)
+
+    def reset(self):
+        self.done, self.failed, self.stored = {}, {}, {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
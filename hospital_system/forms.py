@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.db import transaction
 from .models import Patient
 
 
@@ -28,16 +29,18 @@ class UserRegistrationForm(UserCreationForm):
         user = super().save(commit=False)
         user.email = self.cleaned_data['email']
         if commit:
-            user.save()
-            # Create associated Patient record
-            Patient.objects.create(
-                user=user,
-                name=f"{user.first_name} {user.last_name}",
-                email=user.email,
-                phone=self.cleaned_data.get('phone', ''),
-                date_of_birth=self.cleaned_data.get('date_of_birth'),
-                gender=self.cleaned_data.get('gender', ''),
-                blood_group=self.cleaned_data.get('blood_group', ''),
-                address=self.cleaned_data.get('address', ''),
-            )
+            # The user and its Patient record exist together or not at all
+            with transaction.atomic():
+                user.save()
+                # Create associated Patient record
+                Patient.objects.create(
+                    user=user,
+                    name=f"{user.first_name} {user.last_name}",
+                    email=user.email,
+                    phone=self.cleaned_data.get('phone', ''),
+                    date_of_birth=self.cleaned_data.get('date_of_birth'),
+                    gender=self.cleaned_data.get('gender', ''),
+                    blood_group=self.cleaned_data.get('blood_group', ''),
+                    address=self.cleaned_data.get('address', ''),
+                )
         return user
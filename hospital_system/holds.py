@@ -0,0 +1,113 @@
+"""
+Short-lived slot holds.
+
+Booking used to be one step: the form listed free times, and the submit found
+out whether the time was still free. On a busy doctor several patients pick
+the same time from the same list and all but one submit fails after the form
+has been filled in. Choosing a time now places a ``SlotHold`` on it right
+away, under the same doctor lock and overlap check as an appointment (see
+``bookings.py``). From then on the slot lookups treat the time as taken, so
+other patients stop being offered it, and the submit turns the hold into the
+appointment. A patient who loses the race finds out when choosing the time,
+before the form is filled in, with a fresh list of free times.
+
+Holds last ``SLOT_HOLD_SECONDS`` (default 180). Expired holds stop counting
+at once: reads skip them and loaded grids drop them on their own. Deleting
+their rows is housekeeping, done at most every ``SLOT_HOLD_SWEEP_INTERVAL``
+seconds (default 60) across processes when a hold is placed, and by the
+``sweep_slot_holds`` command.
+
+The hold endpoint needs no login, so one client could otherwise hold every
+free time of a department. A client (an address: a session is only a cookie
+the client can drop) keeps at most ``SLOT_HOLD_MAX_PER_CLIENT`` live holds
+(default 5); a booking form has one at a time.
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import interval, time_label
+from .bookings import SlotUnavailable, booked_intervals, lock_doctors
+
+
+SWEEP_KEY = 'slot-holds:sweep'
+
+
+class HoldLimitReached(Exception):
+    """The client already has SLOT_HOLD_MAX_PER_CLIENT live holds"""
+
+
+def hold_seconds():
+    return getattr(settings, 'SLOT_HOLD_SECONDS', 180)
+
+
+def place_hold(doctor_id, day, value, minutes, replace=None, client=''):
+    """Hold [value, value + minutes) of the doctor's ``day`` and return the ``SlotHold``
+
+    Raises SlotUnavailable when the time overlaps an appointment or another
+    live hold, and HoldLimitReached when ``client`` already has its share of
+    live holds (not counting ``replace``). ``replace`` is the token of a hold
+    the caller no longer needs (the time chosen before); it is released only
+    if the new hold is placed.
+    """
+    from .models import SlotHold
+
+    sweep_expired_holds()
+    start, end = interval(value, minutes)
+    with transaction.atomic():
+        lock_doctors([doctor_id])
+        if client:
+            live = SlotHold.objects.filter(client=client, expires_at__gt=timezone.now())
+            if replace:
+                live = live.exclude(token=replace)
+            if live.count() >= getattr(settings, 'SLOT_HOLD_MAX_PER_CLIENT', 5):
+                raise HoldLimitReached(f'{client} already holds {live.count()} times')
+        if booked_intervals(doctor_id, day, exclude_hold=replace).overlaps(start, end):
+            raise SlotUnavailable(f'{day} {time_label(start)}-{time_label(end)} is no longer free')
+        if replace:
+            release_hold(replace)
+        return SlotHold.objects.create(
+            token=secrets.token_urlsafe(16), doctor_id=doctor_id, appointment_date=day,
+            appointment_time=value, duration_minutes=minutes,
+            expires_at=timezone.now() + timedelta(seconds=hold_seconds()), client=client,
+        )
+
+
+def claim_hold(token, doctor_id):
+    """Delete the booking form's hold ``token`` on the doctor's time; whether there was one
+
+    Call it in the transaction that creates the appointment, so the time
+    passes from the hold to the appointment without a gap. The hold goes
+    whatever time it is on: the form may have changed the service (and so
+    the length) since, and the appointment's own overlap check decides.
+    """
+    from .models import SlotHold
+
+    lock_doctors([doctor_id])
+    deleted, _ = SlotHold.objects.filter(token=token, doctor_id=doctor_id).delete()
+    return bool(deleted)
+
+
+def release_hold(token):
+    from .models import SlotHold
+
+    SlotHold.objects.filter(token=token).delete()
+
+
+def sweep_expired_holds(force=False):
+    """Delete expired hold rows, at most once per sweep interval unless ``force``"""
+    from .models import SlotHold
+
+    if not force:
+        # A read first: with DatabaseCache, add() is a transaction and a
+        # failing INSERT on every hold placed between sweeps
+        if cache.get(SWEEP_KEY) is not None:
+            return 0
+        if not cache.add(SWEEP_KEY, 1, getattr(settings, 'SLOT_HOLD_SWEEP_INTERVAL', 60)):
+            return 0
+    deleted, _ = SlotHold.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,199 @@
+"""
+Idempotent form submissions.
+
+A slow ``book_appointment`` or ``register`` response makes people click
+again, and every extra click used to run the view again: a second booking
+attempt that fails with "already booked" although the first one succeeded,
+another password hash, another user creation that fails on the username.
+Forms now carry a random key (``{% idempotency_field %}``, or an
+``Idempotency-Key`` header for API clients), and views wrapped in
+``idempotent_post`` run once per key. The first POST with a key claims it by
+inserting an ``IdempotencyKey`` row, whose unique constraint lets exactly one
+request claim a key whichever process it lands on, and runs the view;
+``IdempotencyMiddleware`` stores the finished response on the row. Repeats
+within ``IDEMPOTENCY_KEY_TIMEOUT``
+seconds (default 3600) get that response back without running the view,
+cookies included, so a repeated registration ends up logged in as well. A
+repeat that arrives while the first is still running waits up to
+``IDEMPOTENCY_WAIT_SECONDS`` (default 10) for its result. A key reused with
+different form data is refused with 422.
+
+The middleware has to come before ``SessionMiddleware`` so the stored
+response carries the session cookie a login sets. Every render of a form
+gets a fresh key, so correcting a rejected form and submitting it again is a
+new request. Expired rows are deleted at most every
+``IDEMPOTENCY_SWEEP_INTERVAL`` seconds (default 300) as keys are claimed.
+"""
+import hashlib
+import pickle
+import secrets
+import time
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .querymetrics import not_recorded
+
+
+SWEEP_KEY = 'idempotency:sweep'
+FIELD_NAME = 'idempotency_key'
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+# Fields that may differ between two submissions of the same rendered form
+_VOLATILE_FIELDS = ('csrfmiddlewaretoken',)
+
+_POLL_SECONDS = 0.05
+
+
+def new_key():
+    return secrets.token_urlsafe(16)
+
+
+def request_key(request):
+    """The idempotency key a POST carries, or None"""
+    key = request.POST.get(FIELD_NAME) or request.META.get(HEADER)
+    return key[:128] if key else None
+
+
+def _row_key(view_name, key):
+    return hashlib.sha256(f'{view_name}:{key}'.encode()).hexdigest()
+
+
+def _fingerprint(request):
+    fields = sorted(
+        (name, value) for name, values in request.POST.lists() if name not in _VOLATILE_FIELDS
+        for value in values
+    )
+    return hashlib.sha256(repr((request.path, fields)).encode()).hexdigest()
+
+
+def _timeout():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TIMEOUT', 3600)
+
+
+def sweep_expired_keys(force=False):
+    """Delete expired key rows, at most once per sweep interval unless ``force``"""
+    from .models import IdempotencyKey
+
+    if not force and not cache.add(SWEEP_KEY, 1, getattr(settings, 'IDEMPOTENCY_SWEEP_INTERVAL', 300)):
+        return 0
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def _replay(entry, fingerprint):
+    if entry.fingerprint != fingerprint:
+        return HttpResponse('This form was already submitted with different data.', status=422)
+    response = pickle.loads(bytes(entry.response))
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(row_key, fingerprint):
+    """None once this request owns the key, else the response to answer with"""
+    from .models import IdempotencyKey
+
+    sweep_expired_keys()
+    while True:
+        try:
+            # Savepoint, so a lost race leaves any enclosing transaction usable
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=row_key, fingerprint=fingerprint,
+                    expires_at=timezone.now() + timedelta(seconds=_timeout()),
+                )
+            return None
+        except IntegrityError:
+            pass
+        # Polling repeats one query by design; it is not the view's N+1
+        with not_recorded():
+            response = _await_first(row_key, fingerprint)
+        if response is not None:
+            return response
+        # The first request failed (or its key expired) meanwhile: claim it again
+
+
+def _await_first(row_key, fingerprint):
+    """Response to a key another request claimed, or None once the key is free"""
+    from .models import IdempotencyKey
+
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10)
+    while True:
+        now = timezone.now()
+        entry = IdempotencyKey.objects.filter(key=row_key).first()
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=entry.pk, expires_at__lte=now).delete()
+            return None
+        if entry.response is not None or entry.fingerprint != fingerprint:
+            return _replay(entry, fingerprint)
+        # Still running: wait for its response
+        if time.monotonic() >= deadline:
+            return HttpResponse('This form is still being submitted. Please wait a moment.', status=409)
+        time.sleep(_POLL_SECONDS)
+
+
+def idempotent_post(view):
+    """Run ``view`` at most once per idempotency key; repeats get the first response
+
+    POSTs without a key run as before. Needs ``IdempotencyMiddleware``.
+    """
+    view_name = view.__name__
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request_key(request) if request.method == 'POST' else None
+        if key is None:
+            return view(request, *args, **kwargs)
+        row_key = _row_key(view_name, key)
+        response = _claim(row_key, _fingerprint(request))
+        if response is not None:
+            return response
+        request.idempotency_claim = row_key
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class IdempotencyMiddleware:
+    """Store the finished response of requests ``idempotent_post`` let through"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.store(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if getattr(request, 'idempotency_claim', None) is None:
+            return response
+        return await sync_to_async(self.store)(request, response)
+
+    def store(self, request, response):
+        from .models import IdempotencyKey
+
+        row_key = getattr(request, 'idempotency_claim', None)
+        if row_key is None:
+            return response
+        claimed = IdempotencyKey.objects.filter(key=row_key)
+        # A failed or streamed request leaves nothing to replay: the next try runs
+        if response.streaming or response.status_code >= 500:
+            claimed.delete()
+        else:
+            claimed.update(response=pickle.dumps(response))
+        return response
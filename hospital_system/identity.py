@@ -0,0 +1,64 @@
+"""
+Cached identity lookups.
+
+``AuthenticationMiddleware`` calls the auth backend's ``get_user()`` on every
+request that carries a session, and the patient pages then read
+``request.user.patient``: two queries before any real work. ``CachedModelBackend``
+answers ``get_user()`` from Django's cache with the user's Patient profile (or
+its absence) already attached, so both come from one cache read. With the
+default ``DatabaseCache`` that read is itself a query on the cache database:
+the lookups leave the main database, but only a memory cache (Redis,
+memcached) takes them off the request's query count. The signal
+handlers in ``signals.py`` drop a user's entry whenever the User or its
+Patient is saved or deleted; entries also expire after
+``IDENTITY_CACHE_TIMEOUT`` seconds (default 300), which covers changes made
+with ``update()``, which sends no signals.
+
+A dropped entry is only gone for every process if they share the cache. With
+a process-local ``CACHES['default']`` the others would keep the deactivated
+user, or the old password's sessions, logged in, so the backend then loads
+the user from the database like ``ModelBackend``.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .refdata import cache_is_shared
+
+
+KEY_PREFIX = 'identity:user'
+
+
+def _key(user_id):
+    return f'{KEY_PREFIX}:{user_id}'
+
+
+def identity_cache_enabled():
+    return getattr(settings, 'IDENTITY_CACHE_ENABLED', True) and cache_is_shared()
+
+
+def forget_user(user_id):
+    cache.delete(_key(user_id))
+
+
+def load_user(user_id):
+    """User ``user_id`` with its Patient profile joined in, or None"""
+    UserModel = get_user_model()
+    return UserModel._default_manager.select_related('patient').filter(pk=user_id).first()
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request ``get_user()`` is served from the cache"""
+
+    def get_user(self, user_id):
+        if not identity_cache_enabled():
+            return super().get_user(user_id)
+        key = _key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = load_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, getattr(settings, 'IDENTITY_CACHE_TIMEOUT', 300))
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,158 @@
+"""
+Resized and WebP derivatives of uploaded doctor and department images.
+
+When an image is uploaded (``pre_save`` in ``signals.py``) an oversized
+original is scaled down to ``IMAGE_MAX_DIMENSION`` and derivatives are written
+at each of ``DERIVATIVE_WIDTHS`` below the original width, plus the original
+width, in WebP and in a JPEG (or PNG, for images with transparency) fallback.
+Derivative names carry a hash of the image content, so they can be cached
+forever and a new upload never reuses an old URL. What was generated is
+recorded in the model's ``image_variants``, so rendering needs no storage
+access; ``manage.py build_image_derivatives`` backfills existing images.
+"""
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+DERIVATIVE_WIDTHS = (64, 128, 320, 640, 1024)
+DERIVATIVE_ROOT = 'derivatives'
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def max_dimension():
+    return getattr(settings, 'IMAGE_MAX_DIMENSION', 1600)
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def derivative_name(source_name, digest, width, extension):
+    folder = posixpath.dirname(source_name)
+    return posixpath.join(DERIVATIVE_ROOT, folder, f'{digest}-{width}w.{extension}')
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _encode(image, extension):
+    buffer = BytesIO()
+    if extension == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif extension == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _resized(image, width):
+    if width >= image.width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def _open(data):
+    image = Image.open(BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if _has_alpha(image) else 'RGB')
+    return image
+
+
+def downscale(data):
+    """``data`` re-encoded within IMAGE_MAX_DIMENSION, or None if already small enough"""
+    image = _open(data)
+    limit = max_dimension()
+    if max(image.size) <= limit:
+        return None
+    original_format = Image.open(BytesIO(data)).format
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    extension = 'png' if original_format == 'PNG' or _has_alpha(image) else 'jpg'
+    return _encode(image, extension)
+
+
+def build_derivatives(source_name, data, storage=default_storage):
+    """Write every derivative of ``data`` and return the ``image_variants`` record"""
+    image = _open(data)
+    digest = content_digest(data)
+    fallback = 'png' if _has_alpha(image) else 'jpg'
+    widths = [width for width in DERIVATIVE_WIDTHS if width < image.width] + [image.width]
+    for width in widths:
+        resized = _resized(image, width)
+        for extension in ('webp', fallback):
+            name = derivative_name(source_name, digest, width, extension)
+            # Content-addressed: an existing file already has these bytes
+            if not storage.exists(name):
+                storage.save(name, ContentFile(_encode(resized, extension)))
+    return {'name': source_name, 'digest': digest, 'widths': widths, 'fallback': fallback}
+
+
+def prepare_image(instance, field_name='image'):
+    """Downscale a new upload and refresh ``image_variants`` (pre_save hook)"""
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        instance.image_variants = {}
+        return
+    if field_file._committed and (instance.image_variants or {}).get('name') == field_file.name:
+        return
+
+    field_file.open('rb')
+    try:
+        data = field_file.read()
+    finally:
+        if field_file._committed:
+            field_file.close()
+    try:
+        if not field_file._committed:
+            # Store the upload ourselves (as FileField.pre_save would) so the
+            # final name is known and an oversized original is never written
+            data = downscale(data) or data
+            field_file.save(field_file.name, ContentFile(data), save=False)
+        instance.image_variants = build_derivatives(field_file.name, data, field_file.storage)
+    except (OSError, Image.DecompressionBombError):
+        # Not a readable image: keep serving the original as uploaded
+        if not field_file._committed:
+            field_file.save(field_file.name, ContentFile(data), save=False)
+        instance.image_variants = {}
+
+
+# Rendering
+def _urls(variants, extension, storage=default_storage):
+    return [
+        (storage.url(derivative_name(variants['name'], variants['digest'], width, extension)), width)
+        for width in variants['widths']
+    ]
+
+
+def srcset(variants, extension):
+    return ', '.join(f'{url} {width}w' for url, width in _urls(variants, extension))
+
+
+def image_url(obj, width, field_name='image'):
+    """URL of the smallest fallback derivative at least ``width`` wide
+
+    Falls back to the original upload when no derivatives exist yet, and to
+    '' when there is no image.
+    """
+    field_file = getattr(obj, field_name)
+    if not field_file:
+        return ''
+    variants = obj.image_variants or {}
+    if variants.get('name') != field_file.name or not variants.get('widths'):
+        return field_file.url
+    urls = _urls(variants, variants['fallback'])
+    for url, candidate in urls:
+        if candidate >= width:
+            return url
+    return urls[-1][0]
@@ -0,0 +1,220 @@
+"""
+Database-backed job queue.
+
+Slow side effects (sending mail, fetching remote images) are handed to
+``manage.py run_worker`` as ``Job`` rows instead of running in the request.
+No broker is involved: a job is an INSERT, so one enqueued inside a
+transaction appears only if the transaction commits.
+
+Tasks are plain functions registered with ``@task`` (see ``tasks.py``) and
+called with the job's JSON payload as keyword arguments::
+
+    @task(max_attempts=3)
+    def send_reminder(appointment_id): ...
+
+    send_reminder.enqueue(appointment_id=42)
+
+Workers claim jobs with one UPDATE that marks up to a batch of ready rows
+``running`` under a fresh claim token and pushes their ``available_at`` out
+by ``JOB_VISIBILITY_TIMEOUT`` seconds (default 300), then read the rows
+carrying the token. The UPDATE re-checks status and availability on each
+row, so two workers never claim the same job (SQLite runs UPDATEs one at a
+time; PostgreSQL re-evaluates the conditions on rows another transaction
+changed). A job whose worker dies becomes available again when its
+visibility timeout lapses, so delivery is at least once: tasks should be
+safe to run twice. A failing job is retried after an exponential backoff of
+``JOB_RETRY_BACKOFF`` seconds (default 10) doubling per attempt up to
+``JOB_RETRY_BACKOFF_MAX`` (default 3600). After ``max_attempts`` it is left
+``dead`` with its last traceback (the dead-letter list, in the admin) until
+someone requeues it. Finished jobs are deleted after ``JOB_RETENTION``
+seconds (default a week), by an idle worker at most once an hour.
+"""
+import logging
+import random
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+from django.db.models import F, Q, Subquery
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# name -> task function
+TASKS = {}
+
+DEFAULT_MAX_ATTEMPTS = 5
+
+PURGE_KEY = 'jobs:purge'
+
+
+def _setting(name, default):
+    return getattr(settings, f'JOB_{name}', default)
+
+
+# Registering and enqueueing
+def task(name=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register a function as a task; adds ``.enqueue(**payload)`` to it"""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        TASKS[task_name] = func
+        func.task_name = task_name
+        func.enqueue = lambda delay=None, **payload: enqueue(task_name, payload, delay, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(task_name, payload=None, delay=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Queue a run of ``task_name`` with ``payload`` (JSON) as its keyword arguments"""
+    from .models import Job
+
+    available_at = timezone.now()
+    if delay:
+        available_at += delay if isinstance(delay, timedelta) else timedelta(seconds=delay)
+    return Job.objects.create(
+        task=task_name, payload=payload or {}, available_at=available_at, max_attempts=max_attempts,
+    )
+
+
+# Claiming and settling
+def claim(worker, limit=1):
+    """Mark up to ``limit`` ready jobs as running for ``worker`` and return them"""
+    from .models import Job
+
+    now = timezone.now()
+    token = f'{worker[:48]}:{uuid.uuid4().hex[:12]}'
+    # Queued jobs that are due, and running jobs whose claim has lapsed
+    ready = Q(status__in=('queued', 'running'), available_at__lte=now)
+    candidates = Job.objects.filter(ready).order_by('available_at', 'pk').values('pk')[:limit]
+    claimed = Job.objects.filter(ready, pk__in=Subquery(candidates)).update(
+        status='running', claimed_by=token, attempts=F('attempts') + 1,
+        available_at=now + timedelta(seconds=_setting('VISIBILITY_TIMEOUT', 300)),
+    )
+    if not claimed:
+        return []
+    jobs = list(Job.objects.filter(claimed_by=token).order_by('available_at', 'pk'))
+    runnable = []
+    for job in jobs:
+        # Claimed again after its visibility timeout lapsed once too often:
+        # the job keeps taking its worker down (or outlasts the timeout)
+        if job.attempts > job.max_attempts:
+            _settle(job, 'dead', error=job.last_error or 'Visibility timeout expired on every attempt.')
+        else:
+            runnable.append(job)
+    return runnable
+
+
+def _settle(job, status, error='', available_at=None):
+    """Record the outcome of ``job`` unless another worker has claimed it since"""
+    from .models import Job
+
+    fields = {'status': status, 'last_error': error}
+    if status in ('done', 'dead'):
+        fields['finished_at'] = timezone.now()
+    if available_at is not None:
+        fields['available_at'] = available_at
+    return Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by, status='running').update(**fields)
+
+
+def backoff(attempts):
+    """Seconds before retrying a job that failed ``attempts`` times"""
+    base = _setting('RETRY_BACKOFF', 10)
+    delay = min(base * 2 ** max(0, attempts - 1), _setting('RETRY_BACKOFF_MAX', 3600))
+    # Jitter spreads out retries of jobs that failed together
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_job(job):
+    """Run one claimed job and record the outcome; whether it succeeded"""
+    func = TASKS.get(job.task)
+    if func is None:
+        _settle(job, 'dead', error=f'Unknown task {job.task!r}.')
+        return False
+    try:
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s (%s) failed for good after %s attempts', job.pk, job.task, job.attempts)
+            _settle(job, 'dead', error=error)
+        else:
+            retry_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            _settle(job, 'queued', error=error, available_at=retry_at)
+        return False
+    _settle(job, 'done')
+    return True
+
+
+def requeue(queryset):
+    """Queue dead (or any) jobs again with a fresh set of attempts"""
+    return queryset.exclude(status='running').update(
+        status='queued', attempts=0, available_at=timezone.now(), finished_at=None,
+    )
+
+
+def purge_finished(older_than=None):
+    """Delete jobs done longer than ``older_than`` (default ``JOB_RETENTION``) ago"""
+    from .models import Job
+
+    if older_than is None:
+        older_than = timedelta(seconds=_setting('RETENTION', 7 * 24 * 3600))
+    deleted, _ = Job.objects.filter(status='done', finished_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+# Working
+class Worker:
+    """One worker loop: claim a batch, run it, repeat; sleep when idle
+
+    Runs in its own thread (``run_worker --workers N`` starts N), with its
+    own database connection.
+    """
+
+    def __init__(self, name, stop, batch=1, poll=1.0):
+        self.name = name
+        self.stop = stop
+        self.batch = max(1, batch)
+        self.poll = poll
+        self.succeeded = self.failed = 0
+
+    def run(self, burst=False):
+        """Work until ``stop`` is set, or with ``burst`` until no job is ready"""
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                jobs = claim(self.name, self.batch)
+                if not jobs:
+                    if burst:
+                        return
+                    if cache.add(PURGE_KEY, 1, 3600):
+                        purge_finished()
+                    self.stop.wait(self.poll)
+                    continue
+                for job in jobs:
+                    if run_job(job):
+                        self.succeeded += 1
+                    else:
+                        self.failed += 1
+        finally:
+            connections.close_all()
+
+
+def work(workers=1, batch=1, poll=1.0, burst=False, stop=None, name=None):
+    """Run ``workers`` worker threads until ``stop`` is set (or, with ``burst``,
+    until the queue has nothing ready); returns the ``Worker`` objects"""
+    stop = stop or threading.Event()
+    name = name or f'worker-{uuid.uuid4().hex[:8]}'
+    loops = [Worker(f'{name}.{n}', stop, batch, poll) for n in range(workers)]
+    threads = [threading.Thread(target=loop.run, args=(burst,), name=loop.name) for loop in loops]
+    for thread in threads:
+        thread.start()
+    # Joined with a timeout, so the main thread keeps handling signals
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(0.5)
+    return loops
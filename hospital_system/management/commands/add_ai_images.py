@@ -1,12 +1,25 @@
 """
 Management command to add AI-generated pictures for doctors and departments.
 Uses placeholder image services and provides instructions for integration with AI services.
+Images are fetched concurrently (see hospital_system/downloads.py) and
+progress is checkpointed, so an interrupted run picks up where it stopped.
+With ``--enqueue`` the command only queues one background job per image for
+``run_worker`` and returns at once.
 """
+import os
+import time
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.core.files.base import ContentFile
-import requests
-from io import BytesIO
+from django.core.files.storage import default_storage
+from hospital_system.downloads import Checkpoint, Downloader
 from hospital_system.models import Doctor, Department
+from hospital_system.tasks import attach_remote_image
+
+
+# Persist progress after this many fetched images
+CHECKPOINT_EVERY = 25
 
 
 class Command(BaseCommand):
@@ -27,10 +40,34 @@ class Command(BaseCommand):
             default='placeholder',
             help='Image service to use'
         )
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent downloads')
+        parser.add_argument('--per-host', type=int, default=4, help='Concurrent downloads per image host')
+        parser.add_argument('--retries', type=int, default=3, help='Retries per image on errors and 429/5xx')
+        parser.add_argument('--timeout', type=float, default=10, help='Per-request timeout in seconds')
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.MEDIA_ROOT, '.add_ai_images_checkpoint.json'),
+            help='Progress file for resuming interrupted runs'
+        )
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and start over')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Also retry rows whose image URL returned a permanent error (e.g. 404)')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue the downloads as background jobs for run_worker instead')
 
     def handle(self, *args, **options):
         image_type = options['type']
         service = options['service']
+        self.downloader = Downloader(
+            workers=options['workers'], per_host=options['per_host'],
+            retries=options['retries'], timeout=options['timeout'],
+        )
+        self.checkpoint = Checkpoint(options['checkpoint'])
+        if options['restart']:
+            self.checkpoint.reset()
+        self.retry_failed = options['retry_failed']
+        self.enqueue = options['enqueue']
+        self.variants = {}
 
         if image_type in ['doctors', 'both']:
             self.add_doctor_images(service)
@@ -68,7 +105,7 @@ class Command(BaseCommand):
 
     def add_doctor_images(self, service):
         """Add images for doctors without images"""
-        doctors_without_images = Doctor.objects.filter(image='')
+        doctors_without_images = Doctor.objects.filter(image='').select_related('specialization')
 
         if not doctors_without_images.exists():
             self.stdout.write(self.style.SUCCESS('All doctors already have images!'))
@@ -76,30 +113,18 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Found {doctors_without_images.count()} doctors without images.')
 
-        for doctor in doctors_without_images:
-            try:
-                if service == 'placeholder':
-                    image_url = self.get_placeholder_url(doctor.name, 'doctor')
-                elif service == 'unsplash':
-                    image_url = self.get_unsplash_url(f'doctor,{doctor.specialization.name.lower()}', 400, 400)
-                else:
-                    image_url = None
-
-                if image_url:
-                    # Download and save the image
-                    response = requests.get(image_url, timeout=10)
-                    if response.status_code == 200:
-                        filename = f'doctor_{doctor.id}.jpg'
-                        doctor.image.save(filename, ContentFile(response.content), save=True)
-                        self.stdout.write(
-                            self.style.SUCCESS(f'✓ Added image for Dr. {doctor.name}')
-                        )
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(f'⚠ Failed to download image for Dr. {doctor.name}')
-                        )
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'✗ Error processing Dr. {doctor.name}: {e}'))
+        def image_url(doctor):
+            if service == 'placeholder':
+                return self.get_placeholder_url(doctor.name, 'doctor')
+            if service == 'unsplash':
+                return self.get_unsplash_url(f'doctor,{doctor.specialization.name.lower()}', 400, 400)
+            return None
+
+        self.download_images(
+            'doctor', doctors_without_images, image_url,
+            filename=lambda doctor: f'doctor_{doctor.id}.jpg',
+            label=lambda doctor: f'Dr. {doctor.name}',
+        )
 
     def add_department_images(self, service):
         """Add images for departments without images"""
@@ -111,27 +136,92 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Found {depts_without_images.count()} departments without images.')
 
-        for dept in depts_without_images:
-            try:
-                if service == 'placeholder':
-                    image_url = self.get_placeholder_url(dept.name, 'department')
-                elif service == 'unsplash':
-                    image_url = self.get_unsplash_url(f'{dept.name.lower()},medical', 800, 600)
-                else:
-                    image_url = None
-
-                if image_url:
-                    # Download and save the image
-                    response = requests.get(image_url, timeout=10)
-                    if response.status_code == 200:
-                        filename = f'dept_{dept.id}.jpg'
-                        dept.image.save(filename, ContentFile(response.content), save=True)
-                        self.stdout.write(
-                            self.style.SUCCESS(f'✓ Added image for {dept.name}')
-                        )
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(f'⚠ Failed to download image for {dept.name}')
-                        )
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'✗ Error processing {dept.name}: {e}'))
+        def image_url(dept):
+            if service == 'placeholder':
+                return self.get_placeholder_url(dept.name, 'department')
+            if service == 'unsplash':
+                return self.get_unsplash_url(f'{dept.name.lower()},medical', 800, 600)
+            return None
+
+        self.download_images(
+            'department', depts_without_images, image_url,
+            filename=lambda dept: f'dept_{dept.id}.jpg',
+            label=lambda dept: dept.name,
+        )
+
+    def download_images(self, kind, queryset, image_url, filename, label):
+        """Fetch every row's image concurrently and attach it as it arrives"""
+        checkpoint = self.checkpoint
+        pending = {}
+        for obj in queryset:
+            key = f'{kind}:{obj.pk}'
+            stored = checkpoint.done.get(key)
+            if stored and default_storage.exists(stored):
+                # Downloaded by an earlier, interrupted run
+                self.attach(obj, stored)
+                continue
+            if checkpoint.is_permanent_failure(key) and not self.retry_failed:
+                continue
+            url = image_url(obj)
+            if url:
+                pending.setdefault(url, []).append(obj)
+        if not pending:
+            checkpoint.save()
+            return
+        if self.enqueue:
+            queued = 0
+            for url, rows in pending.items():
+                for obj in rows:
+                    attach_remote_image.enqueue(model=kind, pk=obj.pk, url=url, filename=filename(obj))
+                    queued += 1
+            self.stdout.write(self.style.SUCCESS(f'✓ Queued {queued} {kind} images for run_worker'))
+            return
+
+        started = time.perf_counter()
+        fetched = received = 0
+        for result in self.downloader.fetch_all(pending):
+            rows = pending[result.url]
+            if not result.ok:
+                for obj in rows:
+                    checkpoint.mark_failed(f'{kind}:{obj.pk}', result.error, result.status)
+                    self.stdout.write(
+                        self.style.WARNING(f'⚠ Failed to download image for {label(obj)}: {result.error}')
+                    )
+                continue
+            fetched += 1
+            received += len(result.content)
+            for obj in rows:
+                try:
+                    name = self.store(obj, filename(obj), result)
+                    self.attach(obj, name)
+                    checkpoint.mark_done(f'{kind}:{obj.pk}', name)
+                    self.stdout.write(self.style.SUCCESS(f'✓ Added image for {label(obj)}'))
+                except Exception as e:
+                    checkpoint.mark_failed(f'{kind}:{obj.pk}', str(e), None)
+                    self.stdout.write(self.style.ERROR(f'✗ Error processing {label(obj)}: {e}'))
+            if fetched % CHECKPOINT_EVERY == 0:
+                checkpoint.save()
+        checkpoint.save()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Fetched {fetched}/{len(pending)} {kind} images ({received / 1024:.0f} KiB) in {elapsed:.1f}s '
+            f'({fetched / elapsed if elapsed else 0:.1f} images/s)'
+        )
+
+    def store(self, obj, filename, result):
+        """Storage name holding ``result``'s bytes, writing them only if new"""
+        stored = self.checkpoint.stored.get(result.digest)
+        if stored and default_storage.exists(stored):
+            return stored
+        name = default_storage.save(obj.image.field.generate_filename(obj, filename), ContentFile(result.content))
+        self.checkpoint.stored[result.digest] = name
+        return name
+
+    def attach(self, obj, name):
+        obj.image.name = name
+        # Rows sharing a file share its derivatives (see imaging.prepare_image)
+        if name in self.variants:
+            obj.image_variants = self.variants[name]
+        obj.save(update_fields=['image', 'image_variants'])
+        self.variants[name] = obj.image_variants
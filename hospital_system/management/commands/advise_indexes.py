@@ -0,0 +1,118 @@
+"""
+Management command that looks for missing indexes.
+Requests every named route in hospital_system/urls.py against a throwaway
+sample dataset (rolled back afterwards), runs EXPLAIN QUERY PLAN on each
+distinct SELECT it issued and reports full table scans and temporary B-tree
+sorts, with the index that would avoid each one. The admin changelists of the
+hospital models are included, since their default orderings sort whole tables.
+"""
+from collections import defaultdict
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from hospital_system.availability import slot_index
+from hospital_system.queryplans import (
+    StatementCollector, explain, is_covered, plan_problems, propose_index
+)
+from hospital_system.refdata import invalidate_all
+from hospital_system.sampledata import build_sample_dataset, sample_calls
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every query issued by the site views and propose missing indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=20, help='Sample dataset scale factor')
+        parser.add_argument('--show-plans', action='store_true', help='Print the plan of every statement')
+        parser.add_argument('--fail-on-proposals', action='store_true',
+                            help='Exit with an error when any index is proposed')
+
+    # Cache hits would hide the queries a cold request makes
+    @override_settings(QUERY_METRICS_ENABLED=False, PAGE_CACHE_ENABLED=False)
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('advise_indexes reads SQLite query plans; run it against the SQLite database.')
+        try:
+            with transaction.atomic():
+                proposals = self.advise(options['scale'], options['show_plans'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            slot_index.invalidate()
+            invalidate_all()
+
+        if not proposals:
+            self.stdout.write(self.style.SUCCESS('No missing indexes found.'))
+            return
+        self.stdout.write('\nProposed indexes:')
+        for (model, fields), routes in sorted(proposals.items(), key=lambda item: item[0][0].__name__):
+            self.stdout.write(self.style.WARNING(
+                f"  {model.__name__}: models.Index(fields={list(fields)!r})  <- {', '.join(sorted(routes))}"
+            ))
+        if options['fail_on_proposals']:
+            raise CommandError(f'{len(proposals)} index(es) proposed')
+
+    def advise(self, scale, show_plans):
+        dataset = build_sample_dataset(scale=scale)
+        with connection.cursor() as cursor:
+            # Table statistics let the planner choose as it would on real data
+            cursor.execute('ANALYZE')
+        clients = {None: Client(), 'patient': Client(), 'staff': Client(), 'admin': Client()}
+        clients['patient'].force_login(dataset['patient_user'])
+        clients['staff'].force_login(dataset['staff_user'])
+        clients['admin'].force_login(User.objects.create_superuser('index-advisor', 'advisor@example.com'))
+
+        statements = {}
+        routes_by_statement = defaultdict(set)
+        for name, role, call in sample_calls(dataset) + self.admin_calls():
+            # Cold caches, so reference data and slot grid loads are captured too
+            invalidate_all()
+            slot_index.invalidate()
+            collector = StatementCollector()
+            with connection.execute_wrapper(collector):
+                call(clients[role])
+            for key, statement in collector.statements.items():
+                statements.setdefault(key, statement)
+                routes_by_statement[key].add(name)
+
+        proposals = defaultdict(set)
+        for key, (sql, params) in statements.items():
+            plan = explain(sql, params)
+            full_scans, index_scans, sorts = plan_problems(plan)
+            routes = routes_by_statement[key]
+            if not (full_scans or sorts) and not show_plans:
+                continue
+
+            header = f"[{', '.join(sorted(routes))}] {key[:160]}"
+            self.stdout.write(self.style.ERROR(header) if full_scans or sorts else header)
+            for detail in plan:
+                self.stdout.write(f'    {detail}')
+
+            tables = full_scans + (index_scans if sorts else [])
+            for table in dict.fromkeys(tables):
+                proposal = propose_index(sql, table)
+                if proposal is None:
+                    continue
+                model, fields = proposal
+                if not is_covered(model, fields):
+                    proposals[(model, tuple(fields))] |= routes
+        return proposals
+
+    def admin_calls(self):
+        calls = []
+        for model in admin.site._registry:
+            meta = model._meta
+            if meta.app_label == 'hospital_system':
+                name = f'admin:{meta.app_label}_{meta.model_name}_changelist'
+                calls.append((name, 'admin', lambda client, url=reverse(name): client.get(url)))
+        return calls
@@ -0,0 +1,102 @@
+"""
+Management command to benchmark the hospital admin with and without
+ADMIN_PERFORMANCE_MODE. Requests the appointment, doctor, service and
+testimonial changelists (plain, filtered, date drill-downs, a deep page), the
+appointment change form and the doctor autocomplete against the existing
+database, as a throwaway superuser (rolled back afterwards), and prints
+median latency and query count per request in both modes. Meant for large
+datasets: run `seed_data --appointments 1000000` (or more) first.
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from hospital_system.adminperf import forget_count
+from hospital_system.models import Appointment, Department, Doctor, Service, Testimonial
+from hospital_system.querymetrics import record_queries
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare admin changelist and form latency with ADMIN_PERFORMANCE_MODE off and on'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5, help='Timed requests per URL and mode')
+
+    @override_settings(DEBUG=False, QUERY_METRICS_ENABLED=False)
+    def handle(self, *args, **options):
+        appointment = Appointment.objects.order_by('-pk').first()
+        if appointment is None:
+            raise CommandError('No appointments; run `manage.py seed_data --appointments 1000000` first.')
+        try:
+            with transaction.atomic():
+                client = Client()
+                client.force_login(User.objects.create_superuser('admin-bench', 'admin-bench@example.com'))
+                self.compare(client, self.urls(appointment), max(1, options['requests']))
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def urls(self, appointment):
+        changelist = reverse('admin:hospital_system_appointment_changelist')
+        day = appointment.appointment_date
+        last_page = Appointment.objects.count() // 100
+        department = Department.objects.values_list('pk', flat=True).first()
+        latest = Appointment.objects.aggregate(latest=Max('appointment_date'))['latest']
+        return [
+            ('appointments', changelist),
+            ('appointments, status', f'{changelist}?status__exact=scheduled'),
+            ('appointments, department', f'{changelist}?department__id__exact={department}'),
+            ('appointments, year', f'{changelist}?appointment_date__year={latest.year}'),
+            ('appointments, month', f'{changelist}?appointment_date__year={day.year}&appointment_date__month={day.month}'),
+            ('appointments, page 50', f'{changelist}?p=50'),
+            ('appointments, last page', f'{changelist}?p={max(last_page - 1, 0)}'),
+            ('appointment form', reverse('admin:hospital_system_appointment_change', args=[appointment.pk])),
+            ('appointment add form', reverse('admin:hospital_system_appointment_add')),
+            ('doctor autocomplete', reverse('admin:autocomplete') + '?app_label=hospital_system'
+                                    '&model_name=appointment&field_name=doctor&term=sh'),
+            ('doctors', reverse('admin:hospital_system_doctor_changelist')),
+            ('services', reverse('admin:hospital_system_service_changelist')),
+            ('testimonials', reverse('admin:hospital_system_testimonial_changelist')),
+        ]
+
+    def compare(self, client, urls, requests):
+        self.stdout.write(
+            f'{"request":<26} {"off ms":>9} {"queries":>7}   {"on ms":>9} {"queries":>7}  {"speedup":>7}'
+        )
+        for label, url in urls:
+            results = {}
+            for mode in (False, True):
+                with override_settings(ADMIN_PERFORMANCE_MODE=mode):
+                    for model in (Appointment, Doctor, Service, Testimonial):
+                        forget_count(model)
+                    results[mode] = self.measure(client, url, requests)
+            (off_ms, off_queries, status), (on_ms, on_queries, on_status) = results[False], results[True]
+            line = (
+                f'{label:<26} {off_ms:>9.1f} {off_queries:>7}   {on_ms:>9.1f} {on_queries:>7}  '
+                f'{off_ms / on_ms if on_ms else 0:>6.1f}x'
+            )
+            if status != 200 or on_status != 200:
+                self.stdout.write(self.style.ERROR(f'{line}  status {status}/{on_status}'))
+            else:
+                self.stdout.write(line)
+
+    def measure(self, client, url, requests):
+        # First request fills per-process and cached counts: steady state after
+        with record_queries() as recorder:
+            response = client.get(url)
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.get(url)
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples), recorder.count, response.status_code
@@ -0,0 +1,168 @@
+"""
+Management command to benchmark the booking AJAX endpoints under WSGI and ASGI.
+Drives Django's WSGI handler from a fixed pool of worker threads (sync views)
+and its ASGI handler from one event loop (async views) with the same number of
+simulated concurrent clients. Every response takes --client-latency ms to
+reach its client: a WSGI worker stays blocked for that time, the ASGI path
+just awaits. Reads existing doctors, so run seed_data first.
+"""
+import asyncio
+import importlib
+import io
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from itertools import cycle, islice
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import clear_url_caches, reverse
+
+from hospital_system.availability import slot_index
+from hospital_system.fastpath import with_fast_paths
+from hospital_system.models import Doctor
+from hospital_system.refdata import invalidate_all
+
+
+def _use_urlconf(async_views):
+    """Re-import the URLconf so it routes to the sync or async views"""
+    with override_settings(ASYNC_VIEWS=async_views):
+        importlib.reload(importlib.import_module('hospital_system.urls'))
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+class Command(BaseCommand):
+    help = 'Compare the booking AJAX endpoints under WSGI (thread pool) and ASGI (event loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help='Concurrent simulated clients')
+        parser.add_argument('--requests', type=int, default=10000, help='Requests per run')
+        parser.add_argument('--threads', type=int, default=32, help='WSGI worker threads')
+        parser.add_argument('--client-latency', type=float, default=20.0,
+                            help='Milliseconds each response takes to reach its client')
+        parser.add_argument('--endpoint', choices=['slots', 'doctors', 'both'], default='both',
+                            help='Endpoints to request')
+
+    @override_settings(DEBUG=False, QUERY_METRICS_ENABLED=False)
+    def handle(self, *args, **options):
+        urls = self.sample_urls(options['endpoint'])
+        runs = [
+            (f'WSGI, {options["threads"]} threads', False, self.run_wsgi),
+            ('ASGI, async views', True, self.run_asgi),
+        ]
+        try:
+            for label, async_views, run in runs:
+                _use_urlconf(async_views)
+                # Each run starts cold: grids and lookups load on first use
+                slot_index.invalidate()
+                invalidate_all()
+                requests = list(islice(cycle(urls), options['requests']))
+                started = time.perf_counter()
+                latencies, errors = asyncio.run(run(requests, options))
+                self.report(label, latencies, errors, time.perf_counter() - started)
+        finally:
+            _use_urlconf(settings.ASYNC_VIEWS)
+
+    def sample_urls(self, endpoint):
+        doctors = list(Doctor.objects.filter(is_available=True).values_list('id', 'specialization_id')[:200])
+        if not doctors:
+            raise CommandError('No available doctors; run `manage.py seed_data` first.')
+        days = [date.today() + timedelta(days=offset) for offset in range(1, 15)]
+        urls = []
+        for i, (doctor_id, department_id) in enumerate(doctors):
+            if endpoint in ('slots', 'both'):
+                day = days[i % len(days)]
+                urls.append(reverse('hospital_system:get_available_slots') + f'?doctor={doctor_id}&date={day}')
+            if endpoint in ('doctors', 'both'):
+                urls.append(reverse('hospital_system:get_doctors_by_department', args=[department_id]))
+        return urls
+
+    async def clients(self, requests, options, fetch):
+        """Run ``fetch(url)`` for every request from ``--clients`` concurrent loops"""
+        pending = iter(requests)
+        latencies, errors = [], []
+
+        async def client():
+            for url in pending:
+                started = time.perf_counter()
+                status = await fetch(url)
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors.append((url, status))
+
+        await asyncio.gather(*(client() for _ in range(max(1, options['clients']))))
+        return latencies, errors
+
+    # WSGI: each request holds a worker thread until its client has the response
+    async def run_wsgi(self, requests, options):
+        handler = WSGIHandler()
+        latency = options['client_latency'] / 1000
+        loop = asyncio.get_running_loop()
+
+        def get(url):
+            path, _, query = url.partition('?')
+            status = []
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+                'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(b''),
+                'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False, 'wsgi.version': (1, 0),
+            }
+            response = handler(environ, lambda line, headers, exc_info=None: status.append(int(line[:3])))
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+            time.sleep(latency)
+            return status[0]
+
+        with ThreadPoolExecutor(max_workers=max(1, options['threads'])) as pool:
+            return await self.clients(requests, options, lambda url: loop.run_in_executor(pool, get, url))
+
+    # ASGI: a slow client only costs a suspended coroutine
+    async def run_asgi(self, requests, options):
+        # As hospital_management/asgi.py builds it
+        handler = with_fast_paths(ASGIHandler())
+        latency = options['client_latency'] / 1000
+
+        async def get(url):
+            path, _, query = url.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+            }
+            status = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    await asyncio.sleep(latency)
+
+            await handler(scope, receive, send)
+            return status[0]
+
+        return await self.clients(requests, options, get)
+
+    def report(self, label, latencies, errors, elapsed):
+        latencies = sorted(latencies)
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f'{label:<20} {len(latencies) / elapsed:>8.0f} req/s  p50={cuts[49] * 1000:7.1f}ms  '
+            f'p95={cuts[94] * 1000:7.1f}ms  p99={cuts[98] * 1000:7.1f}ms  errors={len(errors)}'
+        )
+        if errors:
+            url, status = errors[0]
+            raise CommandError(f'{label}: {len(errors)} failed requests, e.g. {url} -> {status}')
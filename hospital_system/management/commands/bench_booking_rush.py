@@ -0,0 +1,150 @@
+"""
+Management command to stress-test booking under contention. Threads of
+simulated patients race for the slots of one throwaway doctor on one day,
+through the real views: each reads the free times, picks one, spends a
+moment filling in the form and submits, starting over when the time was
+taken. Runs twice: submitting straight from the list of free times, and
+holding the time first (``place_slot_hold``) and submitting with the hold.
+Reports appointments created, failed submits, lost holds, requests per
+appointment and double bookings (overlapping appointments found afterwards,
+which must be 0). The doctor and everything booked on it are deleted
+afterwards.
+"""
+import random
+import threading
+import time
+from datetime import date, time as time_of_day, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+
+from hospital_system.availability import DayBookings, interval
+from hospital_system.models import Appointment, Department, Doctor, WeeklyShift
+
+
+MODES = [
+    ('submit from the list', False),
+    ('hold, then submit', True),
+]
+
+
+class Command(BaseCommand):
+    help = 'Race patient threads for one doctor\'s slots, with and without slot holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=16, help='Concurrent patient threads')
+        parser.add_argument('--hours', type=int, default=2, help='Working hours of the doctor that day')
+        parser.add_argument('--slot-minutes', type=int, default=15, help='The doctor\'s slot length')
+        parser.add_argument('--think', type=float, default=0.05,
+                            help='Seconds between choosing a time and submitting the form')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    @override_settings(DEBUG=False, QUERY_METRICS_ENABLED=False, PAGE_CACHE_ENABLED=False)
+    def handle(self, *args, **options):
+        department = Department.objects.first()
+        if department is None:
+            raise CommandError('No departments; run `manage.py seed_data` first.')
+        self.stdout.write(
+            f'{"mode":<22} {"booked":>6} {"failed submits":>14} {"lost holds":>10} '
+            f'{"requests/booking":>16} {"double bookings":>15} {"seconds":>8}'
+        )
+        for label, use_holds in MODES:
+            doctor = self.create_doctor(department, options)
+            try:
+                result = self.rush(doctor, use_holds, options)
+            finally:
+                # Cascades to the doctor's shifts, appointments and holds
+                doctor.delete()
+            self.stdout.write(
+                f'{label:<22} {result["booked"]:>6} {result["failed"]:>14} {result["lost"]:>10} '
+                f'{result["requests"] / max(1, result["booked"]):>16.1f} {result["double"]:>15} '
+                f'{result["seconds"]:>8.2f}'
+            )
+            if result['double']:
+                self.stderr.write(self.style.ERROR(f'{label}: {result["double"]} overlapping appointments'))
+
+    def create_doctor(self, department, options):
+        doctor = Doctor.objects.create(
+            name='Booking Rush', email='rush@example.com', phone='0', qualification='MD',
+            specialization=department, experience_years=1, consultation_fee=0, gender='O',
+            slot_minutes=options['slot_minutes'],
+        )
+        # In place of the default shifts it got from its availability text
+        doctor.weekly_shifts.all().delete()
+        WeeklyShift.objects.bulk_create([
+            WeeklyShift(doctor=doctor, weekday=weekday, start_time=time_of_day(8),
+                        end_time=time_of_day(8 + options['hours']))
+            for weekday in range(7)
+        ])
+        return doctor
+
+    def rush(self, doctor, use_holds, options):
+        day = date.today() + timedelta(days=1)
+        counts = {'booked': 0, 'failed': 0, 'lost': 0, 'requests': 0}
+        lock = threading.Lock()
+
+        def count(**deltas):
+            with lock:
+                for key, delta in deltas.items():
+                    counts[key] += delta
+
+        def patient(number):
+            rng = random.Random(options['seed'] * 1000 + number)
+            client = Client()
+            form = {
+                'patient_name': f'Patient {number}', 'patient_email': f'rush{number}@example.com',
+                'patient_phone': '0', 'doctor': doctor.pk, 'department': doctor.specialization_id,
+                'appointment_date': day.isoformat(), 'reason': 'Booking rush',
+            }
+            try:
+                while True:
+                    times = client.get(
+                        '/api/available-slots/', {'doctor': doctor.pk, 'date': day.isoformat()},
+                    ).json()['available_times']
+                    count(requests=1)
+                    if not times:
+                        return
+                    chosen = rng.choice(times)
+                    submit = dict(form, appointment_time=chosen)
+                    if use_holds:
+                        response = client.post(
+                            '/api/slot-holds/', {'doctor': doctor.pk, 'date': day.isoformat(), 'time': chosen},
+                        )
+                        count(requests=1)
+                        if response.status_code != 201:
+                            count(lost=1)
+                            continue
+                        submit['hold'] = response.json()['hold']
+                    time.sleep(options['think'])
+                    response = client.post('/book-appointment/', submit)
+                    count(requests=1)
+                    if response.status_code == 302:
+                        count(booked=1)
+                        return
+                    count(failed=1)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=patient, args=(n,)) for n in range(options['patients'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counts['seconds'] = time.perf_counter() - started
+        counts['double'] = self.double_bookings(doctor, day)
+        return counts
+
+    def double_bookings(self, doctor, day):
+        """Appointments that overlap an earlier one of the same day"""
+        bookings = DayBookings()
+        double = 0
+        for value, minutes in Appointment.objects.filter(
+            doctor=doctor, appointment_date=day,
+        ).order_by('appointment_time').values_list('appointment_time', 'duration_minutes'):
+            start, end = interval(value, minutes)
+            if bookings.overlaps(start, end):
+                double += 1
+            bookings.add(start, end)
+        return double
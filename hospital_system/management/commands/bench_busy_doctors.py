@@ -0,0 +1,166 @@
+"""
+Management command to benchmark overlap detection and free-time lookups for
+busy doctors. Builds days of a couple of hundred bookings of mixed lengths
+(mostly 5 minutes, up to 15, packed into round-the-clock hours) in memory and
+times ``DayBookings.overlaps`` against a linear scan of the same intervals,
+then ``SlotIndex`` lookups for several appointment lengths and
+booking/releasing intervals. With ``--database``, also inserts one such day
+for an existing doctor (rolled back afterwards) and times the check every
+``Appointment.save()`` runs: lock the doctor, read the day, test the overlap.
+"""
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from hospital_system.availability import DayBookings, DoctorSchedule, SlotIndex, time_label
+from hospital_system.bookings import SlotUnavailable, check_available, lock_doctors
+from hospital_system.models import Appointment, Doctor
+
+
+# Mostly short visits (a vaccination or dressing clinic), so a day holds hundreds
+LENGTHS = (5, 5, 5, 5, 10, 15)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def busy_day(rng, bookings):
+    """Up to ``bookings`` non-overlapping (start, end) intervals in one day"""
+    intervals = []
+    start = 0
+    while len(intervals) < bookings and start < 24 * 60:
+        length = rng.choice(LENGTHS)
+        if start + length > 24 * 60:
+            break
+        intervals.append((start, start + length))
+        # Leave an occasional gap, so free time is scattered through the day
+        start += length + (5 if rng.random() < 0.15 else 0)
+    return intervals
+
+
+def linear_overlaps(intervals, start, end):
+    return any(booked_start < end and start < booked_end for booked_start, booked_end in intervals)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark overlap checks and free-time lookups for doctors with hundreds of bookings per day'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=200, help='Bookings per doctor per day')
+        parser.add_argument('--doctors', type=int, default=200, help='Number of doctors')
+        parser.add_argument('--days', type=int, default=30, help='Days per doctor')
+        parser.add_argument('--lookups', type=int, default=50000, help='Number of lookups to time')
+        parser.add_argument('--database', action='store_true',
+                            help='Also time the database-side check on an existing doctor')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        doctors, days, lookups = options['doctors'], options['days'], options['lookups']
+        start = date.today()
+        schedule = DoctorSchedule(5, {weekday: [('00:00', '24:00')] for weekday in range(7)})
+
+        index = SlotIndex(ttl=float('inf'))
+        intervals = {}
+        for doctor_id in range(1, doctors + 1):
+            grid = {}
+            for offset in range(days):
+                day = start + timedelta(days=offset)
+                intervals[doctor_id, day] = busy_day(rng, options['bookings'])
+                grid[day] = DayBookings(intervals[doctor_id, day])
+            index.prime(doctor_id, start, grid, schedule)
+        sizes = [len(day) for day in intervals.values()]
+        self.stdout.write(
+            f'{doctors} doctors x {days} days, {statistics.mean(sizes):.0f} bookings per day on average'
+        )
+
+        queries = []
+        for _ in range(lookups):
+            doctor_id = rng.randint(1, doctors)
+            day = start + timedelta(days=rng.randrange(days))
+            begin = rng.randrange(0, 24 * 60 - 60, 5)
+            queries.append((doctor_id, day, begin, begin + rng.choice(LENGTHS + (30, 60))))
+
+        bookings = {key: DayBookings(value) for key, value in intervals.items()}
+        self._time('overlap, interval index', [
+            (lambda day=bookings[d, day], s=s, e=e: day.overlaps(s, e)) for d, day, s, e in queries
+        ])
+        self._time('overlap, linear scan', [
+            (lambda day=intervals[d, day], s=s, e=e: linear_overlaps(day, s, e)) for d, day, s, e in queries
+        ])
+        self._time('SlotIndex.is_free', [
+            (lambda d=d, day=day, s=s, e=e: index.is_free(d, day, time_label(s), e - s)) for d, day, s, e in queries
+        ])
+        for minutes in (None, 30, 60):
+            self._time(f'SlotIndex.free_slots ({minutes or "slot"} min)', [
+                (lambda d=d, day=day: index.free_slots(d, day, minutes)) for d, day, _, _ in queries[:lookups // 5]
+            ])
+        self._time('SlotIndex.free_gaps (30 min)', [
+            (lambda d=d, day=day: index.free_gaps(d, day, 30)) for d, day, _, _ in queries[:lookups // 5]
+        ])
+        self._time('DayBookings.add + remove', [
+            (lambda day=bookings[d, day], s=s, e=e: (day.add(s, e), day.remove(s, e)))
+            for d, day, s, e in queries[:lookups // 5]
+        ])
+
+        if options['database']:
+            self.database(rng, options['bookings'], max(1, lookups // 100))
+
+    def database(self, rng, bookings, checks):
+        doctor = Doctor.objects.select_related('specialization').first()
+        if doctor is None:
+            raise CommandError('No doctors; run `manage.py seed_data` first.')
+        # A day past any real booking, so the rows are the only ones that day
+        day = date.today() + timedelta(days=3650)
+        try:
+            with transaction.atomic():
+                # bulk_create skips save() and its checks: the rows are known not to overlap
+                Appointment.objects.bulk_create([
+                    Appointment(
+                        patient_name='Bench', patient_email='bench@example.com', patient_phone='0',
+                        doctor=doctor, department=doctor.specialization, appointment_date=day,
+                        appointment_time=time_label(begin), duration_minutes=end - begin, reason='bench',
+                    )
+                    for begin, end in busy_day(rng, bookings)
+                ])
+                samples, rejected = [], 0
+                for _ in range(checks):
+                    begin = rng.randrange(0, 24 * 60 - 60, 5)
+                    candidate = Appointment(
+                        doctor=doctor, appointment_date=day, appointment_time=time_label(begin),
+                        duration_minutes=rng.choice(LENGTHS), status='scheduled',
+                    )
+                    t0 = time.perf_counter()
+                    with transaction.atomic():
+                        lock_doctors([doctor.pk])
+                        try:
+                            check_available(candidate)
+                        except SlotUnavailable:
+                            rejected += 1
+                    samples.append(time.perf_counter() - t0)
+                self._report(f'lock + read day + check ({rejected}/{checks} rejected)', samples)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _time(self, label, calls):
+        samples = []
+        for call in calls:
+            t0 = time.perf_counter()
+            call()
+            samples.append(time.perf_counter() - t0)
+        self._report(label, samples)
+
+    def _report(self, label, samples):
+        samples.sort()
+        p50 = statistics.median(samples)
+        p99 = samples[int(len(samples) * 0.99) - 1]
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: n={len(samples)} p50={p50 * 1e6:.1f}us p99={p99 * 1e6:.1f}us '
+            f'throughput={len(samples) / sum(samples):,.0f}/s'
+        ))
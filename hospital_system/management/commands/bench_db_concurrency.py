@@ -0,0 +1,157 @@
+"""
+Management command to benchmark SQLite reads during write bursts.
+Builds a scratch database file per profile (SQLite defaults vs
+settings.SQLITE_PRAGMAS), runs reader threads doing appointment-style
+lookups while writer threads insert in bursts, and reports read throughput,
+read latency and "database is locked" errors for each profile.
+"""
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital_system.dbtuning import configure_connection
+
+
+# Django's SQLite backend uses the sqlite3 module's default busy wait
+DEFAULT_TIMEOUT = 5.0
+
+SCHEMA = [
+    'CREATE TABLE appointment (id INTEGER PRIMARY KEY, doctor_id INTEGER NOT NULL, '
+    'appointment_date TEXT NOT NULL, appointment_time TEXT NOT NULL, status TEXT NOT NULL, reason TEXT)',
+    'CREATE INDEX appointment_doctor_date ON appointment (doctor_id, appointment_date)',
+]
+READ_SQL = ('SELECT appointment_time FROM appointment '
+            'WHERE doctor_id = ? AND appointment_date = ? AND status = ?')
+WRITE_SQL = ('INSERT INTO appointment (doctor_id, appointment_date, appointment_time, status, reason) '
+             'VALUES (?, ?, ?, ?, ?)')
+
+
+class Command(BaseCommand):
+    help = 'Compare SQLite read throughput during write bursts with and without SQLITE_PRAGMAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads')
+        parser.add_argument('--writers', type=int, default=2, help='Writer threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration per profile')
+        parser.add_argument('--rows', type=int, default=50000, help='Rows seeded before the run')
+        parser.add_argument('--burst', type=int, default=200, help='Rows inserted per write transaction')
+        parser.add_argument('--doctors', type=int, default=500, help='Distinct doctors in the data')
+
+    def handle(self, *args, **options):
+        tuned = getattr(settings, 'SQLITE_PRAGMAS', {})
+        if not tuned:
+            raise CommandError('SQLITE_PRAGMAS is empty; unset DJANGO_DB_TUNING=off to compare.')
+        profiles = [
+            ('sqlite defaults', {'journal_mode': 'DELETE'}),
+            ('SQLITE_PRAGMAS', tuned),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            for label, pragmas in profiles:
+                path = os.path.join(directory, f'{label.split()[0].lower()}.sqlite3')
+                self.seed(path, pragmas, options)
+                result = self.run(path, pragmas, options)
+                self.report(label, result, options['seconds'])
+
+    def connect(self, path, pragmas):
+        connection = sqlite3.connect(path, timeout=DEFAULT_TIMEOUT, isolation_level=None,
+                                     check_same_thread=False)
+        configure_connection(connection, pragmas)
+        return connection
+
+    def seed(self, path, pragmas, options):
+        rng = random.Random(1)
+        connection = self.connect(path, pragmas)
+        try:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.execute('BEGIN')
+            connection.executemany(WRITE_SQL, (self.row(rng, options['doctors']) for _ in range(options['rows'])))
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+    def row(self, rng, doctors):
+        return (
+            rng.randrange(doctors), f'2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            f'{rng.randint(9, 16):02d}:{rng.choice((0, 30)):02d}', 'scheduled', 'Benchmark visit.',
+        )
+
+    def run(self, path, pragmas, options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        result = {'latencies': [], 'read_errors': 0, 'writes': 0, 'write_errors': 0}
+
+        def reader(seed):
+            rng = random.Random(seed)
+            connection = self.connect(path, pragmas)
+            latencies, errors = [], 0
+            try:
+                while not stop.is_set():
+                    doctor, day = self.row(rng, options['doctors'])[:2]
+                    started = time.perf_counter()
+                    try:
+                        connection.execute(READ_SQL, (doctor, day, 'scheduled')).fetchall()
+                    except sqlite3.OperationalError:
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            with lock:
+                result['latencies'].extend(latencies)
+                result['read_errors'] += errors
+
+        def writer(seed):
+            rng = random.Random(seed)
+            connection = self.connect(path, pragmas)
+            writes, errors = 0, 0
+            try:
+                while not stop.is_set():
+                    try:
+                        connection.execute('BEGIN')
+                        connection.executemany(WRITE_SQL, [self.row(rng, options['doctors'])
+                                                           for _ in range(options['burst'])])
+                        connection.execute('COMMIT')
+                        writes += 1
+                    except sqlite3.OperationalError:
+                        errors += 1
+                        if connection.in_transaction:
+                            connection.execute('ROLLBACK')
+            finally:
+                connection.close()
+            with lock:
+                result['writes'] += writes
+                result['write_errors'] += errors
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(1000 + i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return result
+
+    def report(self, label, result, seconds):
+        latencies = sorted(result['latencies'])
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        if not latencies:
+            self.stdout.write('  no reads completed')
+            return
+        p95 = latencies[int(len(latencies) * 0.95)]
+        self.stdout.write(
+            f'  reads: {len(latencies) / seconds:10.0f}/s  '
+            f'p50 {statistics.median(latencies) * 1000:7.3f}ms  p95 {p95 * 1000:7.3f}ms  '
+            f'max {latencies[-1] * 1000:8.3f}ms  errors {result["read_errors"]}'
+        )
+        self.stdout.write(
+            f'  write bursts: {result["writes"] / seconds:6.1f}/s  errors {result["write_errors"]}'
+        )
@@ -0,0 +1,72 @@
+"""
+Management command to benchmark home page rendering with and without the
+cached department, infrastructure and testimonial fragments.
+Runs against a throwaway sample dataset that is rolled back afterwards.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from hospital_system.availability import slot_index
+from hospital_system.refdata import invalidate_all
+from hospital_system.sampledata import build_sample_dataset
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark home page render time before/after fragment caching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=10, help='Sample dataset scale factor')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode')
+
+    @override_settings(QUERY_METRICS_ENABLED=False)
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['scale'], options['requests'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            slot_index.invalidate()
+            invalidate_all()
+
+    def run(self, scale, requests):
+        dataset = build_sample_dataset(scale=scale)
+        client = Client()
+        client.force_login(dataset['patient_user'])
+        url = reverse('hospital_system:home')
+
+        # A zero timeout makes every {% cache %} block re-render
+        with override_settings(HOME_FRAGMENT_CACHE_TIMEOUT=0):
+            uncached = self.measure(client, url, requests)
+        cached = self.measure(client, url, requests)
+
+        self.report('without fragment cache', uncached)
+        self.report('with fragment cache', cached)
+        speedup = statistics.median(uncached) / statistics.median(cached)
+        self.stdout.write(self.style.SUCCESS(f'Median speed-up: {speedup:.1f}x'))
+
+    def measure(self, client, url, requests):
+        client.get(url)
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.get(url)
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    def report(self, label, samples):
+        samples = sorted(samples)
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        self.stdout.write(
+            f'{label:<24} p50={statistics.median(samples) * 1000:.2f}ms p95={p95 * 1000:.2f}ms'
+        )
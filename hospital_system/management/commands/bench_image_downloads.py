@@ -0,0 +1,114 @@
+"""
+Management command to benchmark the concurrent image downloader.
+Starts a local HTTP stand-in for the image services, with artificial latency,
+a per-connection limit and transient 503s, then fetches the same URL set one
+at a time and with the concurrent Downloader, reporting throughput, retries
+and how many distinct images (content hashes) came back.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from hospital_system.downloads import Downloader
+
+
+def _png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (400, 400), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class _StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, fail_every, distinct):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.fail_every = fail_every
+        self.images = [_png(((i * 37) % 256, (i * 91) % 256, 160)) for i in range(distinct)]
+        self.lock = threading.Lock()
+        self.failed_once = set()
+        self.requests = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        number = int(self.path.rsplit('/', 1)[-1].split('.')[0])
+        with server.lock:
+            server.requests += 1
+            # Every fail_every-th image fails its first attempt
+            fail = server.fail_every and number % server.fail_every == 0 and number not in server.failed_once
+            if fail:
+                server.failed_once.add(number)
+        time.sleep(server.latency)
+        if fail:
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = server.images[number % len(server.images)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark sequential vs concurrent image downloads against a local stand-in server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=200, help='Images to fetch')
+        parser.add_argument('--latency', type=float, default=0.05, help='Server latency per request (s)')
+        parser.add_argument('--fail-every', type=int, default=10, help='Every Nth image 503s once (0 = never)')
+        parser.add_argument('--distinct', type=int, default=50, help='Distinct image contents served')
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent workers')
+        parser.add_argument('--per-host', type=int, default=8, help='Per-host concurrency limit')
+
+    def handle(self, *args, **options):
+        server = _StandIn(options['latency'], options['fail_every'], options['distinct'])
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            base = f'http://127.0.0.1:{server.server_address[1]}/img'
+            urls = [f'{base}/{i}.png' for i in range(options['images'])]
+            runs = [
+                ('sequential', Downloader(workers=1, per_host=1, backoff=0.01)),
+                (f'{options["workers"]} workers', Downloader(
+                    workers=options['workers'], per_host=options['per_host'], backoff=0.01,
+                )),
+            ]
+            for label, downloader in runs:
+                server.failed_once.clear()
+                self.run(label, downloader, urls)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def run(self, label, downloader, urls):
+        started = time.perf_counter()
+        results = list(downloader.fetch_all(urls))
+        elapsed = time.perf_counter() - started
+
+        failed = [result for result in results if not result.ok]
+        retries = sum(result.attempts - 1 for result in results)
+        digests = {result.digest for result in results if result.ok}
+        received = sum(len(result.content) for result in results if result.ok)
+        self.stdout.write(
+            f'{label:<12} {len(results) - len(failed):>5} ok  {len(failed):>3} failed  {retries:>3} retries  '
+            f'{len(digests):>4} distinct  {received / 1024:8.0f} KiB  {elapsed:6.2f}s  '
+            f'{len(results) / elapsed:7.1f} images/s'
+        )
+        if failed:
+            raise CommandError(f'{label}: {len(failed)} downloads failed, e.g. {failed[0].url}: {failed[0].error}')
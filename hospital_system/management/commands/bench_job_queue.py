@@ -0,0 +1,138 @@
+"""
+Management command to exercise the background job queue end to end on the
+configured database, with no broker: enqueues a batch of throwaway jobs and
+drains them with ``--workers`` worker threads in burst mode, for each worker
+count given. Most jobs sleep ``--task-ms`` (standing in for a mail server
+or an image host), some fail a few times before succeeding and a few always
+fail. Checks afterwards that every job ran to completion exactly once per
+attempt, that the flaky ones ended ``done`` and the broken ones ``dead``,
+and that a job whose worker vanished is picked up again once its visibility
+timeout lapses while the vanished worker can no longer settle it. Reports
+jobs per second. The bench jobs are deleted afterwards.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+
+from hospital_system import jobs
+from hospital_system.models import Job
+
+
+PREFIX = 'bench_job_queue.'
+MAX_ATTEMPTS = 3
+
+# payload n -> times run, across all threads
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+def _count(n):
+    with _runs_lock:
+        _runs[n] = _runs.get(n, 0) + 1
+        return _runs[n]
+
+
+@jobs.task(name=PREFIX + 'work', max_attempts=MAX_ATTEMPTS)
+def bench_work(n, sleep, fail_times=0):
+    runs = _count(n)
+    time.sleep(sleep)
+    if runs <= fail_times:
+        raise RuntimeError(f'Bench job {n} failing on purpose (run {runs})')
+
+
+@jobs.task(name=PREFIX + 'broken', max_attempts=MAX_ATTEMPTS)
+def bench_broken(n):
+    _count(n)
+    raise RuntimeError(f'Bench job {n} always fails')
+
+
+class Command(BaseCommand):
+    help = 'Drain a batch of throwaway jobs with worker threads and check the outcome'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=200, help='Jobs per run')
+        parser.add_argument('--workers', default='1,4', help='Comma-separated worker counts to compare')
+        parser.add_argument('--batch', type=int, default=1, help='Jobs claimed at a time per worker')
+        parser.add_argument('--task-ms', type=float, default=20, help='Time each job spends working')
+
+    @override_settings(JOB_RETRY_BACKOFF=0, JOB_VISIBILITY_TIMEOUT=60)
+    def handle(self, *args, **options):
+        ready = Job.objects.filter(status='queued', available_at__lte=timezone.now())
+        if ready.exclude(task__startswith=PREFIX).exists():
+            raise CommandError('Other jobs are waiting to run; drain them (run_worker --burst) first.')
+        Job.objects.filter(task__startswith=PREFIX).delete()
+        # The broken jobs fail on purpose; their log lines would only clutter the table
+        logging.getLogger(jobs.__name__).setLevel(logging.CRITICAL)
+        try:
+            self.stdout.write(
+                f'{"workers":>7} {"jobs":>5} {"done":>5} {"dead":>5} {"retries":>7} '
+                f'{"seconds":>8} {"jobs/s":>8}'
+            )
+            for workers in [int(count) for count in options['workers'].split(',')]:
+                self.drain(workers, options)
+            self.lapsed_claim()
+        finally:
+            Job.objects.filter(task__startswith=PREFIX).delete()
+
+    def drain(self, workers, options):
+        _runs.clear()
+        total = options['jobs']
+        sleep = options['task_ms'] / 1000
+        # Every 10th job fails twice before succeeding, every 50th always fails
+        expected = {}
+        for n in range(total):
+            if n % 50 == 49:
+                bench_broken.enqueue(n=n)
+                expected[n] = ('dead', MAX_ATTEMPTS)
+            else:
+                fail_times = 2 if n % 10 == 9 else 0
+                bench_work.enqueue(n=n, sleep=sleep, fail_times=fail_times)
+                expected[n] = ('done', fail_times + 1)
+
+        started = time.perf_counter()
+        jobs.work(workers=workers, batch=options['batch'], poll=0.05, burst=True, name='bench')
+        seconds = time.perf_counter() - started
+
+        outcome = {
+            payload['n']: (status, attempts)
+            for payload, status, attempts in Job.objects.filter(task__startswith=PREFIX).values_list(
+                'payload', 'status', 'attempts',
+            )
+        }
+        problems = []
+        for n, (status, runs) in expected.items():
+            if outcome.get(n) != (status, runs) or _runs.get(n) != runs:
+                problems.append(f'job {n}: expected {status} after {runs} runs, got {outcome.get(n)} '
+                                f'after {_runs.get(n, 0)} runs')
+        statuses = [status for status, _ in outcome.values()]
+        self.stdout.write(
+            f'{workers:>7} {total:>5} {statuses.count("done"):>5} {statuses.count("dead"):>5} '
+            f'{sum(_runs.values()) - total:>7} {seconds:>8.2f} {total / seconds:>8.1f}'
+        )
+        for problem in problems[:10]:
+            self.stderr.write(self.style.ERROR(problem))
+        Job.objects.filter(task__startswith=PREFIX).delete()
+
+    def lapsed_claim(self):
+        """A job claimed by a worker that then died is run again by another"""
+        _runs.clear()
+        bench_work.enqueue(n=0, sleep=0)
+        vanished = jobs.claim('bench-vanished')[0]
+        # Its visibility timeout lapses
+        Job.objects.filter(pk=vanished.pk).update(available_at=timezone.now() - timedelta(seconds=1))
+        jobs.work(workers=1, poll=0.05, burst=True, name='bench')
+        job = Job.objects.get(pk=vanished.pk)
+        # The vanished worker coming back must not overwrite the outcome
+        stale = jobs._settle(vanished, 'queued', error='stale')
+        if job.status == 'done' and job.attempts == 2 and _runs.get(0) == 1 and not stale:
+            self.stdout.write(self.style.SUCCESS('✓ Lapsed claim was run again by another worker'))
+        else:
+            self.stderr.write(self.style.ERROR(
+                f'Lapsed claim: status {job.status}, {job.attempts} attempts, '
+                f'{_runs.get(0, 0)} runs, stale settle updated {stale} rows'
+            ))
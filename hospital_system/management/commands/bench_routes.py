@@ -0,0 +1,249 @@
+"""
+Management command to benchmark every route in hospital_system/urls.py.
+Builds the throwaway sample dataset at each requested scale (rolled back
+afterwards), requests every public, patient, staff and AJAX route (the
+slot-hold POSTs as the booking form sends them) with the in-process test
+client and records p50/p95/p99 latency, query count and peak Python memory
+per route. Results can be saved as a JSON baseline; later runs
+compare against it and fail when a route regresses beyond the tolerance (a
+route that looks slower is re-measured first, keeping its best run).
+
+    python manage.py bench_routes --save-baseline      # record
+    python manage.py bench_routes                      # compare
+"""
+import gc
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from hospital_system.availability import slot_index
+from hospital_system.querymetrics import record_queries
+from hospital_system.refdata import invalidate_all
+from hospital_system.sampledata import build_sample_dataset, sample_calls
+
+
+# 2: cache-database queries counted, slot-hold routes measured as POSTs
+BASELINE_VERSION = 2
+# Latency percentiles checked against the baseline (p99 is reported only: too noisy)
+LATENCY_METRICS = ('p50_ms', 'p95_ms')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentiles(samples):
+    """(p50, p95, p99) of ``samples``"""
+    if len(samples) < 2:
+        return samples[0], samples[0], samples[0]
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def _best(first, second):
+    """Per-metric best of two measurements of the same route"""
+    best = dict(first)
+    for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'peak_kib'):
+        best[metric] = min(first[metric], second[metric])
+    return best
+
+
+def _default_baseline():
+    return os.path.join(settings.BASE_DIR, 'benchmarks', 'route_baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark latency, queries and memory of every route at several dataset scales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1,10,50', help='Comma-separated sample dataset scale factors')
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per route and scale')
+        parser.add_argument('--route', action='append', dest='routes', metavar='NAME',
+                            help='Only benchmark this route (repeatable)')
+        parser.add_argument('--baseline', default=None,
+                            help='Baseline file (default benchmarks/route_baseline.json)')
+        parser.add_argument('--save-baseline', action='store_true', help='Write these results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative growth of p50/p95 latency and peak memory')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Ignore latency growth smaller than this (timer noise)')
+        parser.add_argument('--min-delta-kib', type=float, default=64.0,
+                            help='Ignore peak memory growth smaller than this')
+        parser.add_argument('--confirm', type=int, default=2,
+                            help='Reruns of a route that looks regressed before it counts (noise)')
+        parser.add_argument('--page-cache', action='store_true',
+                            help='Keep the whole-page cache on (measures cache hits for cacheable pages)')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(value) for value in options['scales'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError('--scales takes comma-separated integers, e.g. 1,10,50')
+        if not scales or min(scales) < 1 or options['requests'] < 1:
+            raise CommandError('--scales and --requests must be positive.')
+        path = options['baseline'] or _default_baseline()
+        baseline = None if options['save_baseline'] else self.load(path)
+        if baseline is None and not options['save_baseline']:
+            self.stdout.write(f'No baseline at {path}; rerun with --save-baseline to record one.')
+
+        results, regressions = {}, []
+        with override_settings(QUERY_METRICS_ENABLED=False, PAGE_CACHE_ENABLED=options['page_cache']):
+            for scale in scales:
+                previous = baseline['results'].get(str(scale)) if baseline else None
+                if baseline and previous is None:
+                    self.stdout.write(f'Scale {scale} is not in the baseline.')
+                results[str(scale)] = self.bench_scale(scale, options, previous, regressions)
+
+        if options['save_baseline']:
+            self.save(path, results, options)
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {path}'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+        if baseline:
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {path}.'))
+
+    # Measuring
+    def bench_scale(self, scale, options, previous, regressions):
+        try:
+            with transaction.atomic():
+                results = self.measure_routes(scale, options, previous or {}, regressions)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            # Nothing cached from the rolled-back rows may outlive them
+            slot_index.invalidate()
+            invalidate_all()
+        return results
+
+    def measure_routes(self, scale, options, previous, regressions):
+        dataset = build_sample_dataset(scale=scale)
+        clients = {None: Client(), 'patient': Client(), 'staff': Client()}
+        clients['patient'].force_login(dataset['patient_user'])
+        clients['staff'].force_login(dataset['staff_user'])
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Scale {scale}'))
+        self.stdout.write(
+            f'{"route":<28} {"status":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>7} {"peak KiB":>9}'
+        )
+        results = {}
+        for name, role, call in sample_calls(dataset):
+            if options['routes'] and name not in options['routes']:
+                continue
+            result = self.measure(clients[role], call, options['requests'])
+            problems = self.problems(previous.get(name), result, options)
+            # A slower run on a busy machine is common; keep the best of a few
+            # reruns before calling it a regression
+            for _ in range(options['confirm'] if problems else 0):
+                result = _best(result, self.measure(clients[role], call, options['requests']))
+                problems = self.problems(previous.get(name), result, options)
+                if not problems:
+                    break
+            results[name] = result
+
+            line = (
+                f'{name:<28} {result["status"]:>6} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+                f'{result["p99_ms"]:>8.2f} {result["queries"]:>7} {result["peak_kib"]:>9.0f}'
+            )
+            if problems:
+                regressions.append(f'{name}@{scale}')
+                self.stdout.write(self.style.ERROR(f'{line}  {"; ".join(problems)}'))
+            else:
+                self.stdout.write(line)
+        return results
+
+    def measure(self, client, call, requests):
+        # Warm per-process caches so the numbers reflect steady state
+        call(client)
+
+        with record_queries() as recorder:
+            response = call(client)
+
+        # Separate pass: tracing allocations slows the timed requests down
+        tracemalloc.start()
+        try:
+            call(client)
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call(client)
+            peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+
+        # Start every route from a clean heap so one route's garbage is not
+        # collected on another's clock
+        gc.collect()
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            call(client)
+            samples.append((time.perf_counter() - started) * 1000)
+        p50, p95, p99 = percentiles(samples)
+        return {
+            'status': response.status_code,
+            'p50_ms': round(p50, 3),
+            'p95_ms': round(p95, 3),
+            'p99_ms': round(p99, 3),
+            'queries': recorder.count,
+            'peak_kib': round(max(peak, 0) / 1024, 1),
+        }
+
+    # Baseline
+    def problems(self, previous, result, options):
+        """Ways ``result`` is worse than the baseline entry ``previous``"""
+        if previous is None:
+            return []
+        tolerance = options['tolerance']
+        problems = []
+        for metric in LATENCY_METRICS:
+            old, new = previous[metric], result[metric]
+            if new > old * (1 + tolerance) and new - old > options['min_delta_ms']:
+                problems.append(f'{metric} {old:.2f} -> {new:.2f}')
+        old, new = previous['peak_kib'], result['peak_kib']
+        if new > old * (1 + tolerance) and new - old > options['min_delta_kib']:
+            problems.append(f'peak_kib {old:.0f} -> {new:.0f}')
+        # Query counts are deterministic: any growth is a regression
+        if result['queries'] > previous['queries']:
+            problems.append(f'queries {previous["queries"]} -> {result["queries"]}')
+        if result['status'] != previous['status']:
+            problems.append(f'status {previous["status"]} -> {result["status"]}')
+        return problems
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != BASELINE_VERSION:
+            raise CommandError(f'{path} has baseline format {baseline.get("version")}, expected {BASELINE_VERSION}.')
+        return baseline
+
+    def save(self, path, results, options):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        data = {
+            'version': BASELINE_VERSION,
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'machine': platform.machine(),
+                'database': settings.DATABASES['default']['ENGINE'],
+            },
+            'requests': options['requests'],
+            'page_cache': options['page_cache'],
+            'results': results,
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,99 @@
+"""
+Management command to benchmark full-text search at scale.
+Creates synthetic doctors inside a transaction that is rolled back afterwards,
+indexes them and times ranked searches and the doctors-page search filter.
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from hospital_system import search
+from hospital_system.models import Department, Doctor
+from hospital_system.refdata import invalidate_all
+
+
+FIRST_NAMES = ['Aarav', 'Priya', 'Rahul', 'Sneha', 'Vikram', 'Anita', 'Karan', 'Meera', 'Arjun', 'Divya']
+LAST_NAMES = ['Sharma', 'Patel', 'Rao', 'Iyer', 'Gupta', 'Reddy', 'Nair', 'Mehta', 'Singh', 'Das']
+QUALIFICATIONS = ['MBBS', 'MBBS, MD', 'MBBS, MS', 'MBBS, DM', 'MBBS, MCh', 'MBBS, DNB']
+BIO_WORDS = ['heart', 'kidney', 'surgery', 'pediatric', 'cancer', 'diabetes', 'spine', 'stroke',
+             'transplant', 'laparoscopic', 'robotic', 'arthritis', 'asthma', 'fertility', 'cataract']
+QUERIES = ['sharma', 'cardio', 'robotic surgery', 'mch', 'priya patel', 'kidney transplant', 'zzzz']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ranked full-text search (default 100k doctors)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=100000, help='Synthetic doctors to create')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('Full-text search requires the SQLite backend.')
+        try:
+            with transaction.atomic():
+                self.run(options['doctors'], options['repeat'], options['seed'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            invalidate_all()
+
+    def run(self, total, repeat, seed):
+        rng = random.Random(seed)
+        departments = list(Department.objects.all()) or [
+            Department.objects.create(name='Cardiology', description='Heart care')
+        ]
+
+        started = time.perf_counter()
+        batch = []
+        for i in range(total):
+            batch.append(Doctor(
+                name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}',
+                email=f'bench{i}@example.com', phone='9000000000',
+                qualification=rng.choice(QUALIFICATIONS),
+                specialization=rng.choice(departments),
+                experience_years=rng.randint(1, 40), consultation_fee=500,
+                gender=rng.choice('MF'),
+                bio=' '.join(rng.sample(BIO_WORDS, 4)),
+            ))
+            if len(batch) == 5000:
+                Doctor.objects.bulk_create(batch)
+                batch = []
+        Doctor.objects.bulk_create(batch)
+        counts = search.rebuild()
+        self.stdout.write(
+            f'Created and indexed {total} doctors ({counts}) in {time.perf_counter() - started:.1f}s'
+        )
+
+        for query in QUERIES:
+            samples = self.time(lambda: search.search(query, limit=21), repeat)
+            filter_samples = self.time(
+                lambda: list(search.filter_doctors(Doctor.objects.all(), query)[:20]), repeat
+            )
+            self.stdout.write(
+                f'{query!r:<22} api p50={statistics.median(samples) * 1000:6.2f}ms '
+                f'p95={self.p95(samples) * 1000:6.2f}ms   '
+                f'doctors filter p50={statistics.median(filter_samples) * 1000:6.2f}ms '
+                f'p95={self.p95(filter_samples) * 1000:6.2f}ms'
+            )
+
+    def time(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    def p95(self, samples):
+        samples = sorted(samples)
+        return samples[max(0, int(len(samples) * 0.95) - 1)]
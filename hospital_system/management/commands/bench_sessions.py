@@ -0,0 +1,72 @@
+"""
+Management command to benchmark the logged-in patient pages under each session
+and identity configuration: database sessions with a per-request user query
+(Django's defaults), cached_db sessions with the identity cache, and signed
+cookie sessions with the identity cache. Logs a throwaway patient in once per
+configuration and prints the query count (and how many of those ran on the
+cache database) and median latency of home, patient_dashboard and
+update_profile. The patient is deleted afterwards.
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from hospital_system.models import Patient
+from hospital_system.querymetrics import record_queries
+
+
+CONFIGURATIONS = [
+    ('db sessions, no identity cache', 'django.contrib.sessions.backends.db', False),
+    ('cached_db + identity cache', 'django.contrib.sessions.backends.cached_db', True),
+    ('signed_cookies + identity cache', 'django.contrib.sessions.backends.signed_cookies', True),
+]
+
+PAGES = ['hospital_system:home', 'hospital_system:patient_dashboard', 'hospital_system:update_profile']
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request queries and latency of logged-in pages across session configurations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per page and configuration')
+
+    @override_settings(DEBUG=False, QUERY_METRICS_ENABLED=False, PAGE_CACHE_ENABLED=False)
+    def handle(self, *args, **options):
+        requests = max(1, options['requests'])
+        # Committed, not rolled back: cached_db writes sessions through to the
+        # database and the cache must see the same rows. Deleting the user
+        # removes the patient and drops its cached identity.
+        user = User.objects.create_user('session-bench', 'session-bench@example.com')
+        try:
+            Patient.objects.create(
+                user=user, phone='555-0100', date_of_birth='1980-01-01', gender='O', address='1 Bench Street',
+            )
+            self.stdout.write(f'{"configuration":<34} {"page":<20} {"queries":>7} {"cache":>5} {"median ms":>10}')
+            for label, engine, identity_cache in CONFIGURATIONS:
+                with override_settings(SESSION_ENGINE=engine, IDENTITY_CACHE_ENABLED=identity_cache):
+                    client = Client()
+                    client.force_login(user)
+                    for name in PAGES:
+                        recorder, median = self.measure(client, reverse(name), requests)
+                        self.stdout.write(
+                            f'{label:<34} {name.split(":")[1]:<20} {recorder.count:>7} {recorder.cache_count:>5} {median:>10.2f}'
+                        )
+                    client.logout()
+        finally:
+            user.delete()
+
+    def measure(self, client, url, requests):
+        # First request fills the session and identity caches: steady state after
+        client.get(url)
+        with record_queries() as recorder:
+            client.get(url)
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.get(url)
+            samples.append((time.perf_counter() - started) * 1000)
+        return recorder, statistics.median(samples)
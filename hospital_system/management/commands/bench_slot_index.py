@@ -0,0 +1,74 @@
+"""
+Management command to benchmark the slot availability index.
+Builds synthetic grids of half-hour bookings and schedules (the default
+Monday to Saturday, 9 AM to 5 PM hours) in memory, with no database rows, and
+times single-day and date-range lookups.
+"""
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from hospital_system.availability import (
+    DEFAULT_HOURS, DEFAULT_SLOT_MINUTES, DEFAULT_WEEKDAYS, SLOT_TIMES, DayBookings, DoctorSchedule, SlotIndex,
+    interval,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark slot availability lookups at scale (default 10k doctors x 90 days)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=10000, help='Number of doctors')
+        parser.add_argument('--days', type=int, default=90, help='Days in the booking window')
+        parser.add_argument('--fill', type=float, default=0.4, help='Fraction of slots already booked')
+        parser.add_argument('--lookups', type=int, default=100000, help='Number of lookups to time')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        doctors, days, fill = options['doctors'], options['days'], options['fill']
+        lookups = options['lookups']
+        start = date.today()
+        intervals = [interval(value, DEFAULT_SLOT_MINUTES) for value in SLOT_TIMES]
+        schedule = DoctorSchedule(DEFAULT_SLOT_MINUTES, {weekday: [DEFAULT_HOURS] for weekday in DEFAULT_WEEKDAYS})
+
+        index = SlotIndex(ttl=float('inf'))
+        build_started = time.perf_counter()
+        for doctor_id in range(1, doctors + 1):
+            grid = {}
+            for offset in range(days):
+                grid[start + timedelta(days=offset)] = DayBookings(
+                    [pair for pair in intervals if rng.random() < fill]
+                )
+            index.prime(doctor_id, start, grid, schedule)
+        build_seconds = time.perf_counter() - build_started
+        self.stdout.write(f'Built {doctors} doctors x {days} days in {build_seconds:.2f}s')
+
+        samples = []
+        for _ in range(lookups):
+            doctor_id = rng.randint(1, doctors)
+            day = start + timedelta(days=rng.randrange(days))
+            t0 = time.perf_counter()
+            index.free_slots(doctor_id, day)
+            samples.append(time.perf_counter() - t0)
+        self._report('free_slots (one day)', samples)
+
+        samples = []
+        for _ in range(max(1, lookups // 10)):
+            doctor_id = rng.randint(1, doctors)
+            t0 = time.perf_counter()
+            index.free_slots_range(doctor_id, start, start + timedelta(days=days - 1))
+            samples.append(time.perf_counter() - t0)
+        self._report(f'free_slots_range ({days} days)', samples)
+
+    def _report(self, label, samples):
+        samples.sort()
+        p50 = statistics.median(samples)
+        p99 = samples[int(len(samples) * 0.99) - 1]
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: n={len(samples)} p50={p50 * 1e6:.1f}us p99={p99 * 1e6:.1f}us '
+            f'throughput={len(samples) / sum(samples):,.0f}/s'
+        ))
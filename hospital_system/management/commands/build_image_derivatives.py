@@ -0,0 +1,83 @@
+"""
+Management command to (re)generate resized and WebP image derivatives.
+Backfills image_variants for doctor and department images uploaded before
+the derivative pipeline existed (or after DERIVATIVE_WIDTHS changed), doing
+the image work in a thread pool and the database updates in bulk.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from hospital_system.imaging import build_derivatives, downscale
+from hospital_system.models import Department, Doctor
+from hospital_system.refdata import bump_version
+
+
+MODELS = {'doctors': Doctor, 'departments': Department}
+
+
+def _process(name, shrink):
+    """(stored name, variants) for one image file"""
+    with default_storage.open(name, 'rb') as f:
+        data = f.read()
+    if shrink:
+        smaller = downscale(data)
+        if smaller is not None:
+            data = smaller
+            name = default_storage.save(name, ContentFile(data))
+    return name, build_derivatives(name, data)
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail and WebP derivatives for existing doctor and department images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type',
+            choices=['doctors', 'departments', 'both'],
+            default='both',
+            help='Which images to process'
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Parallel image workers')
+        parser.add_argument('--force', action='store_true', help='Regenerate even when derivatives are current')
+        parser.add_argument('--downscale', action='store_true',
+                            help='Also replace originals larger than IMAGE_MAX_DIMENSION')
+
+    def handle(self, *args, **options):
+        kinds = ['doctors', 'departments'] if options['type'] == 'both' else [options['type']]
+        for kind in kinds:
+            self.process_model(kind, MODELS[kind], options)
+
+    def process_model(self, label, model, options):
+        rows = model.objects.exclude(image='').exclude(image__isnull=True).values_list('pk', 'image', 'image_variants')
+        pending = [
+            (pk, name) for pk, name, variants in rows
+            if options['force'] or options['downscale'] or (variants or {}).get('name') != name
+        ]
+        if not pending:
+            self.stdout.write(f'{label}: derivatives up to date')
+            return
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = {pool.submit(_process, name, options['downscale']): (pk, name) for pk, name in pending}
+            for future in as_completed(futures):
+                pk, name = futures[future]
+                try:
+                    stored_name, variants = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'  ✗ {name}: {e}'))
+                    continue
+                model.objects.filter(pk=pk).update(image=stored_name, image_variants=variants)
+                if stored_name != name:
+                    # The downscaled copy replaces the oversized original
+                    default_storage.delete(name)
+                done += 1
+
+        # update() skips the signals that purge cached pages and reference data
+        if done:
+            bump_version(model._meta.label_lower)
+        self.stdout.write(self.style.SUCCESS(f'{label}: {done} processed, {failed} failed'))
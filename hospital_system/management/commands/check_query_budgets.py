@@ -0,0 +1,86 @@
+"""
+Management command that enforces the per-view SQL query budgets.
+Requests every named route in hospital_system/urls.py (the slot-hold POSTs
+included) against a throwaway
+sample dataset (rolled back afterwards) and fails when a view runs more
+queries than its budget in urls.QUERY_BUDGETS (cache-database statements
+included) or repeats the same-shape query (an N+1 pattern).
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from hospital_system.availability import slot_index
+from hospital_system.querymetrics import record_queries
+from hospital_system.refdata import invalidate_all
+from hospital_system.sampledata import build_sample_dataset, sample_calls
+from hospital_system.urls import QUERY_BUDGETS
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Check every view against its declared SQL query budget and for N+1 queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=2, help='Sample dataset scale factor')
+        parser.add_argument('--verbose-sql', action='store_true', help='Print repeated statements for every view')
+
+    # The command reports on its own, so skip the middleware's log warnings.
+    # Whole-page cache hits would hide the views' own queries.
+    @override_settings(QUERY_METRICS_ENABLED=False, PAGE_CACHE_ENABLED=False)
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                failures = self.check_budgets(options['scale'], options['verbose_sql'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            # Nothing cached from the rolled-back rows may outlive them
+            slot_index.invalidate()
+            invalidate_all()
+
+        if failures:
+            raise CommandError(f'{len(failures)} view(s) failed: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All views are within their query budgets.'))
+
+    def check_budgets(self, scale, verbose_sql):
+        dataset = build_sample_dataset(scale=scale)
+        clients = {None: Client(), 'patient': Client(), 'staff': Client()}
+        clients['patient'].force_login(dataset['patient_user'])
+        clients['staff'].force_login(dataset['staff_user'])
+
+        failures = []
+        for name, role, call in sample_calls(dataset):
+            client = clients[role]
+            # Warm per-process caches so the budget reflects steady state
+            call(client)
+            with record_queries() as recorder:
+                response = call(client)
+
+            budget = QUERY_BUDGETS.get(name)
+            suspects = recorder.n_plus_one_suspects()
+            problems = []
+            if budget is None:
+                problems.append('no budget declared')
+            elif recorder.count > budget:
+                problems.append(f'over budget ({budget})')
+            if suspects:
+                problems.append('N+1 suspect')
+
+            line = (
+                f'{name:<28} {response.status_code} {recorder.count:>3} queries ({recorder.cache_count} cache)'
+                f'  {recorder.seconds * 1000:7.1f}ms  budget={budget}'
+            )
+            if problems:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'{line}  {"; ".join(problems)}'))
+            else:
+                self.stdout.write(line)
+            if problems or verbose_sql:
+                for sql, n in recorder.duplicates():
+                    self.stdout.write(f'    x{n}: {sql}')
+        return failures
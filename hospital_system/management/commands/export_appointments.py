@@ -0,0 +1,59 @@
+"""
+Management command to export appointments as CSV or JSONL.
+Streams rows from a chunked database cursor straight to the output file (or
+stdout), so memory use does not grow with the table. The output can be read
+back with `import_appointments`.
+
+    python manage.py export_appointments --output appointments.csv
+    python manage.py export_appointments --format jsonl --from 2025-01-01 --status completed
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital_system import transfer
+
+
+class Command(BaseCommand):
+    help = 'Stream appointments to a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='Output file (default stdout)')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='Output format (default: from the --output extension, else csv)')
+        parser.add_argument('--from', dest='from', help='First appointment date (YYYY-MM-DD)')
+        parser.add_argument('--to', help='Last appointment date (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Only appointments with this status')
+        parser.add_argument('--doctor', help='Only this doctor id')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or _format_from_path(output) or 'csv'
+        try:
+            filters = transfer.export_filters(options)
+        except ValueError as e:
+            raise CommandError(f'Invalid filter: {e}')
+
+        rows = transfer.export_queryset(**filters)
+        chunks = transfer.export_lines(rows, fmt, chunk_size=options['chunk_size'])
+        started = time.perf_counter()
+        if output == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        written = 0
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Wrote {output} ({written / 1024 / 1024:.1f} MiB) in {time.perf_counter() - started:.1f}s'
+        ))
+
+
+def _format_from_path(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return extension if extension in transfer.FORMATS else None
@@ -0,0 +1,68 @@
+"""
+Management command to bulk-import appointments from CSV or JSONL.
+Takes the columns `export_appointments` writes (id, created_at and updated_at
+are ignored: imported rows get new ones; service_id and duration_minutes may
+be left out). Rows are validated and inserted in batches, each committed on
+its own; invalid rows, rows whose doctor/date/time slot is already taken and
+scheduled rows that overlap another scheduled appointment of the doctor are
+skipped and reported.
+
+    python manage.py import_appointments appointments.csv --dry-run
+    python manage.py import_appointments appointments.jsonl
+"""
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital_system import transfer
+
+
+class Command(BaseCommand):
+    help = 'Validate and bulk-insert appointments from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file, or - for stdin')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows validated and inserted per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Run every check, then roll the import back')
+        parser.add_argument('--show', type=int, default=20, help='Rejected rows to list')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in transfer.FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}; pass --format {" or ".join(transfer.FORMATS)}.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        started = time.perf_counter()
+        if path == '-':
+            result = self.run(sys.stdin, fmt, options)
+        else:
+            try:
+                f = open(path, encoding='utf-8-sig', newline='')
+            except OSError as e:
+                raise CommandError(f'Cannot read {path}: {e}')
+            with f:
+                result = self.run(f, fmt, options)
+        elapsed = time.perf_counter() - started
+
+        for line, message in result.errors[:options['show']]:
+            self.stdout.write(self.style.ERROR(f'line {line}: {message}'))
+        for line in result.conflicts[:max(0, options['show'] - len(result.errors))]:
+            self.stdout.write(self.style.WARNING(f'line {line}: slot already booked'))
+
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        summary = (
+            f'{verb} {result.created} appointments in {elapsed:.1f}s; '
+            f'{result.conflict_count} slot conflicts, {result.error_count} invalid rows skipped'
+        )
+        style = self.style.SUCCESS if not (result.conflict_count or result.error_count) else self.style.WARNING
+        self.stdout.write(style(summary))
+
+    def run(self, f, fmt, options):
+        records = transfer.read_records(f, fmt)
+        return transfer.import_appointments(records, batch_size=options['batch_size'], dry_run=options['dry_run'])
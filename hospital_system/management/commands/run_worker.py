@@ -0,0 +1,50 @@
+"""
+Management command to run background jobs (see hospital_system/jobs.py).
+Starts ``--workers`` worker threads that claim and run queued jobs until
+the process gets SIGINT or SIGTERM; jobs already running are finished
+first. With ``--burst`` it exits once nothing is ready to run, which suits
+cron and scripts. Tasks are loaded from every installed app's ``tasks``
+module.
+"""
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import autodiscover_modules
+
+from hospital_system import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Concurrent worker threads')
+        parser.add_argument('--batch', type=int, default=1, help='Jobs claimed at a time per worker')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds an idle worker waits between checks')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is ready')
+        parser.add_argument('--name', help='Worker name recorded on claimed jobs (default: random)')
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        stop = threading.Event()
+
+        def shut_down(signum, frame):
+            self.stdout.write('Stopping after the running jobs...')
+            stop.set()
+
+        signal.signal(signal.SIGINT, shut_down)
+        signal.signal(signal.SIGTERM, shut_down)
+
+        self.stdout.write(f'{options["workers"]} workers, {len(jobs.TASKS)} tasks: {", ".join(sorted(jobs.TASKS))}')
+        started = time.perf_counter()
+        loops = jobs.work(
+            workers=max(1, options['workers']), batch=options['batch'], poll=options['poll'],
+            burst=options['burst'], stop=stop, name=options['name'],
+        )
+        succeeded = sum(loop.succeeded for loop in loops)
+        failed = sum(loop.failed for loop in loops)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {succeeded} jobs done, {failed} failed in {time.perf_counter() - started:.1f}s'
+        ))
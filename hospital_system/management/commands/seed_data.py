@@ -1,11 +1,59 @@
-from django.core.management.base import BaseCommand
-from hospital_system.models import Hospital, Department, Doctor, Service, Infrastructure, Testimonial
+"""
+Management command to seed the database.
+Without options it creates the demo hospital, departments, doctors, services
+and infrastructure. With --doctors, --patients, --appointments or
+--testimonials it then generates a deterministic load-testing dataset on top
+(see hospital_system/datagen.py), inserted in chunks of plain executemany
+INSERTs, one transaction per chunk, so memory stays flat however many rows are
+asked for.
+
+    python manage.py seed_data --doctors 100000 --patients 1000000 --appointments 10000000
+"""
+import time
+from array import array
+from datetime import date
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from hospital_system import datagen, search
+from hospital_system.availability import slot_index
+from hospital_system.models import (
+    Hospital, Department, Doctor, Patient, Appointment, Service, Infrastructure, Testimonial, WeeklyShift
+)
+from hospital_system.schedules import shifts_from_availability
+from hospital_system.refdata import invalidate_all
+
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5
 
 
 class Command(BaseCommand):
     help = 'Seed database with sample hospital, departments, doctors, services and infra'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=0, help='Synthetic doctors to generate')
+        parser.add_argument('--patients', type=int, default=0, help='Synthetic patients to generate')
+        parser.add_argument('--appointments', type=int, default=0,
+                            help='Synthetic appointments to generate (needs --doctors)')
+        parser.add_argument('--testimonials', type=int, default=None,
+                            help='Synthetic testimonials (default: 2%% of appointments, else one per doctor)')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Bookable days the appointments are spread over, ending 30 days from today')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Rows per INSERT transaction')
+
     def handle(self, *args, **options):
+        generate = any(options[name] for name in ('doctors', 'patients', 'appointments', 'testimonials'))
+        if generate:
+            self.check_generator_options(options)
+        self.seed_reference_data()
+        if generate:
+            self.generate(options)
+
+    def seed_reference_data(self):
         # Create Hospital
         hospital, _ = Hospital.objects.get_or_create(
             name='Arogya Medical Center',
@@ -46,7 +94,7 @@ class Command(BaseCommand):
             doc_name = f"Dr. {d.name.split()[0]} Expert"
             doc_email = f"{d.name.lower()}@apollomedical.com".replace(' ', '')
             doc_phone = f"90000000{i:02d}"
-            doctor, created = Doctor.objects.get_or_create(
+            doctor, _ = Doctor.objects.get_or_create(
                 name=doc_name,
                 defaults={
                     'email': doc_email,
@@ -84,7 +132,113 @@ class Command(BaseCommand):
             Infrastructure.objects.get_or_create(name=name, hospital=hospital, defaults={'description': desc, 'icon': icon})
 
         # Testimonials
-        Testimonial.objects.get_or_create(patient_name='Ravi Patel', defaults={'patient_message': 'Excellent care and friendly staff.', 'rating': 5, 'is_published': True})
-        Testimonial.objects.get_or_create(patient_name='Sneha Rao', defaults={'patient_message': 'Very experienced doctors and smooth process.', 'rating': 4, 'is_published': True})
+        Testimonial.objects.get_or_create(patient_name='Ravi Patel', doctor=None, defaults={'patient_message': 'Excellent care and friendly staff.', 'rating': 5, 'is_published': True})
+        Testimonial.objects.get_or_create(patient_name='Sneha Rao', doctor=None, defaults={'patient_message': 'Very experienced doctors and smooth process.', 'rating': 4, 'is_published': True})
 
         self.stdout.write(self.style.SUCCESS('Sample data seeded successfully.'))
+
+    # Generator mode
+    def check_generator_options(self, options):
+        if min(options['doctors'], options['patients'], options['appointments'], options['testimonials'] or 0) < 0:
+            raise CommandError('Row counts cannot be negative.')
+        if options['chunk_size'] < 1 or options['days'] < 1:
+            raise CommandError('--chunk-size and --days must be positive.')
+        if options['testimonials'] is None:
+            options['testimonials'] = options['appointments'] // 50 or options['doctors']
+        if (options['appointments'] or options['testimonials']) and not options['doctors']:
+            raise CommandError('Generated appointments and testimonials need --doctors.')
+        capacity = datagen.appointment_capacity(options['seed'], options['doctors'], date.today(), options['days'])
+        if options['appointments'] > capacity:
+            raise CommandError(
+                f"{options['appointments']:,} appointments do not fit the {capacity:,} slots "
+                f"{options['doctors']:,} doctors offer over {options['days']} days; raise --doctors or --days."
+            )
+
+    def generate(self, options):
+        seed, chunk_size, today = options['seed'], options['chunk_size'], date.today()
+        started = time.perf_counter()
+        departments = list(Department.objects.order_by('pk').values_list('pk', 'name'))
+
+        # Only generated doctors take generated appointments, so no slot can
+        # clash with a booking that already exists.
+        doctors = []
+
+        def keep_doctors(created):
+            doctors.extend(created.values_list('pk', 'specialization_id', 'availability', 'slot_minutes'))
+
+        self.insert(
+            'doctors', Doctor, datagen.DOCTOR_FIELDS,
+            datagen.doctor_rows(seed, options['doctors'], departments),
+            options['doctors'], chunk_size, keep=keep_doctors,
+        )
+        self.insert(
+            'shifts', WeeklyShift, datagen.SHIFT_FIELDS,
+            datagen.shift_rows((pk, text) for pk, _, text, _ in doctors),
+            sum(len(shifts_from_availability(text)) for _, _, text, _ in doctors), chunk_size,
+        )
+        # Patient pks as 8-byte machine integers: 8 MB per million
+        patients = array('q')
+        self.insert(
+            'patients', Patient, datagen.PATIENT_FIELDS,
+            datagen.patient_rows(seed, options['patients'], today),
+            options['patients'], chunk_size,
+            keep=lambda created: patients.extend(created.values_list('pk', flat=True)),
+        )
+        self.insert(
+            'appointments', Appointment, datagen.APPOINTMENT_FIELDS,
+            datagen.appointment_rows(seed, options['appointments'], doctors, patients, today, options['days']),
+            options['appointments'], chunk_size,
+        )
+        self.insert(
+            'testimonials', Testimonial, datagen.TESTIMONIAL_FIELDS,
+            datagen.testimonial_rows(
+                seed, options['testimonials'], [pk for pk, *_ in doctors],
+                options['patients'] or max(1, options['appointments'] // 8),
+            ),
+            options['testimonials'], chunk_size,
+        )
+
+        # Raw inserts skip the signals that maintain the search index and
+        # invalidate cached pages, reference data and slot grids
+        if doctors:
+            self.stdout.write('Indexing generated doctors for search...')
+            search.index_objects('doctor', Doctor.objects.filter(pk__gte=min(pk for pk, *_ in doctors)))
+        invalidate_all()
+        slot_index.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated dataset (seed {seed}) in {time.perf_counter() - started:.1f}s.'
+        ))
+
+    def insert(self, label, model, fields, rows, total, chunk_size, keep=None):
+        """Insert ``rows`` in ``chunk_size`` transactions, reporting progress
+
+        ``keep`` receives a queryset of each chunk's new rows.
+        """
+        if not total:
+            return
+        with datagen.deferred_indexes(model):
+            self.insert_chunks(label, model, fields, rows, total, chunk_size, keep)
+            if model._meta.indexes:
+                self.stdout.write(f'  {label:<13} rebuilding {len(model._meta.indexes)} indexes...')
+
+    def insert_chunks(self, label, model, fields, rows, total, chunk_size, keep):
+        started = last_report = time.perf_counter()
+        done = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+                datagen.insert_rows(model, fields, chunk)
+                if keep is not None:
+                    keep(model.objects.filter(pk__gt=last_pk).order_by('pk'))
+            done += len(chunk)
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL or done == total:
+                last_report = now
+                self.stdout.write(
+                    f'  {label:<13} {done:>12,} / {total:,}  {done * 100 // total:>3}%  '
+                    f'{done / max(now - started, 1e-9):>9,.0f} rows/s'
+                )
@@ -0,0 +1,17 @@
+"""
+Management command to delete expired slot holds. Expired holds already stop
+counting the moment they expire; this only keeps the table small on sites
+where holds are placed too rarely for the booking form's own sweep to run.
+Suitable for cron.
+"""
+from django.core.management.base import BaseCommand
+
+from hospital_system.holds import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Delete expired slot holds'
+
+    def handle(self, *args, **options):
+        deleted = sweep_expired_holds(force=True)
+        self.stdout.write(self.style.SUCCESS(f'✓ Deleted {deleted} expired slot holds'))
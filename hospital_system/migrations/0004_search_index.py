@@ -0,0 +1,46 @@
+# FTS5 full-text index for doctors, departments and services (SQLite only)
+
+from django.db import migrations
+
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS hospital_system_search USING fts5("
+    "kind UNINDEXED, object_id UNINDEXED, title, subtitle, body, "
+    "tokenize = 'porter unicode61')",
+    # Weighted bm25 as the table's default rank: names, then department, then text
+    "INSERT INTO hospital_system_search(hospital_system_search, rank) "
+    "VALUES ('rank', 'bm25(0.0, 0.0, 10.0, 4.0, 1.0)')",
+    # rowid = pk * 4 + kind code (doctor 1, department 2, service 3)
+    "INSERT INTO hospital_system_search (rowid, kind, object_id, title, subtitle, body) "
+    "SELECT d.id * 4 + 1, 'doctor', d.id, d.name, dep.name, d.qualification || ' ' || d.bio "
+    "FROM hospital_system_doctor d JOIN hospital_system_department dep ON dep.id = d.specialization_id",
+    "INSERT INTO hospital_system_search (rowid, kind, object_id, title, subtitle, body) "
+    "SELECT id * 4 + 2, 'department', id, name, head_doctor, description FROM hospital_system_department",
+    "INSERT INTO hospital_system_search (rowid, kind, object_id, title, subtitle, body) "
+    "SELECT s.id * 4 + 3, 'service', s.id, s.name, dep.name, s.description "
+    "FROM hospital_system_service s JOIN hospital_system_department dep ON dep.id = s.department_id",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS hospital_system_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0003_department_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
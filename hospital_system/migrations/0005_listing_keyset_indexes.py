@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['name', 'id'], name='doctor_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['specialization', 'name', 'id'], name='doctor_dept_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['name', 'id'], name='service_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['department', 'name', 'id'], name='service_dept_name_id_idx'),
+        ),
+    ]
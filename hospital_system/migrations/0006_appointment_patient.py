@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0005_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='patient',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='hospital_system.patient'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_date', 'appointment_time', 'id'], name='appointment_patient_date_idx'),
+        ),
+    ]
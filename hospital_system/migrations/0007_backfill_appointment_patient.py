@@ -0,0 +1,41 @@
+# Link existing appointments to the patient that booked them, matched by email
+
+from collections import defaultdict
+
+from django.db import migrations
+
+
+BATCH_SIZE = 500
+
+
+def link_appointments(apps, schema_editor):
+    Patient = apps.get_model('hospital_system', 'Patient')
+    Appointment = apps.get_model('hospital_system', 'Appointment')
+
+    patients_by_email = defaultdict(list)
+    for pk, email in Patient.objects.values_list('pk', 'email'):
+        patients_by_email[email.strip().lower()].append(pk)
+    # An email shared by several patients cannot say whose booking it was
+    owners = {email: pks[0] for email, pks in patients_by_email.items() if len(pks) == 1}
+
+    appointments_by_patient = defaultdict(list)
+    unlinked = Appointment.objects.filter(patient__isnull=True).values_list('pk', 'patient_email')
+    for pk, email in unlinked.iterator(chunk_size=2000):
+        patient_id = owners.get(email.strip().lower())
+        if patient_id is not None:
+            appointments_by_patient[patient_id].append(pk)
+
+    for patient_id, pks in appointments_by_patient.items():
+        for start in range(0, len(pks), BATCH_SIZE):
+            Appointment.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).update(patient_id=patient_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0006_appointment_patient'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_appointments, migrations.RunPython.noop),
+    ]
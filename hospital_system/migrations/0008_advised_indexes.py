@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0007_backfill_appointment_patient'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'id'], name='appointment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['registered_at', 'id'], name='patient_registered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=models.Index(fields=['is_published', 'created_at'], name='testimonial_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=models.Index(fields=['created_at', 'id'], name='testimonial_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0008_advised_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='department',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
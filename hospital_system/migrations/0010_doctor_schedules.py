@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:54
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import hospital_system.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0009_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='slot_minutes',
+            field=models.PositiveSmallIntegerField(default=30, help_text='Length of one appointment slot, a multiple of 5 minutes', validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(240), hospital_system.models.validate_on_slot_grid]),
+        ),
+        migrations.CreateModel(
+            name='WeeklyShift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_shifts', to='hospital_system.doctor')),
+            ],
+            options={
+                'ordering': ['doctor', 'weekday', 'start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('doctor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='hospital_system.doctor')),
+            ],
+            options={
+                'ordering': ['doctor', 'date', 'start_time'],
+                'indexes': [models.Index(fields=['doctor', 'date'], name='schedule_exception_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,128 @@
+# Turn each doctor's free-text availability into weekly shifts
+
+import re
+from datetime import time
+
+from django.db import migrations
+
+
+BATCH_SIZE = 2000
+
+# The availability parser as it was when this migration was written
+# (hospital_system/schedules.py), so later changes to it cannot change what
+# the migration does
+DEFAULT_WEEKDAYS = (0, 1, 2, 3, 4, 5)
+DEFAULT_HOURS = (time(9), time(17))
+
+_WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+_DAY = r'\b(mon|tue|wed|thu|fri|sat|sun)[a-z]*\b'
+_DAY_RANGE = re.compile(rf'{_DAY}(?:\s*(?:-|–|to|through|thru)\s*{_DAY})?')
+_DAY_GROUPS = {
+    r'\bdaily\b|\bevery\s*day\b|\ball\s+days\b': range(7),
+    r'\bweekdays\b': range(5),
+    r'\bweekends?\b': (5, 6),
+}
+_TIME = r'(\d{1,2})(?:[:.](\d{2}))?(?:\s*([ap])\.?m\b\.?)?'
+_TIME_RANGE = re.compile(rf'\b{_TIME}\s*(?:-|–|to)\s*{_TIME}')
+
+
+def _clock(hour, minute, meridiem):
+    """Minutes after midnight, or None when out of range"""
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == 'p' else 0)
+    if hour > 24 or minute > 59 or hour * 60 + minute > 24 * 60:
+        return None
+    return hour * 60 + minute
+
+
+def _window(groups):
+    """(start, end) times of one matched time range, or None"""
+    start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = groups
+    end = _clock(end_hour, end_minute, end_meridiem)
+    if end is None:
+        return None
+    # "9-5pm": the start takes the end's am/pm unless that puts it after the end
+    start = _clock(start_hour, start_minute, start_meridiem or end_meridiem)
+    if start is not None and not start_meridiem and end_meridiem and start >= end:
+        start = _clock(start_hour, start_minute, 'a')
+    # "9-5" without am/pm: afternoon end
+    if start is not None and not end_meridiem and end <= start and end + 12 * 60 <= 24 * 60:
+        end += 12 * 60
+    if start is None or end <= start:
+        return None
+    end = min(end, 24 * 60 - 1)
+    return time(start // 60, start % 60), time(end // 60, end % 60)
+
+
+def parse_availability(text):
+    """[(weekday, start, end), ...] read from an availability string, or None
+
+    Missing days default to Monday to Saturday and missing hours to 9 AM to
+    5 PM (the grid every doctor had before schedules). Returns None when the
+    text names neither days nor hours.
+    """
+    text = (text or '').lower()
+    windows = []
+    for match in _TIME_RANGE.finditer(text):
+        window = _window(match.groups())
+        if window and window not in windows:
+            windows.append(window)
+    rest = _TIME_RANGE.sub(' ', text)
+
+    days = set()
+    for pattern, group in _DAY_GROUPS.items():
+        if re.search(pattern, rest):
+            days.update(group)
+    for first, last in _DAY_RANGE.findall(rest):
+        first = _WEEKDAYS.index(first)
+        if not last:
+            days.add(first)
+            continue
+        last = _WEEKDAYS.index(last)
+        # Ranges may wrap: "Fri-Mon"
+        days.update((first + offset) % 7 for offset in range((last - first) % 7 + 1))
+
+    if not days and not windows:
+        return None
+    return [
+        (weekday, start, end)
+        for weekday in sorted(days) or DEFAULT_WEEKDAYS
+        for start, end in windows or [DEFAULT_HOURS]
+    ]
+
+
+def shifts_from_availability(text):
+    shifts = parse_availability(text)
+    if shifts is None:
+        shifts = [(weekday, *DEFAULT_HOURS) for weekday in DEFAULT_WEEKDAYS]
+    return shifts
+
+
+def create_shifts(apps, schema_editor):
+    Doctor = apps.get_model('hospital_system', 'Doctor')
+    WeeklyShift = apps.get_model('hospital_system', 'WeeklyShift')
+
+    # Text that names neither days nor hours keeps the grid every doctor had
+    # until now: Monday to Saturday, 9 AM to 5 PM
+    shifts = []
+    for pk, availability in Doctor.objects.values_list('pk', 'availability').iterator(chunk_size=BATCH_SIZE):
+        for weekday, start, end in shifts_from_availability(availability):
+            shifts.append(WeeklyShift(doctor_id=pk, weekday=weekday, start_time=start, end_time=end))
+        if len(shifts) >= BATCH_SIZE:
+            WeeklyShift.objects.bulk_create(shifts)
+            shifts = []
+    WeeklyShift.objects.bulk_create(shifts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0010_doctor_schedules'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_shifts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:03
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import hospital_system.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0011_weekly_shifts_from_availability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='duration_minutes',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(480), hospital_system.models.validate_on_slot_grid]),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='service',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='hospital_system.service'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='duration_minutes',
+            field=models.PositiveSmallIntegerField(default=30, help_text='How long an appointment for this service lasts', validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(480), hospital_system.models.validate_on_slot_grid]),
+        ),
+    ]
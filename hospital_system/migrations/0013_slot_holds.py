@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0012_appointment_durations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32, unique=True)),
+                ('appointment_date', models.DateField()),
+                ('appointment_time', models.TimeField()),
+                ('duration_minutes', models.PositiveSmallIntegerField(default=30)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('doctor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='hospital_system.doctor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor', 'appointment_date'], name='slot_hold_doctor_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital_system', '0015_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slothold',
+            name='client',
+            field=models.CharField(blank=True, db_index=True, max_length=45),
+        ),
+    ]
@@ -1,7 +1,23 @@
-from django.db import models
-from django.core.validators import RegexValidator
+from django.db import models, router
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
 from django.contrib.auth.models import User
 
+from .availability import SLOT_UNIT_MINUTES
+
+
+def validate_on_slot_grid(minutes):
+    if minutes % SLOT_UNIT_MINUTES:
+        raise ValidationError(f'Use a multiple of {SLOT_UNIT_MINUTES} minutes.')
+
+
+def _validate_window(start_time, end_time):
+    for value in (start_time, end_time):
+        if value is not None and (value.minute % SLOT_UNIT_MINUTES or value.second):
+            raise ValidationError(f'Times must fall on a {SLOT_UNIT_MINUTES}-minute boundary.')
+    if start_time is not None and end_time is not None and end_time <= start_time:
+        raise ValidationError('The end time must be after the start time.')
+
 # Hospital Model
 class Hospital(models.Model):
     name = models.CharField(max_length=200)
@@ -30,6 +46,8 @@ class Department(models.Model):
     description = models.TextField()
     icon = models.CharField(max_length=50, default='stethoscope', help_text='Font Awesome icon name')
     image = models.ImageField(upload_to='departments/', blank=True, null=True, help_text='Department image or AI-generated picture')
+    # Generated resized/WebP copies of image (see imaging.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     head_doctor = models.CharField(max_length=150, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -56,9 +74,16 @@ class Doctor(models.Model):
     experience_years = models.IntegerField()
     consultation_fee = models.DecimalField(max_digits=8, decimal_places=2)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
+    # Display text; bookable hours come from weekly_shifts and schedule_exceptions
     availability = models.CharField(max_length=100, default='Monday to Saturday')
+    slot_minutes = models.PositiveSmallIntegerField(
+        default=30,
+        validators=[MinValueValidator(SLOT_UNIT_MINUTES), MaxValueValidator(240), validate_on_slot_grid],
+        help_text=f'Length of one appointment slot, a multiple of {SLOT_UNIT_MINUTES} minutes',
+    )
     bio = models.TextField(blank=True)
     image = models.ImageField(upload_to='doctors/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_available = models.BooleanField(default=True)
     
     def __str__(self):
@@ -66,6 +91,67 @@ class Doctor(models.Model):
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Keyset pagination of the doctors listing, with and without a department filter
+            models.Index(fields=['name', 'id'], name='doctor_name_id_idx'),
+            models.Index(fields=['specialization', 'name', 'id'], name='doctor_dept_name_id_idx'),
+        ]
+
+
+# Doctor Schedule Models
+class WeeklyShift(models.Model):
+    """Hours a doctor works every week on one weekday; several rows make a split day"""
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+        (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday'),
+    ]
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='weekly_shifts')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+    def clean(self):
+        _validate_window(self.start_time, self.end_time)
+
+    class Meta:
+        ordering = ['doctor', 'weekday', 'start_time']
+
+
+class ScheduleException(models.Model):
+    """A date on which a doctor's weekly shifts do not apply
+
+    Without times the doctor is on leave all day. With times, the rows for
+    that date replace the weekly shifts for the day.
+    """
+    # Indexed through schedule_exception_date_idx below
+    doctor = models.ForeignKey(
+        Doctor, on_delete=models.CASCADE, related_name='schedule_exceptions', db_index=False,
+    )
+    date = models.DateField()
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    reason = models.CharField(max_length=200, blank=True)
+
+    def __str__(self):
+        if self.start_time is None:
+            return f"{self.date}: leave"
+        return f"{self.date}: {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+    def clean(self):
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValidationError('Give both a start and an end time, or neither for a day off.')
+        _validate_window(self.start_time, self.end_time)
+
+    class Meta:
+        ordering = ['doctor', 'date', 'start_time']
+        indexes = [
+            # Schedule loads read a doctor's exceptions from today onwards
+            models.Index(fields=['doctor', 'date'], name='schedule_exception_date_idx'),
+        ]
 
 
 # Service/Treatment Model
@@ -74,10 +160,22 @@ class Service(models.Model):
     description = models.TextField()
     department = models.ForeignKey(Department, on_delete=models.CASCADE)
     cost_estimate = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    duration_minutes = models.PositiveSmallIntegerField(
+        default=30,
+        validators=[MinValueValidator(SLOT_UNIT_MINUTES), MaxValueValidator(480), validate_on_slot_grid],
+        help_text='How long an appointment for this service lasts',
+    )
     
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the services listing, with and without a department filter
+            models.Index(fields=['name', 'id'], name='service_name_id_idx'),
+            models.Index(fields=['department', 'name', 'id'], name='service_dept_name_id_idx'),
+        ]
+
 
 # Patient Model
 class Patient(models.Model):
@@ -106,6 +204,10 @@ class Patient(models.Model):
     
     class Meta:
         ordering = ['-registered_at']
+        indexes = [
+            # Default ordering (admin changelist)
+            models.Index(fields=['registered_at', 'id'], name='patient_registered_idx'),
+        ]
 
 
 # Appointment Model
@@ -117,13 +219,26 @@ class Appointment(models.Model):
         ('no-show', 'No Show'),
     ]
     
+    # Set for bookings made while logged in; the contact fields below stay the
+    # source of truth for walk-in and guest bookings.
+    # Indexed through appointment_patient_date_idx below.
+    patient = models.ForeignKey(
+        Patient, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='appointments', db_index=False,
+    )
     patient_name = models.CharField(max_length=150)
     patient_email = models.EmailField()
     patient_phone = models.CharField(max_length=15)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     department = models.ForeignKey(Department, on_delete=models.CASCADE)
+    service = models.ForeignKey(Service, on_delete=models.SET_NULL, null=True, blank=True, related_name='appointments')
     appointment_date = models.DateField()
     appointment_time = models.TimeField()
+    # The service's duration, or the doctor's slot length without a service
+    duration_minutes = models.PositiveSmallIntegerField(
+        default=30,
+        validators=[MinValueValidator(SLOT_UNIT_MINUTES), MaxValueValidator(480), validate_on_slot_grid],
+    )
     reason = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
     notes = models.TextField(blank=True)
@@ -132,10 +247,57 @@ class Appointment(models.Model):
     
     def __str__(self):
         return f"{self.patient_name} - {self.doctor.name} ({self.appointment_date})"
+
+    def clean(self):
+        from .bookings import needs_overlap_check, overlaps_booking
+
+        if needs_overlap_check(self) and overlaps_booking(self):
+            raise ValidationError('This appointment overlaps another appointment of the same doctor.')
+
+    def save(self, *args, **kwargs):
+        # Blocking appointments are checked against the doctor's other
+        # bookings under a lock on the doctor (see bookings.py)
+        from .bookings import overlap_checked
+
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with overlap_checked(self, using, kwargs.get('update_fields')):
+            super().save(*args, **kwargs)
     
     class Meta:
         ordering = ['-appointment_date']
         unique_together = ['doctor', 'appointment_date', 'appointment_time']
+        indexes = [
+            # Patient dashboard: upcoming and past appointments in date order
+            models.Index(
+                fields=['patient', 'appointment_date', 'appointment_time', 'id'],
+                name='appointment_patient_date_idx',
+            ),
+            # Default ordering (admin changelist)
+            models.Index(fields=['appointment_date', 'id'], name='appointment_date_idx'),
+        ]
+
+
+# Slot Hold Model
+class SlotHold(models.Model):
+    """A doctor's time kept for one booking form for a few minutes (see holds.py)"""
+    token = models.CharField(max_length=32, unique=True)
+    # Indexed through slot_hold_doctor_date_idx below
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='slot_holds', db_index=False)
+    appointment_date = models.DateField()
+    appointment_time = models.TimeField()
+    duration_minutes = models.PositiveSmallIntegerField(default=30)
+    expires_at = models.DateTimeField(db_index=True)
+    # Address of the client that placed it, for SLOT_HOLD_MAX_PER_CLIENT
+    client = models.CharField(max_length=45, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Hold {self.appointment_date} {self.appointment_time:%H:%M} until {self.expires_at:%H:%M:%S}"
+
+    class Meta:
+        indexes = [
+            # Overlap checks read a doctor's holds for one day
+            models.Index(fields=['doctor', 'appointment_date'], name='slot_hold_doctor_date_idx'),
+        ]
 
 
 # Hospital Infrastructure Model
@@ -166,3 +328,58 @@ class Testimonial(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Home page: newest published testimonials
+            models.Index(fields=['is_published', 'created_at'], name='testimonial_published_idx'),
+            # Default ordering (admin changelist)
+            models.Index(fields=['created_at', 'id'], name='testimonial_created_idx'),
+        ]
+
+
+# Background Job Model
+class Job(models.Model):
+    """A unit of deferred work for ``manage.py run_worker`` (see jobs.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('dead', 'Dead'),
+    ]
+
+    task = models.CharField(max_length=150)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # Queued: when the job may run. Running: when its claim lapses and
+    # another worker may take it over (the visibility timeout).
+    available_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    class Meta:
+        indexes = [
+            # Workers claim the earliest available queued or lapsed running jobs
+            models.Index(fields=['status', 'available_at'], name='job_status_available_idx'),
+            # Claimed rows are read back by claim token
+            models.Index(fields=['claimed_by'], name='job_claimed_by_idx'),
+        ]
+
+
+# Idempotency Key Model
+class IdempotencyKey(models.Model):
+    """A form submission being run or already answered (see idempotency.py)"""
+    # Hash of the view name and the client's key; the unique constraint is the claim
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    # Pickled response, once the first submission has finished
+    response = models.BinaryField(null=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key[:12]} ({'done' if self.response is not None else 'running'})"
@@ -0,0 +1,107 @@
+"""
+Shared full-page cache and conditional GET for anonymous public pages.
+
+``public_page`` caches a view's rendered response per full path (so
+``?department=`` and ``?search=`` variants are kept apart) under the content
+version of the models the page is built from. Saving or deleting one of those
+models bumps its version (see ``signals.py``), which purges every page that
+depends on it. The same version yields the page's ETag, and the time of the
+last bump its Last-Modified, so repeat visitors and proxies revalidate with a
+cheap 304.
+
+Pages and versions are only correct when every process sees the same cache:
+with a process-local ``CACHES['default']`` an edit purges the pages of the
+process that saved it alone, and the others keep serving the old page and
+ETag. The page cache therefore stays off unless the cache is shared.
+"""
+import hashlib
+import time
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .refdata import cache_is_shared, content_version, last_modified
+
+
+KEY_PREFIX = 'pagecache'
+
+
+def page_cache_enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', True) and cache_is_shared()
+
+
+def _page_key(view_name, version, request):
+    query = '&'.join(sorted(request.GET.urlencode().split('&')))
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'{KEY_PREFIX}:{view_name}:{version}:{digest}'
+
+
+def _add_validators(response, etag, modified):
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    # The navbar differs for logged-in users, so shared caches must key on cookies
+    patch_vary_headers(response, ['Cookie'])
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def public_page(*dependencies, daily=False, timeout=None):
+    """Cache an anonymous GET page until one of ``dependencies`` changes
+
+    ``dependencies`` are model labels (``'hospital_system.doctor'``) or
+    callables taking the view kwargs and returning one, for per-object
+    versions. ``daily=True`` also rolls the page over at midnight, for pages
+    that show a date window.
+    """
+    def decorator(view):
+        view_name = view.__name__
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not page_cache_enabled():
+                return view(request, *args, **kwargs)
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            labels = [dep(kwargs) if callable(dep) else dep for dep in dependencies]
+            version = content_version(*labels)
+            modified = last_modified(labels)
+            if daily:
+                today = date.today()
+                version = f'{version}:{today.isoformat()}'
+                midnight = int(time.mktime(today.timetuple()))
+                modified = max(modified or midnight, midnight)
+            etag = quote_etag(hashlib.md5(
+                f'{view_name}:{version}:{request.get_full_path()}'.encode()
+            ).hexdigest())
+
+            response = get_conditional_response(request, etag=etag, last_modified=modified)
+            if response is not None:
+                return _add_validators(response, etag, modified)
+
+            key = _page_key(view_name, version, request)
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                cacheable = (
+                    response.status_code == 200
+                    and not response.streaming
+                    and not response.cookies
+                    and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+                )
+                if cacheable:
+                    if hasattr(response, 'render') and callable(response.render):
+                        response = response.render()
+                    page_timeout = timeout if timeout is not None else getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+                    cache.set(key, response, page_timeout)
+                else:
+                    return response
+            return _add_validators(response, etag, modified)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,295 @@
+"""
+Per-request SQL instrumentation.
+
+``QueryRecorder`` hooks into the database connection with
+``connection.execute_wrapper`` and records every statement's shape
+(fingerprint) and duration. ``QueryMetricsMiddleware`` wraps each request in a
+recorder, flags same-shape statements that repeat within one request as N+1
+suspects and keeps per-URL-name aggregates that the staff-only
+``query_metrics`` view exposes. The request's recorder is held in a context
+variable and every connection forwards to it, so queries that async views run
+in ``sync_to_async`` threads are counted too. Statements on the cache
+database (the default ``DatabaseCache``) are database round trips like any
+other, so they count towards the total and the budgets, and are also
+reported on their own. ``assert_query_budget`` is the test helper used to
+enforce the budgets declared in ``urls.QUERY_BUDGETS`` (see tests.py).
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .dbrouters import CACHE_DATABASE
+
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACES = re.compile(r'\s+')
+# Transaction control repeats with every nested atomic block, never per row
+_TRANSACTION = re.compile(r'^(?:BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """Collapse literals and IN-lists so same-shape statements compare equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'QUERY_METRICS_N_PLUS_ONE_THRESHOLD', 3)
+
+
+class QueryRecorder:
+    """``execute_wrapper`` callable that records count, time and fingerprints
+
+    ``count`` and ``seconds`` cover every statement; ``cache_count`` and
+    ``cache_seconds`` the share of them run on the cache database, whose
+    statements are left out of the fingerprints.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.cache_count = 0
+        self.cache_seconds = 0.0
+        self.fingerprints = Counter()
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            self.statements.append(sql)
+            if context['connection'].alias == CACHE_DATABASE:
+                # Every cache get has the same shape whatever the key, so
+                # repeats say nothing about N+1; the count still does
+                self.cache_count += 1
+                self.cache_seconds += elapsed
+            else:
+                self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """Fingerprints executed more than once, most repeated first"""
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n > 1]
+
+    def n_plus_one_suspects(self, threshold=None):
+        threshold = n_plus_one_threshold() if threshold is None else threshold
+        return [(sql, n) for sql, n in self.duplicates() if n >= threshold and not _TRANSACTION.match(sql)]
+
+    def summary(self):
+        lines = [f'{self.count} queries ({self.cache_count} on the cache database) in {self.seconds * 1000:.1f}ms']
+        for sql, n in self.duplicates():
+            lines.append(f'  x{n}: {sql}')
+        return '\n'.join(lines)
+
+
+# Recorder of the request being handled, seen by sync_to_async threads too
+_request_recorder = contextvars.ContextVar('request_query_recorder', default=None)
+
+
+def _forward_to_request_recorder(execute, sql, params, many, context):
+    recorder = _request_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_request_recorder(sender=None, connection=None, **kwargs):
+    """Make ``connection`` report to the current request's recorder
+
+    Connected to ``connection_created``. Inserted first, so the pop() that
+    ends an enclosing ``execute_wrapper`` block removes that block's wrapper.
+    """
+    if _forward_to_request_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _forward_to_request_recorder)
+
+
+def _recorded_aliases():
+    return [alias for alias in (DEFAULT_DB_ALIAS, CACHE_DATABASE) if alias in settings.DATABASES]
+
+
+@contextmanager
+def record_queries(using=None):
+    """Record every statement this thread runs inside the block on ``using``
+    (default: the default database and the cache database)"""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for alias in _recorded_aliases() if using is None else [using]:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+@contextmanager
+def not_recorded():
+    """Leave the queries inside the block out of the current request's recorder"""
+    token = _request_recorder.set(None)
+    try:
+        yield
+    finally:
+        _request_recorder.reset(token)
+
+
+@contextmanager
+def assert_query_budget(budget, label='block', allow_n_plus_one=False):
+    """Fail if the block runs more than ``budget`` queries or shows N+1 patterns"""
+    with record_queries() as recorder:
+        yield recorder
+    problems = []
+    if recorder.count > budget:
+        problems.append(f'{label} ran {recorder.count} queries (budget {budget})')
+    if not allow_n_plus_one and recorder.n_plus_one_suspects():
+        problems.append(f'{label} has N+1 suspects')
+    if problems:
+        raise AssertionError('; '.join(problems) + '\n' + recorder.summary())
+
+
+class QueryMetricsStore:
+    """Thread-safe per-URL-name aggregates for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def add(self, route, recorder, budget=None):
+        suspects = recorder.n_plus_one_suspects()
+        with self._lock:
+            entry = self._routes.setdefault(route, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'cache_queries': 0,
+                'max_cache_queries': 0,
+                'sql_ms': 0.0,
+                'max_sql_ms': 0.0,
+                'budget': budget,
+                'over_budget': 0,
+                'n_plus_one_requests': 0,
+                'n_plus_one_suspects': {},
+            })
+            sql_ms = recorder.seconds * 1000
+            entry['requests'] += 1
+            entry['queries'] += recorder.count
+            entry['max_queries'] = max(entry['max_queries'], recorder.count)
+            entry['cache_queries'] += recorder.cache_count
+            entry['max_cache_queries'] = max(entry['max_cache_queries'], recorder.cache_count)
+            entry['sql_ms'] += sql_ms
+            entry['max_sql_ms'] = max(entry['max_sql_ms'], sql_ms)
+            entry['budget'] = budget
+            if budget is not None and recorder.count > budget:
+                entry['over_budget'] += 1
+            if suspects:
+                entry['n_plus_one_requests'] += 1
+                for sql, n in suspects:
+                    seen = entry['n_plus_one_suspects']
+                    seen[sql] = max(seen.get(sql, 0), n)
+
+    def snapshot(self):
+        with self._lock:
+            routes = {}
+            for route, entry in self._routes.items():
+                entry = dict(entry, n_plus_one_suspects=dict(entry['n_plus_one_suspects']))
+                entry['avg_queries'] = round(entry['queries'] / entry['requests'], 2)
+                entry['avg_cache_queries'] = round(entry['cache_queries'] / entry['requests'], 2)
+                entry['avg_sql_ms'] = round(entry['sql_ms'] / entry['requests'], 3)
+                entry['sql_ms'] = round(entry['sql_ms'], 3)
+                entry['max_sql_ms'] = round(entry['max_sql_ms'], 3)
+                routes[route] = entry
+            return routes
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+metrics = QueryMetricsStore()
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name
+
+
+def query_budget(route):
+    from .urls import QUERY_BUDGETS
+
+    namespace, _, name = (route or '').rpartition(':')
+    if namespace != 'hospital_system':
+        return None
+    return QUERY_BUDGETS.get(name)
+
+
+class QueryMetricsMiddleware:
+    """Record per-request query count, SQL time and N+1 suspects"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'QUERY_METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        # Connections opened before the app registry was ready lack the hook
+        for alias in _recorded_aliases():
+            install_request_recorder(connection=connections[alias])
+        recorder = QueryRecorder()
+        token = _request_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_recorder.reset(token)
+        return self.record(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'QUERY_METRICS_ENABLED', True):
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        token = _request_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_recorder.reset(token)
+        return self.record(request, response, recorder)
+
+    def record(self, request, response, recorder):
+        route = route_name(request)
+        if route is None:
+            return response
+        budget = query_budget(route)
+        metrics.add(route, recorder, budget)
+
+        if budget is not None and recorder.count > budget:
+            logger.warning('%s ran %d queries (budget %d)', route, recorder.count, budget)
+        for sql, n in recorder.n_plus_one_suspects():
+            logger.warning('Possible N+1 in %s: %d x %s', route, n, sql)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Cache-Query-Count'] = str(recorder.cache_count)
+            response['X-Query-Time-Ms'] = f'{recorder.seconds * 1000:.1f}'
+        return response
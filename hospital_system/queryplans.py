@@ -0,0 +1,158 @@
+"""
+EXPLAIN QUERY PLAN analysis for the ``advise_indexes`` command (SQLite only).
+
+``StatementCollector`` keeps one example (SQL and parameters) of every
+distinct statement shape run while it is installed. ``explain`` returns the
+plan lines of each, flagging full table scans and temporary B-tree sorts, and
+``propose_index`` derives an index from the columns the statement filters
+and sorts on: equality columns first, then range columns, then the ORDER BY.
+Proposals that an existing index already covers are dropped.
+"""
+import re
+
+from django.apps import apps
+from django.db import connection
+
+from .querymetrics import fingerprint
+
+
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(.*)$')
+_TEMP_BTREE = re.compile(r'^USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT|(?:RIGHT PART OF|LAST TERM OF) ORDER BY)')
+_COMPARISON = re.compile(r'"(\w+)"\."(\w+)" (=|IN|IS|>=|<=|>|<|BETWEEN)\b', re.IGNORECASE)
+# Boolean filters render as a bare column: WHERE "t"."is_published"
+_BARE_COLUMN = re.compile(r'(?:NOT )?"(\w+)"\."(\w+)"(?=\s*(?:AND\b|OR\b|\)|$))', re.IGNORECASE)
+_ORDER_TERM = re.compile(r'"(\w+)"\."(\w+)"(?: (ASC|DESC))?', re.IGNORECASE)
+_CLAUSE_END = re.compile(r' (?:GROUP BY|ORDER BY|LIMIT|HAVING)\b')
+
+EQUALITY = ('=', 'IN', 'IS')
+
+
+class StatementCollector:
+    """``execute_wrapper`` keeping the first example of each statement shape"""
+
+    def __init__(self):
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.statements.setdefault(fingerprint(sql), (sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    """EXPLAIN QUERY PLAN detail lines for one statement"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """(full scans, index scans, sorts) found in a plan"""
+    full_scans, index_scans, sorts = [], [], []
+    for detail in plan:
+        scan = _SCAN.match(detail)
+        if scan:
+            table, rest = scan.groups()
+            if 'VIRTUAL TABLE' in rest:
+                continue
+            if 'INDEX' in rest:
+                index_scans.append(table)
+            else:
+                full_scans.append(table)
+        elif _TEMP_BTREE.match(detail):
+            sorts.append(detail)
+    return full_scans, index_scans, sorts
+
+
+def _where_clause(sql):
+    _, found, rest = sql.partition(' WHERE ')
+    if not found:
+        return ''
+    end = _CLAUSE_END.search(rest)
+    return rest[:end.start()] if end else rest
+
+
+def _order_clause(sql):
+    _, found, rest = sql.rpartition(' ORDER BY ')
+    if not found:
+        return ''
+    end = re.search(r' (?:LIMIT|OFFSET)\b', rest)
+    return rest[:end.start()] if end else rest
+
+
+def _models_by_table():
+    return {model._meta.db_table: model for model in apps.get_models()}
+
+
+def _field_name(model, column):
+    for field in model._meta.concrete_fields:
+        if field.column == column:
+            return field.name
+    return None
+
+
+def propose_index(sql, table):
+    """Model and field list for an index serving ``sql`` on ``table``, or None"""
+    model = _models_by_table().get(table)
+    if model is None:
+        return None
+
+    where = _where_clause(sql)
+    comparisons = _COMPARISON.findall(where)
+    comparisons += [(tbl, column, '=') for tbl, column in _BARE_COLUMN.findall(where)]
+    equality, ranges = [], []
+    for tbl, column, operator in comparisons:
+        if tbl != table:
+            continue
+        target = equality if operator.upper() in EQUALITY else ranges
+        if column not in equality and column not in ranges:
+            target.append(column)
+
+    ordering = []
+    for tbl, column, direction in _ORDER_TERM.findall(_order_clause(sql)):
+        if tbl != table:
+            # Sorting on another table's column cannot be served by this index
+            ordering = []
+            break
+        ordering.append((column, (direction or 'ASC').upper()))
+    # SQLite can walk an index backwards, so only mixed directions need '-'
+    mixed = len({direction for _, direction in ordering}) > 1
+
+    columns = equality + ranges[:1]
+    fields = []
+    for column in columns:
+        fields.append(_field_name(model, column))
+    if len(ranges) <= 1:
+        for column, direction in ordering:
+            if column in equality:
+                continue
+            if ranges and column == ranges[0]:
+                continue
+            name = _field_name(model, column)
+            fields.append(f'-{name}' if mixed and direction == 'DESC' else name)
+    fields = [field for field in fields if field]
+    if not fields or fields == ['id']:
+        return None
+    return model, fields
+
+
+def existing_indexes(model):
+    """Field lists of every index the model already has (including implicit ones)"""
+    meta = model._meta
+    indexes = [['id']]
+    indexes += [list(index.fields) for index in meta.indexes]
+    indexes += [list(fields) for fields in meta.unique_together]
+    for field in meta.concrete_fields:
+        if field.unique or field.db_index:
+            indexes.append([field.name])
+    return indexes
+
+
+def is_covered(model, fields):
+    """True when an existing index starts with ``fields`` (ignoring direction)"""
+    wanted = [field.lstrip('-') for field in fields]
+    for index in existing_indexes(model):
+        names = [name.lstrip('-').replace('pk', 'id') for name in index]
+        if names[:len(wanted)] == wanted:
+            return True
+    return False
@@ -0,0 +1,419 @@
+"""
+Versioned cache for near-static reference data.
+
+Hospital, department, infrastructure and service rows change only when an
+admin edits them, yet almost every page reads them. Each dataset below is
+served from process memory and tagged with the versions of the models it was
+built from. Versions live in Django's cache framework, so a save in one process
+(bumped by the signal handlers in ``signals.py``) invalidates every process's
+copy, provided ``CACHES['default']`` is shared by the processes; a
+process-local backend is reported by the ``hospital_system.W001`` check. When a dataset has to be rebuilt, one caller per process (and, through a
+short-lived ``cache.add`` lock, one process) hits the database while the others
+wait for the shared result instead of stampeding.
+
+Within a request (``ReferenceVersionsMiddleware``) the versions are read once:
+the first lookup fetches every tracked model's version and bump time with one
+``get_many``, and the rest of the request reuses them, so a page built from
+several datasets costs one cache read rather than one per dataset. A save
+during the request updates the request's copy along with the cache.
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.db import BaseDatabaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.functional import SimpleLazyObject
+
+
+KEY_PREFIX = 'refdata'
+
+
+def _setting(name, default):
+    return getattr(settings, f'REFDATA_{name}', default)
+
+
+def _version_key(model_label):
+    return f'{KEY_PREFIX}:version:{model_label}'
+
+
+def _modified_key(model_label):
+    return f'{KEY_PREFIX}:modified:{model_label}'
+
+
+def cache_is_shared():
+    """Whether every process sees the same default cache"""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def _new_version():
+    # Unique rather than incremented: incr() is a read and a write on the
+    # database cache, so two concurrent bumps could both land on the same
+    # number, and a version key evicted and created again could come back as
+    # one a process still holds data for.
+    return time.time_ns() // 1000 * 1000 + random.randrange(1000)
+
+
+# label -> (version, bump time) read by the request being handled
+_request_versions = contextvars.ContextVar('refdata_request_versions', default=None)
+
+
+def _read_versions(model_labels):
+    """{label: (version, bump time or None)} with one get_many, creating missing versions"""
+    keys = [key for label in model_labels for key in (_version_key(label), _modified_key(label))]
+    found = cache.get_many(keys)
+    versions = {}
+    for label in model_labels:
+        key = _version_key(label)
+        version = found.get(key)
+        if version is None:
+            version = _new_version()
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+        versions[label] = (version, found.get(_modified_key(label)))
+    return versions
+
+
+def _versions(model_labels):
+    snapshot = _request_versions.get()
+    if snapshot is None:
+        return _read_versions(model_labels)
+    missing = [label for label in model_labels if label not in snapshot]
+    if missing:
+        # Every tracked model at once: the request will likely want the rest
+        snapshot.update(_read_versions(set(missing) | (set(TRACKED_MODELS) - snapshot.keys())))
+    return snapshot
+
+
+def model_versions(model_labels):
+    """Current version of each model label, creating missing ones"""
+    versions = _versions(model_labels)
+    return tuple(versions[label][0] for label in model_labels)
+
+
+async def amodel_versions(model_labels):
+    """``model_versions`` for async callers"""
+    snapshot = _request_versions.get()
+    if snapshot is not None and all(label in snapshot for label in model_labels):
+        return model_versions(model_labels)
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], BaseDatabaseCache):
+        # Database queries are not allowed on the event loop
+        return await sync_to_async(model_versions)(model_labels)
+    return model_versions(model_labels)
+
+
+def content_version(*model_labels):
+    """Compact version string for cache keys that depend on several models"""
+    return '.'.join(str(v) for v in model_versions(model_labels))
+
+
+def last_modified(model_labels):
+    """Unix time of the most recent bump among ``model_labels``, if known"""
+    versions = _versions(model_labels)
+    found = [versions[label][1] for label in model_labels if versions[label][1] is not None]
+    return max(found) if found else None
+
+
+def bump_version(model_label):
+    """Invalidate every dataset built from ``model_label`` in all processes"""
+    version, modified = _new_version(), int(time.time())
+    cache.set(_version_key(model_label), version, timeout=None)
+    cache.set(_modified_key(model_label), modified, timeout=None)
+    snapshot = _request_versions.get()
+    if snapshot is not None:
+        snapshot[model_label] = (version, modified)
+
+
+@contextmanager
+def versions_snapshot():
+    """Read versions at most once inside the block (see the module docstring)"""
+    token = _request_versions.set({})
+    try:
+        yield
+    finally:
+        _request_versions.reset(token)
+
+
+class ReferenceVersionsMiddleware:
+    """Share one read of the content versions across the whole request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with versions_snapshot():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with versions_snapshot():
+            return await self.get_response(request)
+
+
+class ReferenceDataset:
+    """One cached dataset built by ``loader`` from the models in ``depends_on``"""
+
+    def __init__(self, name, loader, depends_on):
+        self.name = name
+        self.loader = loader
+        self.depends_on = tuple(depends_on)
+        self._lock = threading.Lock()
+        self._version = None
+        self._value = None
+
+    def get(self):
+        version = model_versions(self.depends_on)
+        if version == self._version:
+            return self._value
+        with self._lock:
+            # Another thread may have rebuilt it while we waited
+            if version == self._version:
+                return self._value
+            value = self._fetch_shared(version)
+            self._version, self._value = version, value
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._value = None
+
+    def _fetch_shared(self, version):
+        data_key = f'{KEY_PREFIX}:data:{self.name}:' + '.'.join(map(str, version))
+        lock_key = f'{KEY_PREFIX}:lock:{self.name}:' + '.'.join(map(str, version))
+        timeout = _setting('TIMEOUT', 3600)
+
+        missing = object()
+        value = cache.get(data_key, missing)
+        if value is not missing:
+            return value
+
+        # Only the process that wins the lock rebuilds; others wait briefly
+        # for its result and fall back to loading themselves.
+        if not cache.add(lock_key, 1, timeout=_setting('LOCK_TIMEOUT', 10)):
+            deadline = time.monotonic() + _setting('LOCK_WAIT', 2)
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+                value = cache.get(data_key, missing)
+                if value is not missing:
+                    return value
+
+        value = self.loader()
+        cache.set(data_key, value, timeout=timeout)
+        cache.delete(lock_key)
+        return value
+
+
+class ReferenceLookup:
+    """Per-key variant of ReferenceDataset for small query results
+
+    Entries live in this process only, tagged with the versions of
+    ``depends_on`` like datasets are, and at most ``max_entries`` are kept
+    (least recently loaded first out). ``peek`` never touches the database, so
+    async views answer hits from memory and only await ``aget`` (async ORM) on
+    a miss. Loaders must not return ``None``. ``get_many`` loads every missing
+    key with one call to ``many_loader``, which returns a dict.
+    """
+
+    def __init__(self, name, loader, aloader, depends_on, max_entries=1024, many_loader=None):
+        self.name = name
+        self.loader = loader
+        self.aloader = aloader
+        self.many_loader = many_loader
+        self.depends_on = tuple(depends_on)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def peek(self, key, version=None):
+        version = model_versions(self.depends_on) if version is None else version
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        return None
+
+    def get(self, key):
+        version = model_versions(self.depends_on)
+        value = self.peek(key, version)
+        if value is None:
+            value = self.loader(key)
+            self._store(key, version, value)
+        return value
+
+    def get_many(self, keys):
+        version = model_versions(self.depends_on)
+        found = {key: self.peek(key, version) for key in keys}
+        missing = [key for key, value in found.items() if value is None]
+        if missing:
+            loaded = self.many_loader(missing) if self.many_loader else {key: self.loader(key) for key in missing}
+            for key in missing:
+                self._store(key, version, loaded[key])
+                found[key] = loaded[key]
+        return found
+
+    async def aget(self, key):
+        # With a networked cache backend the version read blocks the event
+        # loop briefly; the database cache is read in a worker thread.
+        version = await amodel_versions(self.depends_on)
+        value = self.peek(key, version)
+        if value is None:
+            value = await self.aloader(key)
+            self._store(key, version, value)
+        return value
+
+    def _store(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _load_hospital():
+    from .models import Hospital
+    return Hospital.objects.first()
+
+
+def _load_departments():
+    from .models import Department
+    return list(Department.objects.all())
+
+
+def _load_infrastructure():
+    from .models import Infrastructure
+    return list(Infrastructure.objects.all())
+
+
+def _load_services():
+    from .models import Service
+    return list(Service.objects.select_related('department'))
+
+
+def _department_doctors(dept_id):
+    from .models import Doctor
+    return Doctor.objects.filter(specialization_id=dept_id, is_available=True).values_list('id', 'name')
+
+
+def _load_department_doctors(dept_id):
+    return list(_department_doctors(dept_id))
+
+
+async def _aload_department_doctors(dept_id):
+    return [row async for row in _department_doctors(dept_id)]
+
+
+def _load_doctor_schedules(doctor_ids):
+    from .schedules import load_schedules
+    return load_schedules(doctor_ids)
+
+
+def _load_doctor_schedule(doctor_id):
+    return _load_doctor_schedules([doctor_id])[doctor_id]
+
+
+async def _aload_doctor_schedule(doctor_id):
+    from .schedules import aload_schedules
+    return (await aload_schedules([doctor_id]))[doctor_id]
+
+
+DATASETS = {
+    'hospital': ReferenceDataset('hospital', _load_hospital, ['hospital_system.hospital']),
+    'departments': ReferenceDataset('departments', _load_departments, ['hospital_system.department']),
+    'infrastructure': ReferenceDataset('infrastructure', _load_infrastructure, ['hospital_system.infrastructure']),
+    'services': ReferenceDataset(
+        'services', _load_services, ['hospital_system.service', 'hospital_system.department'],
+    ),
+}
+
+LOOKUPS = {
+    # (id, name) of the bookable doctors in a department
+    'department_doctors': ReferenceLookup(
+        'department_doctors', _load_department_doctors, _aload_department_doctors, ['hospital_system.doctor'],
+    ),
+    # DoctorSchedule (offered slot starts) of each doctor
+    'doctor_schedules': ReferenceLookup(
+        'doctor_schedules', _load_doctor_schedule, _aload_doctor_schedule,
+        ['hospital_system.doctor', 'hospital_system.weeklyshift', 'hospital_system.scheduleexception'],
+        max_entries=4096, many_loader=_load_doctor_schedules,
+    ),
+}
+
+# Models whose saves and deletes bump a content version
+TRACKED_MODELS = (
+    'hospital_system.hospital',
+    'hospital_system.department',
+    'hospital_system.doctor',
+    'hospital_system.infrastructure',
+    'hospital_system.service',
+    'hospital_system.testimonial',
+    'hospital_system.weeklyshift',
+    'hospital_system.scheduleexception',
+)
+
+
+def get_hospital():
+    return DATASETS['hospital'].get()
+
+
+def get_departments():
+    return DATASETS['departments'].get()
+
+
+def get_infrastructure():
+    return DATASETS['infrastructure'].get()
+
+
+def get_services():
+    return DATASETS['services'].get()
+
+
+def get_department_doctors(dept_id):
+    return LOOKUPS['department_doctors'].get(dept_id)
+
+
+async def aget_department_doctors(dept_id):
+    return await LOOKUPS['department_doctors'].aget(dept_id)
+
+
+def get_doctor_schedule(doctor_id):
+    return LOOKUPS['doctor_schedules'].get(int(doctor_id))
+
+
+def get_doctor_schedules(doctor_ids):
+    return LOOKUPS['doctor_schedules'].get_many([int(doctor_id) for doctor_id in doctor_ids])
+
+
+async def aget_doctor_schedule(doctor_id):
+    return await LOOKUPS['doctor_schedules'].aget(int(doctor_id))
+
+
+def invalidate_all():
+    """Bump every tracked model, e.g. after bulk writes that skip signals"""
+    for label in TRACKED_MODELS:
+        bump_version(label)
+    for dataset in DATASETS.values():
+        dataset.clear()
+    for lookup in LOOKUPS.values():
+        lookup.clear()
+
+
+def reference_data(request):
+    """Context processor exposing the hospital record to every template"""
+    return {'hospital': SimpleLazyObject(get_hospital)}
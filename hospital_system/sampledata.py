@@ -0,0 +1,219 @@
+"""
+Throwaway datasets and request lists for the instrumentation commands.
+
+``build_sample_dataset`` creates a small but non-trivial set of rows (several
+rows per listing, so N+1 patterns become visible) and ``sample_requests``
+returns one GET request per named route in ``hospital_system/urls.py`` with
+the arguments and login role it needs. ``sample_calls`` adds the POST-only
+slot-hold routes, sent the way the booking form sends them, so that repeating
+a call keeps exercising the same path. Callers are expected to run them inside
+a transaction that is rolled back afterwards.
+"""
+import random
+import secrets
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+
+from . import search
+from .availability import slot_index
+from .models import (
+    Hospital, Department, Doctor, Patient, Appointment,
+    Service, Infrastructure, Testimonial, WeeklyShift, SlotHold
+)
+from .refdata import invalidate_all
+from .schedules import shifts_from_availability
+
+
+SAMPLE_PASSWORD = 'sample-pass-123'
+
+# Routes that are not plain GET pages
+SKIPPED_ROUTES = {'logout'}
+# Sent by SampleBookingForm instead
+POST_ROUTES = {'place_slot_hold', 'release_slot_hold'}
+
+
+def build_sample_dataset(scale=1, seed=1):
+    """Create ``scale``-proportional sample rows and return handles to them"""
+    rng = random.Random(seed)
+    hospital = Hospital.objects.first() or Hospital.objects.create(
+        name='Sample Hospital', location='Sample City', phone='9999999999',
+        email='sample@example.com', about='Sample hospital.',
+        established_year=2000, total_beds=100, doctors_count=10,
+    )
+
+    departments = Department.objects.bulk_create([
+        Department(name=f'Sample Department {i}', description='Sample department.')
+        for i in range(5 * scale)
+    ])
+    doctors = Doctor.objects.bulk_create([
+        Doctor(
+            name=f'Sample Doctor {i}', email=f'doctor{i}@example.com', phone='9000000000',
+            qualification='MBBS, MD', specialization=departments[i % len(departments)],
+            experience_years=5 + i % 20, consultation_fee=500, gender='MF'[i % 2],
+            bio='Sample doctor.',
+        )
+        for i in range(20 * scale)
+    ])
+    WeeklyShift.objects.bulk_create([
+        WeeklyShift(doctor=doctor, weekday=weekday, start_time=start, end_time=end)
+        for doctor in doctors
+        for weekday, start, end in shifts_from_availability(doctor.availability)
+    ])
+    Service.objects.bulk_create([
+        Service(
+            name=f'Sample Service {i}', description='Sample service.',
+            department=departments[i % len(departments)], cost_estimate=1000 + i,
+        )
+        for i in range(10 * scale)
+    ])
+    Infrastructure.objects.bulk_create([
+        Infrastructure(name=f'Sample Facility {i}', description='Sample facility.', hospital=hospital)
+        for i in range(3 * scale)
+    ])
+    # bulk_create skips the signals that maintain the search index
+    search.index_objects('department', Department.objects.filter(pk__in=[d.pk for d in departments]))
+    search.index_objects('doctor', Doctor.objects.filter(pk__in=[d.pk for d in doctors]))
+    search.index_objects('service', Service.objects.filter(name__startswith='Sample Service '))
+    Testimonial.objects.bulk_create([
+        Testimonial(
+            patient_name=f'Sample Patient {i}', patient_message='Great care.',
+            rating=rng.randint(3, 5), doctor=doctors[i % len(doctors)], is_published=True,
+        )
+        for i in range(6 * scale)
+    ])
+
+    patient_user = User.objects.create_user(
+        f'sample-patient-{seed}', 'sample-patient@example.com', SAMPLE_PASSWORD,
+        first_name='Sample', last_name='Patient',
+    )
+    patient = Patient.objects.create(
+        user=patient_user, name='Sample Patient', email=patient_user.email, phone='9000000001',
+    )
+    staff_user = User.objects.create_user(
+        f'sample-staff-{seed}', 'sample-staff@example.com', SAMPLE_PASSWORD, is_staff=True,
+    )
+
+    start = date.today() + timedelta(days=1)
+    appointments = Appointment.objects.bulk_create([
+        Appointment(
+            patient=patient, patient_name=patient.name, patient_email=patient.email, patient_phone=patient.phone,
+            doctor=doctor, department_id=doctor.specialization_id,
+            appointment_date=start + timedelta(days=i // 16), appointment_time=time(9 + i % 16 // 2, 30 * (i % 2)),
+            reason='Sample visit.',
+        )
+        for i, doctor in enumerate(doctors[:10 * scale])
+    ])
+    # bulk_create skips the signals that bump content versions, and the
+    # shared cache may hold datasets built before these rows existed
+    invalidate_all()
+
+    return {
+        'hospital': hospital,
+        'department': departments[0],
+        'doctor': doctors[0],
+        'appointment': appointments[0],
+        'patient_user': patient_user,
+        'staff_user': staff_user,
+    }
+
+
+def sample_requests(dataset):
+    """(route name, url, role) for every named GET route in hospital_system.urls
+
+    ``role`` is ``None`` for anonymous requests, ``'patient'`` for login-only
+    pages and ``'staff'`` for staff-only endpoints.
+    """
+    from .urls import ROUTE_ROLES, urlpatterns
+
+    department = dataset['department'].pk
+    doctor = dataset['doctor'].pk
+    kwargs = {
+        'department_detail': {'pk': department},
+        'doctor_detail': {'pk': doctor},
+        'appointment_confirmation': {'pk': dataset['appointment'].pk},
+        'get_doctors_by_department': {'dept_id': department},
+        'get_availability_matrix': {'dept_id': department},
+    }
+    query = {
+        'get_available_slots': f'?doctor={doctor}&date={date.today() + timedelta(days=1)}',
+        'search': '?q=sample',
+    }
+
+    requests = []
+    for pattern in urlpatterns:
+        name = pattern.name
+        if not name or name in SKIPPED_ROUTES or name in POST_ROUTES:
+            continue
+        url = reverse(f'hospital_system:{name}', kwargs=kwargs.get(name)) + query.get(name, '')
+        requests.append((name, url, ROUTE_ROLES.get(name)))
+    return requests
+
+
+class SampleBookingForm:
+    """Slot-hold traffic of one booking form on the sample doctor
+
+    Each ``place`` moves the form's hold to the other of two free times,
+    replacing the previous one, as when a patient changes their pick. Each
+    ``release`` gives up a live hold of its own, taken from spare rows
+    created beforehand a year out, where they block none of those times.
+    """
+
+    def __init__(self, dataset):
+        doctor = dataset['doctor'].pk
+        for days in range(1, 15):
+            day = date.today() + timedelta(days=days)
+            times = slot_index.free_slots(doctor, day)
+            if len(times) >= 2:
+                break
+        else:
+            raise ValueError('The sample doctor has no day with two free times')
+        self.data = {'doctor': doctor, 'date': day.isoformat()}
+        self.times = times[:2]
+        self.placed = 0
+        self.token = None
+        self.spare = self.spare_holds(doctor, day + timedelta(days=365))
+
+    @staticmethod
+    def spare_holds(doctor, day, count=200):
+        expires_at = timezone.now() + timedelta(days=1)
+        return [hold.token for hold in SlotHold.objects.bulk_create([
+            SlotHold(
+                token=secrets.token_urlsafe(16), doctor_id=doctor, appointment_date=day,
+                appointment_time=time(9, 0), expires_at=expires_at,
+            )
+            for _ in range(count)
+        ])]
+
+    def place(self, client):
+        data = dict(self.data, time=self.times[self.placed % 2], replace=self.token or '')
+        self.placed += 1
+        response = client.post(reverse('hospital_system:place_slot_hold'), data)
+        if response.status_code == 201:
+            self.token = response.json()['hold']
+        return response
+
+    def release(self, client):
+        # Past the spares, releases find nothing to delete
+        token = self.spare.pop() if self.spare else 'sample'
+        return client.post(reverse('hospital_system:release_slot_hold', kwargs={'token': token}))
+
+
+def sample_calls(dataset):
+    """(route name, role, call) for every named route in hospital_system.urls
+
+    ``call(client)`` sends the route's sample request and returns the
+    response: a GET from ``sample_requests``, or a slot-hold POST.
+    """
+    from .urls import ROUTE_ROLES
+
+    calls = [
+        (name, role, lambda client, url=url: client.get(url))
+        for name, url, role in sample_requests(dataset)
+    ]
+    form = SampleBookingForm(dataset)
+    calls.append(('place_slot_hold', ROUTE_ROLES.get('place_slot_hold'), form.place))
+    calls.append(('release_slot_hold', ROUTE_ROLES.get('release_slot_hold'), form.release))
+    return calls
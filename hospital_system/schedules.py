@@ -0,0 +1,161 @@
+"""
+Doctor working hours.
+
+A doctor's weekly shifts and dated exceptions (``WeeklyShift``,
+``ScheduleException``) become one ``DoctorSchedule``: bitsets of the slot
+starts each weekday and each exception date offers, already cut into the
+doctor's ``slot_minutes``. ``load_schedules`` builds them for any number of
+doctors with three queries. The ``doctor_schedules`` lookup in ``refdata``
+keeps them per process under the content versions of the three models, so an
+edit anywhere reaches every process, and the slot index holds each doctor's
+schedule next to its booked grid.
+
+``parse_availability`` reads the free-text ``Doctor.availability`` strings
+("Mon-Fri, 10:00-16:00", "Monday to Saturday", "Mon, Wed, Fri 9am-1pm")
+into shifts: the default shifts of a new doctor, and those of generated
+ones. Migration 0011 keeps a copy of its own.
+"""
+import re
+from collections import defaultdict
+from datetime import date, time
+from functools import lru_cache
+
+from .availability import DEFAULT_HOURS, DEFAULT_SLOT_MINUTES, DEFAULT_WEEKDAYS, DoctorSchedule
+
+
+# Loading
+def _schedule_rows(doctor_ids):
+    from .models import Doctor, ScheduleException, WeeklyShift
+
+    # Past exceptions can no longer affect a booking
+    return (
+        Doctor.objects.filter(pk__in=doctor_ids).order_by().values_list('pk', 'slot_minutes'),
+        WeeklyShift.objects.filter(doctor_id__in=doctor_ids).order_by()
+        .values_list('doctor_id', 'weekday', 'start_time', 'end_time'),
+        ScheduleException.objects.filter(doctor_id__in=doctor_ids, date__gte=date.today()).order_by()
+        .values_list('doctor_id', 'date', 'start_time', 'end_time'),
+    )
+
+
+def _build(doctor_ids, doctors, shifts, exceptions):
+    slot_minutes = dict(doctors)
+    weekly = {doctor_id: defaultdict(list) for doctor_id in doctor_ids}
+    dated = {doctor_id: defaultdict(list) for doctor_id in doctor_ids}
+    for doctor_id, weekday, start, end in shifts:
+        weekly[doctor_id][weekday].append((start, end))
+    for doctor_id, day, start, end in exceptions:
+        windows = dated[doctor_id][day]
+        if start is not None and end is not None:
+            windows.append((start, end))
+    # A day-off row wins over any hours given for the same date
+    for doctor_id, day, start, end in exceptions:
+        if start is None:
+            dated[doctor_id][day] = []
+    return {
+        doctor_id: DoctorSchedule(
+            slot_minutes.get(doctor_id, DEFAULT_SLOT_MINUTES), weekly[doctor_id], dated[doctor_id],
+        )
+        for doctor_id in doctor_ids
+    }
+
+
+def load_schedules(doctor_ids):
+    """``{doctor_id: DoctorSchedule}``; unknown doctors get a schedule without slots"""
+    doctor_ids = list(doctor_ids)
+    return _build(doctor_ids, *(list(rows) for rows in _schedule_rows(doctor_ids)))
+
+
+async def aload_schedules(doctor_ids):
+    doctor_ids = list(doctor_ids)
+    rows = [[row async for row in queryset] for queryset in _schedule_rows(doctor_ids)]
+    return _build(doctor_ids, *rows)
+
+
+# Parsing free-text availability
+_WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+_DAY = r'\b(mon|tue|wed|thu|fri|sat|sun)[a-z]*\b'
+_DAY_RANGE = re.compile(rf'{_DAY}(?:\s*(?:-|–|to|through|thru)\s*{_DAY})?')
+_DAY_GROUPS = {
+    r'\bdaily\b|\bevery\s*day\b|\ball\s+days\b': range(7),
+    r'\bweekdays\b': range(5),
+    r'\bweekends?\b': (5, 6),
+}
+_TIME = r'(\d{1,2})(?:[:.](\d{2}))?(?:\s*([ap])\.?m\b\.?)?'
+_TIME_RANGE = re.compile(rf'\b{_TIME}\s*(?:-|–|to)\s*{_TIME}')
+
+
+def _clock(hour, minute, meridiem):
+    """Minutes after midnight, or None when out of range"""
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == 'p' else 0)
+    if hour > 24 or minute > 59 or hour * 60 + minute > 24 * 60:
+        return None
+    return hour * 60 + minute
+
+
+def _window(groups):
+    """(start, end) times of one matched time range, or None"""
+    start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = groups
+    end = _clock(end_hour, end_minute, end_meridiem)
+    if end is None:
+        return None
+    # "9-5pm": the start takes the end's am/pm unless that puts it after the end
+    start = _clock(start_hour, start_minute, start_meridiem or end_meridiem)
+    if start is not None and not start_meridiem and end_meridiem and start >= end:
+        start = _clock(start_hour, start_minute, 'a')
+    # "9-5" without am/pm: afternoon end
+    if start is not None and not end_meridiem and end <= start and end + 12 * 60 <= 24 * 60:
+        end += 12 * 60
+    if start is None or end <= start:
+        return None
+    end = min(end, 24 * 60 - 1)
+    return time(start // 60, start % 60), time(end // 60, end % 60)
+
+
+def parse_availability(text):
+    """[(weekday, start, end), ...] read from an availability string, or None
+
+    Missing days default to Monday to Saturday and missing hours to 9 AM to
+    5 PM (the grid every doctor had before schedules). Returns None when the
+    text names neither days nor hours.
+    """
+    text = (text or '').lower()
+    windows = []
+    for match in _TIME_RANGE.finditer(text):
+        window = _window(match.groups())
+        if window and window not in windows:
+            windows.append(window)
+    rest = _TIME_RANGE.sub(' ', text)
+
+    days = set()
+    for pattern, group in _DAY_GROUPS.items():
+        if re.search(pattern, rest):
+            days.update(group)
+    for first, last in _DAY_RANGE.findall(rest):
+        first = _WEEKDAYS.index(first)
+        if not last:
+            days.add(first)
+            continue
+        last = _WEEKDAYS.index(last)
+        # Ranges may wrap: "Fri-Mon"
+        days.update((first + offset) % 7 for offset in range((last - first) % 7 + 1))
+
+    if not days and not windows:
+        return None
+    return [
+        (weekday, start, end)
+        for weekday in sorted(days) or DEFAULT_WEEKDAYS
+        for start, end in windows or [DEFAULT_HOURS]
+    ]
+
+
+@lru_cache(maxsize=256)
+def shifts_from_availability(text):
+    """``parse_availability`` with the default hours for unreadable text, as a tuple"""
+    shifts = parse_availability(text)
+    if shifts is None:
+        shifts = [(weekday, *DEFAULT_HOURS) for weekday in DEFAULT_WEEKDAYS]
+    return tuple(shifts)
@@ -0,0 +1,255 @@
+"""
+Full-text search over doctors, departments and services.
+
+On SQLite the rows are mirrored into the FTS5 table ``hospital_system_search``
+(created by migration 0004), kept in sync by the signal handlers in
+``signals.py`` and rebuilt with ``manage.py rebuild_search_index``. Matches are
+ranked with bm25, weighting names over department names over free text. Other
+database backends fall back to ``icontains`` filters without ranking.
+"""
+import re
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, transaction
+from django.db.models import Q
+
+
+TABLE = 'hospital_system_search'
+
+KINDS = ('doctor', 'department', 'service')
+
+# Index rows use rowid = pk * 4 + kind code, so single-object updates and the
+# join back to the model table are primary-key lookups rather than scans.
+KIND_CODES = {'doctor': 1, 'department': 2, 'service': 3}
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Turn free user text into a safe FTS5 query (all terms, prefix match)"""
+    terms = _TERM.findall((query or '').lower())
+    return ' '.join(f'"{term}"*' for term in terms[:10])
+
+
+# Documents
+def doctor_document(doctor):
+    return (
+        'doctor', doctor.pk, doctor.name, doctor.specialization.name,
+        ' '.join(filter(None, [doctor.qualification, doctor.bio])),
+    )
+
+
+def department_document(department):
+    return (
+        'department', department.pk, department.name, department.head_doctor,
+        department.description,
+    )
+
+
+def service_document(service):
+    return ('service', service.pk, service.name, service.department.name, service.description)
+
+
+def _documents(kind, queryset):
+    if kind == 'doctor':
+        rows = queryset.select_related('specialization').only(
+            'name', 'qualification', 'bio', 'specialization__name',
+        )
+        return (doctor_document(d) for d in rows.iterator(chunk_size=2000))
+    if kind == 'department':
+        return (department_document(d) for d in queryset.iterator(chunk_size=2000))
+    rows = queryset.select_related('department').only('name', 'description', 'department__name')
+    return (service_document(s) for s in rows.iterator(chunk_size=2000))
+
+
+def _model(kind):
+    from .models import Department, Doctor, Service
+    return {'doctor': Doctor, 'department': Department, 'service': Service}[kind]
+
+
+# Index maintenance
+def index_documents(documents, chunk_size=2000):
+    """Replace the index rows for the given ``*_document()`` tuples"""
+    if not is_supported():
+        return 0
+    count = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= chunk_size:
+                count += _write(cursor, batch)
+                batch = []
+        if batch:
+            count += _write(cursor, batch)
+    return count
+
+
+def index_objects(kind, queryset, chunk_size=2000):
+    """Replace the index rows of every object in ``queryset``"""
+    if not is_supported():
+        return 0
+    return index_documents(_documents(kind, queryset), chunk_size)
+
+
+def rowid(kind, pk):
+    return pk * 4 + KIND_CODES[kind]
+
+
+def _write(cursor, documents):
+    cursor.executemany(
+        f'DELETE FROM {TABLE} WHERE rowid = %s',
+        [(rowid(document[0], document[1]),) for document in documents],
+    )
+    return _insert(cursor, documents)
+
+
+def remove_object(kind, pk):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [rowid(kind, pk)])
+
+
+def rebuild(chunk_size=2000):
+    """Drop and re-create every index row; returns counts per kind"""
+    if not is_supported():
+        return {}
+    counts = {}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+        for kind in KINDS:
+            model = _model(kind)
+            documents = _documents(kind, model.objects.order_by('pk'))
+            counts[kind] = 0
+            batch = []
+            with connection.cursor() as cursor:
+                for document in documents:
+                    batch.append(document)
+                    if len(batch) >= chunk_size:
+                        counts[kind] += _insert(cursor, batch)
+                        batch = []
+                if batch:
+                    counts[kind] += _insert(cursor, batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+    return counts
+
+
+def _insert(cursor, documents):
+    cursor.executemany(
+        f'INSERT INTO {TABLE} (rowid, kind, object_id, title, subtitle, body) VALUES (%s, %s, %s, %s, %s, %s)',
+        [(rowid(document[0], document[1]), *document) for document in documents],
+    )
+    return len(documents)
+
+
+# Queries
+def search(query, kinds=KINDS, limit=20, offset=0):
+    """Ranked hits as dicts with kind, id, title, subtitle and snippet"""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    if not is_supported():
+        return _fallback_search(query, kinds, limit, offset)
+
+    placeholders = ', '.join(['%s'] * len(kinds))
+    sql = (
+        f"SELECT kind, object_id, title, subtitle, "
+        f"snippet({TABLE}, 4, '[', ']', '…', 12), rank "
+        f"FROM {TABLE} WHERE {TABLE} MATCH %s AND kind IN ({placeholders}) "
+        f"ORDER BY rank LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [expression, *kinds, limit, offset])
+        rows = cursor.fetchall()
+    return [
+        {'kind': kind, 'id': object_id, 'title': title, 'subtitle': subtitle,
+         'snippet': snippet, 'score': round(-rank, 4)}
+        for kind, object_id, title, subtitle, snippet, rank in rows
+    ]
+
+
+def _fallback_search(query, kinds, limit, offset):
+    hits = []
+    for kind in kinds:
+        model = _model(kind)
+        fields = {'doctor': ('name', 'qualification', 'bio'),
+                  'department': ('name', 'description'),
+                  'service': ('name', 'description')}[kind]
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': query})
+        for obj in model.objects.filter(condition)[:offset + limit]:
+            hits.append({'kind': kind, 'id': obj.pk, 'title': obj.name, 'subtitle': '',
+                         'snippet': '', 'score': 0})
+    return hits[offset:offset + limit]
+
+
+def filter_doctors(queryset, query):
+    """Restrict a Doctor queryset to search matches, best match first
+
+    On SQLite the result is a ``RankedDoctors``, which only supports slicing;
+    elsewhere (and for a query without terms) a queryset.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not is_supported():
+        return queryset.filter(
+            Q(name__icontains=query) | Q(qualification__icontains=query)
+            | Q(bio__icontains=query) | Q(specialization__name__icontains=query)
+        )
+    return RankedDoctors(queryset, expression)
+
+
+def is_ranked(doctors):
+    """Whether ``doctors`` came ranked from ``filter_doctors``
+
+    They do not when the query has no terms, or off SQLite.
+    """
+    return isinstance(doctors, RankedDoctors)
+
+
+class RankedDoctors:
+    """The doctors of a queryset that match an FTS expression, best match first
+
+    A slice costs two queries: the page's primary keys, read from the FTS
+    table in bm25 order with the MATCH driving the plan and the queryset's
+    filters as a subquery, then those doctors through the queryset (so its
+    ``select_related``/``only`` apply). bm25 has to be computed in the query
+    that runs the MATCH: as a per-row subquery it would re-run the match for
+    every doctor.
+    """
+
+    def __init__(self, queryset, expression):
+        self.queryset = queryset
+        self.expression = expression
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('RankedDoctors only supports slicing')
+        start = index.start or 0
+        limit = -1 if index.stop is None else max(0, index.stop - start)
+        ids = self.ids(limit, start)
+        found = self.queryset.in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
+
+    def ids(self, limit=-1, offset=0):
+        code = KIND_CODES['doctor']
+        try:
+            doctors, params = self.queryset.order_by().values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            return []
+        sql = (
+            f"SELECT rowid / 4 FROM {TABLE} WHERE {TABLE} MATCH %s AND rowid %% 4 = {code} "
+            f"AND rowid / 4 IN ({doctors}) ORDER BY rank, rowid LIMIT %s OFFSET %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.expression, *params, limit, offset])
+            return [pk for pk, in cursor.fetchall()]
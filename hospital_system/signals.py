@@ -0,0 +1,256 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .availability import BLOCKING_STATUSES, schedule_label, slot_index
+from .bookings import SLOT_FIELDS
+from .identity import forget_user
+from .models import (
+    Appointment, Department, Doctor, Hospital, Infrastructure, Patient, ScheduleException, Service, SlotHold,
+    Testimonial, WeeklyShift,
+)
+from .refdata import bump_version
+from .schedules import shifts_from_availability
+from . import search
+from .imaging import prepare_image
+
+
+_UNTRACKED = object()
+
+
+def _slot_key(appointment):
+    """(doctor, date, time, duration) the appointment occupies, or None if it frees its slot"""
+    # Deferred fields would each cost a query to read, so they are not tracked
+    if any(field not in appointment.__dict__ for field in SLOT_FIELDS):
+        return _UNTRACKED
+    if appointment.status not in BLOCKING_STATUSES:
+        return None
+    if not (appointment.doctor_id and appointment.appointment_date and appointment.appointment_time):
+        return None
+    return (
+        appointment.doctor_id, appointment.appointment_date, appointment.appointment_time,
+        appointment.duration_minutes,
+    )
+
+
+def _forget_doctor(appointment):
+    doctor_id = appointment.__dict__.get('doctor_id')
+    slot_index.invalidate(doctor_id)
+    if doctor_id:
+        _schedule_changed(doctor_id)
+
+
+def _schedule_changed(doctor_id):
+    # Pages showing this doctor's free slots are keyed on this version
+    label = schedule_label(doctor_id)
+    transaction.on_commit(lambda: bump_version(label))
+
+
+def schedules_changed(doctor_ids):
+    """Invalidate the slots of ``doctor_ids`` once the transaction commits
+
+    For appointment writes that send no signals (``update()``,
+    ``bulk_create()``).
+    """
+    doctor_ids = set(doctor_ids)
+
+    def forget():
+        for doctor_id in doctor_ids:
+            slot_index.invalidate(doctor_id)
+            bump_version(schedule_label(doctor_id))
+
+    transaction.on_commit(forget)
+
+
+# Keep the slot index in step with appointment create/cancel/status changes
+@receiver(post_init, sender=Appointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    instance._saved_slot_key = _slot_key(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Appointment)
+def update_slot_index_on_save(sender, instance, **kwargs):
+    old_key = getattr(instance, '_saved_slot_key', None)
+    new_key = _slot_key(instance)
+    if old_key is _UNTRACKED or new_key is _UNTRACKED:
+        _forget_doctor(instance)
+    elif old_key != new_key:
+        if old_key:
+            slot_index.release(*old_key)
+            _schedule_changed(old_key[0])
+        if new_key:
+            slot_index.book(*new_key)
+            if not old_key or new_key[0] != old_key[0]:
+                _schedule_changed(new_key[0])
+    instance._saved_slot_key = new_key
+
+
+@receiver(post_delete, sender=Appointment)
+def update_slot_index_on_delete(sender, instance, **kwargs):
+    key = getattr(instance, '_saved_slot_key', None)
+    if key is _UNTRACKED:
+        _forget_doctor(instance)
+    elif key:
+        slot_index.release(*key)
+        _schedule_changed(key[0])
+
+
+# Slot holds occupy time in the slot index until they expire
+@receiver(post_save, sender=SlotHold)
+def update_slot_index_on_hold(sender, instance, created, **kwargs):
+    if created:
+        slot_index.hold(
+            instance.doctor_id, instance.token, instance.appointment_date, instance.appointment_time,
+            instance.duration_minutes, instance.expires_at,
+        )
+        _schedule_changed(instance.doctor_id)
+
+
+@receiver(post_delete, sender=SlotHold)
+def update_slot_index_on_hold_delete(sender, instance, **kwargs):
+    slot_index.release_hold(instance.doctor_id, instance.token)
+    _schedule_changed(instance.doctor_id)
+
+
+# Doctor schedules: the slot index holds each doctor's schedule (and slot
+# length) next to its booked grid
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def forget_doctor_schedule(sender, instance, **kwargs):
+    doctor_id = instance.pk
+    slot_index.invalidate(doctor_id)
+    # Again after commit: a request may have reloaded the old schedule meanwhile
+    transaction.on_commit(lambda: slot_index.invalidate(doctor_id))
+
+
+@receiver(post_save, sender=Doctor)
+def create_default_shifts(sender, instance, created, raw=False, **kwargs):
+    """Give a new doctor the weekly shifts its availability text describes
+
+    Without shifts a doctor offers no slots at all. Fixtures (``raw``)
+    bring their own shifts.
+    """
+    if not created or raw:
+        return
+    WeeklyShift.objects.bulk_create([
+        WeeklyShift(doctor=instance, weekday=weekday, start_time=start, end_time=end)
+        for weekday, start, end in shifts_from_availability(instance.availability)
+    ])
+    # bulk_create sends no signals
+    transaction.on_commit(lambda: bump_version(WeeklyShift._meta.label_lower))
+    _schedule_changed(instance.pk)
+
+
+@receiver(post_save, sender=WeeklyShift)
+@receiver(post_save, sender=ScheduleException)
+@receiver(post_delete, sender=WeeklyShift)
+@receiver(post_delete, sender=ScheduleException)
+def invalidate_doctor_schedule(sender, instance, **kwargs):
+    doctor_id = instance.doctor_id
+    slot_index.invalidate(doctor_id)
+    transaction.on_commit(lambda: slot_index.invalidate(doctor_id))
+    _schedule_changed(doctor_id)
+
+
+# Reference data and public pages: any admin edit invalidates the cached
+# copies in every process
+@receiver(post_save, sender=Hospital)
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Infrastructure)
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=WeeklyShift)
+@receiver(post_save, sender=ScheduleException)
+@receiver(post_delete, sender=Hospital)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Infrastructure)
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=WeeklyShift)
+@receiver(post_delete, sender=ScheduleException)
+def invalidate_reference_data(sender, **kwargs):
+    # Wait for commit so no process can rebuild from pre-commit rows
+    label = sender._meta.label_lower
+    transaction.on_commit(lambda: bump_version(label))
+
+
+# Testimonials: only published ones appear on the home page fragments
+@receiver(post_init, sender=Testimonial)
+def remember_testimonial_published(sender, instance, **kwargs):
+    instance._was_published = bool(instance.pk) and instance.__dict__.get('is_published', True)
+
+
+@receiver(post_save, sender=Testimonial)
+@receiver(post_delete, sender=Testimonial)
+def invalidate_published_testimonials(sender, instance, **kwargs):
+    if instance.is_published or getattr(instance, '_was_published', False):
+        transaction.on_commit(lambda: bump_version('hospital_system.testimonial'))
+    instance._was_published = instance.is_published
+
+
+# Cached identities: a user entry carries the user's Patient profile
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    forget_user(user_id)
+    # Again after commit: a request may have re-cached the old row meanwhile
+    transaction.on_commit(lambda: forget_user(user_id))
+
+
+@receiver(post_init, sender=Patient)
+def remember_patient_user(sender, instance, **kwargs):
+    instance._saved_user_id = instance.__dict__.get('user_id')
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def forget_cached_patient_user(sender, instance, **kwargs):
+    user_ids = {instance.user_id, getattr(instance, '_saved_user_id', None)} - {None}
+    instance._saved_user_id = instance.user_id
+    for user_id in user_ids:
+        forget_user(user_id)
+    transaction.on_commit(lambda: [forget_user(user_id) for user_id in user_ids])
+
+
+# Full-text search index
+@receiver(post_save, sender=Doctor)
+def index_doctor(sender, instance, **kwargs):
+    search.index_documents([search.doctor_document(instance)])
+
+
+@receiver(post_save, sender=Service)
+def index_service(sender, instance, **kwargs):
+    search.index_documents([search.service_document(instance)])
+
+
+@receiver(post_init, sender=Department)
+def remember_department_name(sender, instance, **kwargs):
+    instance._indexed_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=Department)
+def index_department(sender, instance, created, **kwargs):
+    search.index_documents([search.department_document(instance)])
+    # Doctors and services carry the department name in their index rows
+    if not created and instance.name != instance._indexed_name:
+        search.index_objects('doctor', Doctor.objects.filter(specialization=instance))
+        search.index_objects('service', Service.objects.filter(department=instance))
+    instance._indexed_name = instance.name
+
+
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Service)
+def unindex_object(sender, instance, **kwargs):
+    search.remove_object(sender._meta.model_name, instance.pk)
+
+
+# Image derivatives: new uploads are downscaled and resized/WebP copies written
+@receiver(pre_save, sender=Doctor)
+@receiver(pre_save, sender=Department)
+def build_image_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    prepare_image(instance)
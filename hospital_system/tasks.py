@@ -0,0 +1,61 @@
+"""
+Background tasks run by ``manage.py run_worker`` (see jobs.py).
+
+Each task is called with its job's payload as keyword arguments and may run
+more than once for the same job, so each one checks whether its work is
+already done before doing it.
+"""
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage
+
+from .jobs import task
+
+
+logger = logging.getLogger(__name__)
+
+
+# Contact form: delivered to the hospital's mailbox. A message that cannot be
+# delivered ends up dead-lettered in the admin, where it can still be read.
+@task(max_attempts=8)
+def deliver_contact_message(name, email, phone, subject, message):
+    from .refdata import get_hospital
+
+    hospital = get_hospital()
+    recipient = getattr(settings, 'CONTACT_EMAIL', None) or (hospital.email if hospital else None)
+    if not recipient:
+        raise RuntimeError('No CONTACT_EMAIL setting and no hospital email to deliver to.')
+    EmailMessage(
+        subject=f'[Contact] {subject}',
+        body=f'From: {name} <{email}>\nPhone: {phone}\n\n{message}',
+        to=[recipient],
+        reply_to=[email],
+    ).send()
+
+
+# Remote images (``add_ai_images --enqueue``)
+@task(max_attempts=4)
+def attach_remote_image(model, pk, url, filename):
+    """Download ``url`` and attach it as the image of a doctor or department"""
+    import requests
+
+    from .downloads import RETRY_STATUSES
+    from .models import Department, Doctor
+
+    obj = {'doctor': Doctor, 'department': Department}[model].objects.filter(pk=pk).first()
+    if obj is None or obj.image:
+        return
+    response = requests.get(url, timeout=10)
+    if response.status_code in RETRY_STATUSES:
+        # Raised, so the queue retries it with backoff
+        response.raise_for_status()
+    if not response.ok:
+        logger.warning('Giving up on %s image %s: %s returned %s', model, pk, url, response.status_code)
+        return
+    obj.image.name = default_storage.save(
+        obj.image.field.generate_filename(obj, filename), ContentFile(response.content),
+    )
+    obj.save(update_fields=['image', 'image_variants'])
@@ -0,0 +1,17 @@
+from django import template
+from django.utils.html import format_html
+
+from hospital_system.idempotency import FIELD_NAME, new_key
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_field():
+    """Hidden input with a fresh idempotency key for a form posting to an
+    ``idempotent_post`` view
+
+        <form method="post">{% csrf_token %}{% idempotency_field %}
+    """
+    return format_html('<input type="hidden" name="{}" value="{}">', FIELD_NAME, new_key())
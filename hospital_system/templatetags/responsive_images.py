@@ -0,0 +1,48 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from hospital_system.imaging import image_url as _image_url, srcset
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(obj, alt='', sizes='100vw', fallback='', **attrs):
+    """``<picture>`` with WebP and JPEG/PNG ``srcset``s for ``obj.image``
+
+    Extra keyword arguments become ``<img>`` attributes (``loading``,
+    ``class``, ``style``...). Without derivatives the original upload is used,
+    and without an image ``fallback`` (a URL) if given.
+
+        {% responsive_image doctor alt=doctor.name sizes="320px" loading="lazy" %}
+    """
+    field_file = getattr(obj, 'image', None)
+    variants = getattr(obj, 'image_variants', None) or {}
+    attrs = {'alt': alt, **attrs}
+    if not field_file:
+        if not fallback:
+            return ''
+        return format_html('<img{}>', flatatt({'src': fallback, **attrs}))
+    if variants.get('name') != field_file.name or not variants.get('widths'):
+        return format_html('<img{}>', flatatt({'src': field_file.url, **attrs}))
+
+    widest = variants['widths'][-1]
+    img_attrs = {
+        'src': _image_url(obj, widest),
+        'srcset': srcset(variants, variants['fallback']),
+        'sizes': sizes,
+        **attrs,
+    }
+    return format_html(
+        '<picture class="responsive-image"><source type="image/webp"{}><img{}></picture>',
+        flatatt({'srcset': srcset(variants, 'webp'), 'sizes': sizes}),
+        flatatt(img_attrs),
+    )
+
+
+@register.simple_tag
+def image_url(obj, width):
+    """Smallest derivative of ``obj.image`` at least ``width`` pixels wide"""
+    return _image_url(obj, int(width))
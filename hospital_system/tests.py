@@ -0,0 +1,470 @@
+"""
+Regression tests. Run with ``python manage.py test hospital_system``.
+"""
+import json
+import threading
+from datetime import date, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import setting_changed
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import datagen, holds, jobs, search as search_index
+from .availability import DoctorSchedule, SlotIndex, interval, mask_to_times, slot_index
+from .downloads import Checkpoint, Downloader
+from .fastpath import with_fast_paths
+from .models import Department, Doctor, Job, SlotHold
+from .querymetrics import assert_query_budget
+from .refdata import invalidate_all
+from .sampledata import build_sample_dataset, sample_calls
+from .urls import QUERY_BUDGETS
+
+
+class HospitalTestCase(TestCase):
+    # The default cache is a database of its own
+    databases = '__all__'
+
+    def setUp(self):
+        # Nothing loaded into this process by an earlier test may leak in
+        invalidate_all()
+        slot_index.invalidate()
+
+
+# Query budgets
+@override_settings(QUERY_METRICS_ENABLED=False, PAGE_CACHE_ENABLED=False)
+class QueryBudgetTests(HospitalTestCase):
+    def test_routes_within_budget(self):
+        dataset = build_sample_dataset()
+        clients = {None: self.client, 'patient': self.client_class(), 'staff': self.client_class()}
+        clients['patient'].force_login(dataset['patient_user'])
+        clients['staff'].force_login(dataset['staff_user'])
+        for name, role, call in sample_calls(dataset):
+            with self.subTest(route=name):
+                client = clients[role]
+                # Warm caches: the budgets describe steady state
+                call(client)
+                with assert_query_budget(QUERY_BUDGETS[name], label=name):
+                    response = call(client)
+                self.assertLess(response.status_code, 400)
+
+
+# Search
+class SearchTests(HospitalTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = build_sample_dataset()
+
+    def test_ranked_search(self):
+        response = self.client.get(reverse('hospital_system:doctors_api'), {'search': 'sample doctor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 20)
+
+    def test_ranked_pages(self):
+        url = reverse('hospital_system:doctors_api')
+        ids, cursor = [], None
+        while True:
+            params = {'search': 'sample doctor', 'limit': 7, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(url, params).json()
+            ids += [doctor['id'] for doctor in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        ranked = search_index.filter_doctors(Doctor.objects.all(), 'sample doctor').ids()
+        self.assertEqual(ids, ranked)
+        self.assertGreater(len(ids), 7)
+
+    def test_ranked_pages_stop_at_cap(self):
+        url = reverse('hospital_system:doctors_api')
+        with mock.patch('hospital_system.views.SEARCH_MAX_PAGE', 2):
+            first = self.client.get(url, {'search': 'sample doctor', 'limit': 2}).json()
+            second = self.client.get(url, {'search': 'sample doctor', 'limit': 2, 'cursor': first['next_cursor']}).json()
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next_cursor'])
+
+    def test_search_without_terms(self):
+        # Nothing for the full-text index to match, so no ranked queryset
+        for query in ['"', '(', '*', '""', '-']:
+            with self.subTest(query=query):
+                response = self.client.get(reverse('hospital_system:doctors'), {'search': query})
+                self.assertEqual(response.status_code, 200)
+                response = self.client.get(reverse('hospital_system:doctors_api'), {'search': query})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['results'], [])
+
+    def test_search_page_out_of_range(self):
+        for page in ['99999999999999999999', '-5', 'x']:
+            with self.subTest(page=page):
+                response = self.client.get(reverse('hospital_system:search'), {'q': 'sample', 'page': page})
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(response.json()['page'], 50)
+
+    def test_search_without_full_text_index(self):
+        # Other database backends fall back to unranked icontains filters
+        with mock.patch('hospital_system.search.is_supported', return_value=False):
+            response = self.client.get(
+                reverse('hospital_system:doctors_api'), {'search': 'Sample Doctor 1', 'limit': 5},
+            )
+            self.assertEqual(response.status_code, 200)
+            first = response.json()
+            response = self.client.get(
+                reverse('hospital_system:doctors_api'),
+                {'search': 'Sample Doctor 1', 'limit': 5, 'cursor': first['next_cursor']},
+            )
+        names = [doctor['name'] for doctor in first['results'] + response.json()['results']]
+        # Two pages of the eleven matches (Sample Doctor 1 and 10-19), by name
+        self.assertEqual(len(names), 10)
+        self.assertEqual(names, sorted(names))
+
+
+# Doctor schedules
+class DefaultShiftTests(HospitalTestCase):
+    def test_new_doctor_gets_shifts_from_availability(self):
+        department = Department.objects.create(name='Cardiology', description='Heart care.')
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor = Doctor.objects.create(
+                name='New Doctor', email='new@example.com', phone='9000000000', qualification='MD',
+                specialization=department, experience_years=1, consultation_fee=500, gender='F',
+                availability='Mon, Wed, Fri 9am-1pm',
+            )
+        self.assertEqual(
+            sorted(doctor.weekly_shifts.values_list('weekday', 'start_time', 'end_time')),
+            [(weekday, time(9), time(13)) for weekday in (0, 2, 4)],
+        )
+        monday = date.today() + timedelta(days=7 - date.today().weekday())
+        self.assertEqual(slot_index.free_slots(doctor.pk, monday)[:2], ['09:00', '09:30'])
+        self.assertEqual(slot_index.free_slots(doctor.pk, monday + timedelta(days=1)), [])
+
+
+# Generated data
+class GeneratedAppointmentTests(SimpleTestCase):
+    def test_appointments_follow_each_doctors_shifts(self):
+        today = date.today()
+        doctors = [(1, 1, 'Mon, Wed, Fri', 45), (2, 1, 'Mon-Sat, 09:00-13:00', 20), (3, 2, 'Tue, Thu, Sat', 30)]
+        schedules = {pk: DoctorSchedule(minutes, {
+            weekday: [(start, end)] for weekday, start, end in datagen.shifts_from_availability(text)
+        }) for pk, _, text, minutes in doctors}
+        capacity = sum(
+            len(datagen.slot_cells(text, minutes, datagen.booking_days(today, 20))) for _, _, text, minutes in doctors
+        )
+
+        booked = {}
+        for row in datagen.appointment_rows(1, capacity, doctors, [], today, 20):
+            fields = dict(zip(datagen.APPOINTMENT_FIELDS, row))
+            day, value = date.fromisoformat(fields['appointment_date']), time.fromisoformat(fields['appointment_time'])
+            schedule = schedules[fields['doctor']]
+            self.assertEqual(fields['duration_minutes'], schedule.slot_minutes)
+            self.assertIn(value.strftime('%H:%M'), mask_to_times(schedule.offered_mask(day)))
+            booked.setdefault((fields['doctor'], day), []).append(interval(value, fields['duration_minutes']))
+        self.assertEqual(sum(len(intervals) for intervals in booked.values()), capacity)
+        for intervals in booked.values():
+            intervals.sort()
+            self.assertTrue(all(later[0] >= earlier[1] for earlier, later in zip(intervals, intervals[1:])))
+
+        with self.assertRaises(ValueError):
+            list(datagen.appointment_rows(1, capacity + 1, doctors, [], today, 20))
+
+
+# Slot index
+@mock.patch('hospital_system.availability.get_doctor_schedule', mock.Mock(return_value=None))
+class SlotIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SlotIndex()
+        self.today = date.today()
+
+    def blocking_rows(self, doctor_id):
+        """``_rows`` stand-in that stalls loading ``doctor_id``'s grid until released"""
+        started, release = threading.Event(), threading.Event()
+
+        def rows(loading_id, loaded_from, loaded_until):
+            if loading_id == doctor_id:
+                started.set()
+                release.wait(5)
+            return []
+        return mock.patch.object(SlotIndex, '_rows', side_effect=rows), started, release
+
+    @override_settings(SLOT_INDEX_WINDOW_DAYS=7)
+    def test_grid_reads_its_window(self):
+        with mock.patch.object(SlotIndex, '_rows', return_value=[]) as rows:
+            self.index.booked_mask(1, self.today)
+            rows.assert_called_once_with(1, self.today, self.today + timedelta(days=7))
+            later = self.today + timedelta(days=20)
+            self.index.booked_mask(1, later)
+            rows.assert_called_with(1, self.today, later)
+
+    def test_loading_grid_does_not_block_other_doctors(self):
+        patch, started, release = self.blocking_rows(1)
+        with patch:
+            self.index.booked_mask(2, self.today)
+            loader = threading.Thread(target=self.index.booked_mask, args=(1, self.today))
+            loader.start()
+            self.assertTrue(started.wait(5))
+            reader = threading.Thread(target=self.index.booked_mask, args=(2, self.today))
+            reader.start()
+            reader.join(1)
+            blocked = reader.is_alive()
+            release.set()
+            loader.join()
+            reader.join()
+        self.assertFalse(blocked)
+
+    def test_booking_during_load_is_kept(self):
+        patch, started, release = self.blocking_rows(1)
+        with patch as rows:
+            loader = threading.Thread(target=self.index.booked_mask, args=(1, self.today))
+            loader.start()
+            self.assertTrue(started.wait(5))
+            booker = threading.Thread(target=self.index.book, args=(1, self.today, time(9, 0), 30))
+            booker.start()
+            # Waits for the grid instead of updating the one being replaced
+            booker.join(0.2)
+            self.assertTrue(booker.is_alive())
+            release.set()
+            loader.join()
+            booker.join()
+            self.assertNotEqual(self.index.booked_mask(1, self.today), 0)
+        self.assertEqual(rows.call_count, 1)
+
+
+# Slot holds
+class SlotHoldTests(HospitalTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = build_sample_dataset()['doctor']
+
+    def setUp(self):
+        super().setUp()
+        days = slot_index.free_slots_range(self.doctor.pk, date.today(), date.today() + timedelta(days=7))
+        self.day, self.times = next((day, times) for day, times in sorted(days.items()) if len(times) >= 3)
+
+    def hold(self, value, client='10.0.0.1', **data):
+        return self.client.post(reverse('hospital_system:place_slot_hold'), {
+            'doctor': self.doctor.pk, 'date': self.day.isoformat(), 'time': value, **data,
+        }, REMOTE_ADDR=client)
+
+    def test_held_time_is_taken(self):
+        first = self.hold(self.times[0])
+        self.assertEqual(first.status_code, 201)
+        response = self.hold(self.times[0], client='10.0.0.2')
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn(self.times[0], response.json()['available_times'])
+        self.assertNotIn(self.times[0], slot_index.free_slots(self.doctor.pk, self.day))
+
+        self.client.post(reverse('hospital_system:release_slot_hold', args=[first.json()['hold']]))
+        self.assertEqual(self.hold(self.times[0], client='10.0.0.2').status_code, 201)
+
+    def test_replaced_hold_is_released(self):
+        first = self.hold(self.times[0]).json()['hold']
+        second = self.hold(self.times[1], replace=first)
+        self.assertEqual(second.status_code, 201)
+        self.assertFalse(SlotHold.objects.filter(token=first).exists())
+        self.assertIn(self.times[0], slot_index.free_slots(self.doctor.pk, self.day))
+
+    @override_settings(SLOT_HOLD_SECONDS=0)
+    def test_expired_hold_frees_time(self):
+        self.assertEqual(self.hold(self.times[0]).status_code, 201)
+        self.assertIn(self.times[0], slot_index.free_slots(self.doctor.pk, self.day))
+        self.assertEqual(self.hold(self.times[0], client='10.0.0.2').status_code, 201)
+        self.assertEqual(holds.sweep_expired_holds(force=True), 2)
+
+    @override_settings(SLOT_HOLD_MAX_PER_CLIENT=2)
+    def test_holds_per_client(self):
+        first = self.hold(self.times[0]).json()['hold']
+        self.assertEqual(self.hold(self.times[1]).status_code, 201)
+        self.assertEqual(self.hold(self.times[2]).status_code, 429)
+        # Moving a hold does not count against the limit, and other clients have their own
+        self.assertEqual(self.hold(self.times[2], replace=first).status_code, 201)
+        self.assertEqual(self.hold(self.times[0], client='10.0.0.2').status_code, 201)
+
+
+# Job queue
+@jobs.task(name='tests.succeed')
+def succeed():
+    pass
+
+
+@jobs.task(name='tests.fail', max_attempts=2)
+def fail():
+    raise RuntimeError('Failing on purpose')
+
+
+@override_settings(JOB_RETRY_BACKOFF=10, JOB_VISIBILITY_TIMEOUT=60)
+class JobQueueTests(HospitalTestCase):
+    def lapse(self, job):
+        """Let the visibility timeout of ``job``'s claim run out"""
+        Job.objects.filter(pk=job.pk).update(available_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claims_are_exclusive(self):
+        queued = {succeed.enqueue().pk for _ in range(3)}
+        first = jobs.claim('first', limit=2)
+        second = jobs.claim('second', limit=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual({job.pk for job in first + second}, queued)
+        self.assertEqual(jobs.claim('third'), [])
+
+    def test_failed_job_is_retried_after_backoff(self):
+        job = fail.enqueue()
+        before = timezone.now()
+        self.assertFalse(jobs.run_job(jobs.claim('worker')[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('Failing on purpose', job.last_error)
+        # 10 seconds, less up to half of it for jitter
+        self.assertGreaterEqual(job.available_at, before + timedelta(seconds=5))
+        self.assertLessEqual(job.available_at, timezone.now() + timedelta(seconds=10))
+        self.assertEqual(jobs.claim('worker'), [])
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        with mock.patch('hospital_system.jobs.random.uniform', return_value=1.0):
+            self.assertEqual([jobs.backoff(attempts) for attempts in range(1, 5)], [10, 20, 40, 80])
+            with override_settings(JOB_RETRY_BACKOFF_MAX=30):
+                self.assertEqual(jobs.backoff(4), 30)
+
+    @override_settings(JOB_RETRY_BACKOFF=0)
+    def test_job_is_dead_after_max_attempts(self):
+        job = fail.enqueue()
+        with self.assertLogs('hospital_system.jobs', 'ERROR'):
+            for _ in range(2):
+                jobs.run_job(jobs.claim('worker')[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('dead', 2))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(jobs.claim('worker'), [])
+
+        self.assertEqual(jobs.requeue(Job.objects.filter(pk=job.pk)), 1)
+        self.assertEqual(jobs.claim('worker')[0].pk, job.pk)
+
+    def test_lapsed_claim_is_taken_over(self):
+        job = succeed.enqueue()
+        vanished = jobs.claim('vanished')[0]
+        self.assertEqual(jobs.claim('other'), [])
+        self.lapse(vanished)
+        taken_over = jobs.claim('other')[0]
+        self.assertEqual((taken_over.pk, taken_over.attempts), (job.pk, 2))
+        self.assertTrue(jobs.run_job(taken_over))
+        # The vanished worker coming back cannot overwrite the outcome
+        self.assertEqual(jobs._settle(vanished, 'queued', error='stale'), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+
+    def test_claim_lapsing_on_every_attempt_is_dead(self):
+        job = fail.enqueue()
+        for _ in range(2):
+            self.lapse(jobs.claim('vanished')[0])
+        self.assertEqual(jobs.claim('worker'), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'dead')
+        self.assertIn('Visibility timeout', job.last_error)
+
+
+# Image downloads
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers each path with the statuses of ``server.script[path]`` in turn, then 200"""
+
+    def do_GET(self):
+        statuses = self.server.script.get(self.path, [])
+        hits = self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        status = statuses[hits - 1] if hits <= len(statuses) else 200
+        body = b'image' if status == 200 else b'error'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloaderTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+        self.server.script, self.server.hits = {}, {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.downloader = Downloader(workers=2, retries=2, backoff=0, timeout=5)
+
+    def fetch(self, path, *statuses):
+        self.server.script[path] = list(statuses)
+        return self.downloader.fetch(f'http://127.0.0.1:{self.server.server_port}{path}')
+
+    def test_server_errors_are_retried(self):
+        result = self.fetch('/flaky.jpg', 503, 429)
+        self.assertTrue(result.ok)
+        self.assertEqual((result.content, result.attempts, result.error), (b'image', 3, None))
+
+    def test_gives_up_after_retries(self):
+        result = self.fetch('/broken.jpg', 500, 502, 500, 500)
+        self.assertFalse(result.ok)
+        self.assertEqual((result.status, result.attempts, result.error), (500, 3, 'HTTP 500'))
+        self.assertEqual(self.server.hits['/broken.jpg'], 3)
+        checkpoint = Checkpoint(None)
+        checkpoint.mark_failed('row', result.error, result.status)
+        self.assertFalse(checkpoint.is_permanent_failure('row'))
+
+    def test_client_errors_are_not_retried(self):
+        result = self.fetch('/missing.jpg', 404)
+        self.assertEqual((result.status, result.attempts), (404, 1))
+        checkpoint = Checkpoint(None)
+        checkpoint.mark_failed('row', result.error, result.status)
+        self.assertTrue(checkpoint.is_permanent_failure('row'))
+
+    def test_connection_errors_are_retried(self):
+        self.server.shutdown()
+        self.server.server_close()
+        result = self.downloader.fetch(f'http://127.0.0.1:{self.server.server_port}/gone.jpg')
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.status)
+        self.assertEqual(result.attempts, 3)
+        self.assertTrue(result.error)
+
+
+# ASGI fast path
+async def asgi_get(application, path):
+    """Response start and body messages of a GET through ``application``"""
+    communicator = ApplicationCommunicator(application, {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': [],
+    })
+    await communicator.send_input({'type': 'http.request'})
+    start = await communicator.receive_output(5)
+    body = await communicator.receive_output(5)
+    await communicator.wait()
+    return start, body
+
+
+class FastPathTests(TransactionTestCase):
+    # ASGIHandler runs each request's sync code in a thread of its own, which
+    # would block on the locks TestCase's open transaction holds
+    databases = '__all__'
+
+    def setUp(self):
+        invalidate_all()
+
+    def test_lean_handler_leaves_settings_alone(self):
+        changed = []
+
+        def record(setting, **kwargs):
+            changed.append(setting)
+
+        setting_changed.connect(record)
+        try:
+            application = with_fast_paths(ASGIHandler())
+        finally:
+            setting_changed.disconnect(record)
+        self.assertEqual(changed, [])
+
+        dataset = build_sample_dataset()
+        path = reverse('hospital_system:get_doctors_by_department', args=[dataset['department'].pk])
+        start, body = async_to_sync(asgi_get)(application, path)
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(len(json.loads(body['body'])['doctors']), 4)
+        # SecurityHeadersMiddleware ran in place of the full stack's XFrameOptionsMiddleware
+        self.assertIn((b'X-Frame-Options', b'DENY'), start['headers'])
@@ -0,0 +1,360 @@
+"""
+Bulk appointment export and import.
+
+``export_lines`` streams ``Appointment`` rows as CSV or JSONL from a chunked
+``values_list().iterator()``, so memory stays flat whatever the table size;
+``export_appointments`` (view and management command) hand it to a
+``StreamingHttpResponse`` or a file. ``import_appointments`` reads the same
+formats back in batches: each batch is validated field by field without
+touching the database, and its doctor, department, service and patient
+references are checked with one query per table. Then, with the batch's
+doctors locked (see ``bookings.py``), one query finds the rows that would
+break the (doctor, date, time) unique constraint or overlap a scheduled
+appointment of the same doctor, and the remaining rows go in with
+``bulk_create``. ``bulk_create`` sends no signals, so the slot index and
+schedule versions of the affected doctors are invalidated explicitly.
+"""
+import csv
+import json
+from contextlib import nullcontext
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .availability import BLOCKING_STATUSES, DayBookings, interval
+from .bookings import lock_doctors
+from .models import Appointment, Department, Doctor, Patient, Service
+from .signals import schedules_changed
+
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+EXPORT_FIELDS = (
+    'id', 'patient_id', 'patient_name', 'patient_email', 'patient_phone', 'doctor_id', 'department_id',
+    'service_id', 'appointment_date', 'appointment_time', 'duration_minutes', 'reason', 'status', 'notes',
+    'created_at', 'updated_at',
+)
+# Imported rows get new ids and timestamps
+IMPORT_FIELDS = tuple(name for name in EXPORT_FIELDS if name not in ('id', 'created_at', 'updated_at'))
+REFERENCE_FIELDS = {
+    'patient_id': 'patient', 'doctor_id': 'doctor', 'department_id': 'department', 'service_id': 'service',
+}
+# Left empty, these are filled in per batch: the service's duration, or
+# else the doctor's slot length
+DERIVED_FIELDS = ('duration_minutes',)
+
+# Rows per chunk written to the response (one chunk, not one row, per write)
+LINES_PER_CHUNK = 500
+
+
+class _Rollback(Exception):
+    pass
+
+
+# Export
+def export_filters(params):
+    """``export_queryset`` keyword arguments from a dict of strings; ValueError if malformed"""
+    filters = {}
+    for key in ('from', 'to'):
+        if params.get(key):
+            filters['start' if key == 'from' else 'end'] = date.fromisoformat(params[key])
+    if params.get('status'):
+        if params['status'] not in dict(Appointment.STATUS_CHOICES):
+            raise ValueError(f'unknown status {params["status"]!r}')
+        filters['status'] = params['status']
+    if params.get('doctor'):
+        filters['doctor'] = int(params['doctor'])
+    return filters
+
+
+def export_queryset(start=None, end=None, status=None, doctor=None):
+    rows = Appointment.objects.order_by('pk')
+    if start:
+        rows = rows.filter(appointment_date__gte=start)
+    if end:
+        rows = rows.filter(appointment_date__lte=end)
+    if status:
+        rows = rows.filter(status=status)
+    if doctor:
+        rows = rows.filter(doctor_id=doctor)
+    return rows.values_list(*EXPORT_FIELDS)
+
+
+# Date, time and datetime columns, written as ISO 8601
+_ISO_COLUMNS = tuple(
+    i for i, name in enumerate(EXPORT_FIELDS)
+    if name in ('appointment_date', 'appointment_time', 'created_at', 'updated_at')
+)
+
+
+def _serialize(row):
+    row = list(row)
+    for i in _ISO_COLUMNS:
+        if row[i] is not None:
+            row[i] = row[i].isoformat()
+    return row
+
+
+class _Echo:
+    """File-like object whose write() hands back what csv.writer wrote"""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(rows, fmt, chunk_size=2000):
+    """Yield ``rows`` (``export_queryset()``) as text chunks of CSV or JSONL"""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        encode = lambda row: writer.writerow(_serialize(row))  # noqa: E731
+        header = writer.writerow(EXPORT_FIELDS)
+    elif fmt == 'jsonl':
+        encode = lambda row: json.dumps(dict(zip(EXPORT_FIELDS, _serialize(row))), ensure_ascii=False) + '\n'  # noqa: E731
+        header = None
+    else:
+        raise ValueError(f'unknown format {fmt!r}')
+
+    lines = [header] if header else []
+    for row in rows.iterator(chunk_size=chunk_size):
+        lines.append(encode(row))
+        if len(lines) >= LINES_PER_CHUNK:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+# Import
+class ImportResult:
+    """Counts of an import, with the first ``max_reported`` problems of each kind"""
+
+    def __init__(self, max_reported=100):
+        self.created = 0
+        self.conflict_count = 0
+        self.error_count = 0
+        self.conflicts = []
+        self.errors = []
+        self.max_reported = max_reported
+
+    def conflict(self, line):
+        self.conflict_count += 1
+        if len(self.conflicts) < self.max_reported:
+            self.conflicts.append(line)
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_reported:
+            self.errors.append((line, message))
+
+
+def read_records(file, fmt):
+    """Yield (line number, record dict) from a CSV or JSONL text file
+
+    A JSONL line that is not a JSON object is yielded as its raw text, which
+    ``clean_record`` rejects.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(file)
+        # line_num is where a record ends; quoted values can span lines
+        start = 2
+        for record in reader:
+            yield start, record
+            start = reader.line_num + 1
+    elif fmt == 'jsonl':
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, line
+    else:
+        raise ValueError(f'unknown format {fmt!r}')
+
+
+def clean_record(record):
+    """Model-ready field values for one imported record; ValidationError if invalid
+
+    Checks each value against its field (type, length, choices, e-mail
+    syntax) without touching the database; references are checked per batch.
+    """
+    if not isinstance(record, dict):
+        raise ValidationError('not a JSON object')
+    values = {}
+    problems = []
+    for name in IMPORT_FIELDS:
+        raw = record.get(name)
+        if isinstance(raw, str):
+            raw = raw.strip()
+        if name in REFERENCE_FIELDS:
+            field = Appointment._meta.get_field(REFERENCE_FIELDS[name])
+            if raw in (None, ''):
+                if not field.null:
+                    problems.append(f'{name}: required')
+                values[name] = None
+                continue
+            try:
+                values[name] = int(raw)
+            except (TypeError, ValueError):
+                problems.append(f'{name}: not an id: {raw!r}')
+            continue
+
+        field = Appointment._meta.get_field(name)
+        if raw in (None, ''):
+            if name in DERIVED_FIELDS:
+                values[name] = None
+                continue
+            if field.has_default():
+                values[name] = field.get_default()
+                continue
+            if not field.blank:
+                problems.append(f'{name}: required')
+                continue
+        try:
+            values[name] = field.clean('' if raw is None else raw, None)
+        except ValidationError as e:
+            problems.append(f'{name}: {" ".join(e.messages)}')
+    if problems:
+        raise ValidationError('; '.join(problems))
+    return values
+
+
+def import_appointments(records, batch_size=500, dry_run=False):
+    """Validate and insert (line number, record) pairs batch by batch
+
+    Each batch commits on its own, so an interrupted import keeps the batches
+    before it. Invalid rows and rows whose slot is taken (in the database or
+    earlier in the file) are skipped and reported. ``dry_run`` runs every
+    check and insert, then rolls the whole import back.
+    """
+    result = ImportResult()
+    try:
+        with transaction.atomic() if dry_run else nullcontext():
+            batch = []
+            for line, record in records:
+                try:
+                    batch.append((line, clean_record(record)))
+                except ValidationError as e:
+                    result.error(line, ' '.join(e.messages))
+                if len(batch) >= batch_size:
+                    _import_batch(batch, result)
+                    batch = []
+            if batch:
+                _import_batch(batch, result)
+            if dry_run:
+                raise _Rollback
+    except _Rollback:
+        pass
+    return result
+
+
+def _import_batch(batch, result):
+    batch = _check_references(batch, result)
+    # Bookings through Appointment.save() lock the doctor too, but a row
+    # written without the lock between the conflict query and the insert
+    # fails the whole statement: look again once
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                lock_doctors({values['doctor_id'] for _, values in batch})
+                rows, conflicts = _without_conflicts(batch)
+                Appointment.objects.bulk_create([Appointment(**values) for _, values in rows])
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+    result.created += len(rows)
+    for line in conflicts:
+        result.conflict(line)
+
+    schedules_changed(values['doctor_id'] for _, values in rows)
+
+
+def _check_references(batch, result):
+    """Drop (and report) rows naming a missing doctor, department, service or
+    patient, and fill in missing durations"""
+    doctors = {
+        doctor_id: (department_id, slot_minutes)
+        for doctor_id, department_id, slot_minutes in Doctor.objects.filter(
+            pk__in={values['doctor_id'] for _, values in batch}
+        ).values_list('id', 'specialization_id', 'slot_minutes')
+    }
+    departments = set(
+        Department.objects.filter(pk__in={values['department_id'] for _, values in batch})
+        .values_list('id', flat=True)
+    )
+    patient_ids = {values['patient_id'] for _, values in batch} - {None}
+    patients = set(Patient.objects.filter(pk__in=patient_ids).values_list('id', flat=True)) if patient_ids else set()
+    service_ids = {values['service_id'] for _, values in batch} - {None}
+    services = {
+        service_id: (department_id, duration)
+        for service_id, department_id, duration in Service.objects.filter(pk__in=service_ids)
+        .values_list('id', 'department_id', 'duration_minutes')
+    } if service_ids else {}
+
+    valid = []
+    for line, values in batch:
+        if values['doctor_id'] not in doctors:
+            result.error(line, f'doctor_id: no doctor {values["doctor_id"]}')
+        elif values['department_id'] not in departments:
+            result.error(line, f'department_id: no department {values["department_id"]}')
+        elif doctors[values['doctor_id']][0] != values['department_id']:
+            result.error(line, f'department_id: doctor {values["doctor_id"]} is not in department '
+                               f'{values["department_id"]}')
+        elif values['patient_id'] is not None and values['patient_id'] not in patients:
+            result.error(line, f'patient_id: no patient {values["patient_id"]}')
+        elif values['service_id'] is not None and values['service_id'] not in services:
+            result.error(line, f'service_id: no service {values["service_id"]}')
+        elif values['service_id'] is not None and services[values['service_id']][0] != values['department_id']:
+            result.error(line, f'service_id: service {values["service_id"]} is not in department '
+                               f'{values["department_id"]}')
+        else:
+            if values['duration_minutes'] is None:
+                if values['service_id'] is not None:
+                    values['duration_minutes'] = services[values['service_id']][1]
+                else:
+                    values['duration_minutes'] = doctors[values['doctor_id']][1]
+            valid.append((line, values))
+    return valid
+
+
+def _without_conflicts(batch):
+    """(rows to insert, line numbers of rows whose slot is taken)
+
+    A slot is taken when another appointment of the doctor starts at the
+    same time (the unique constraint covers every status, cancelled
+    included) or, for a scheduled row, when a scheduled appointment of the
+    doctor overlaps it.
+    """
+    if not batch:
+        return [], []
+    dates = [values['appointment_date'] for _, values in batch]
+    # One query: the batch's doctors over its date range, filtered exactly here
+    taken = set()
+    booked = {}
+    for doctor_id, day, value, minutes, status in Appointment.objects.filter(
+        doctor_id__in={values['doctor_id'] for _, values in batch},
+        appointment_date__range=(min(dates), max(dates)),
+    ).order_by().values_list('doctor_id', 'appointment_date', 'appointment_time', 'duration_minutes', 'status'):
+        taken.add((doctor_id, day, value))
+        if status in BLOCKING_STATUSES:
+            booked.setdefault((doctor_id, day), []).append(interval(value, minutes))
+    booked = {key: DayBookings(intervals) for key, intervals in booked.items()}
+
+    rows, conflicts = [], []
+    for line, values in batch:
+        day = (values['doctor_id'], values['appointment_date'])
+        slot = day + (values['appointment_time'],)
+        blocking = values['status'] in BLOCKING_STATUSES
+        start, end = interval(values['appointment_time'], values['duration_minutes'])
+        bookings = booked.get(day)
+        if slot in taken or (blocking and bookings and bookings.overlaps(start, end)):
+            conflicts.append(line)
+            continue
+        taken.add(slot)
+        if blocking:
+            booked.setdefault(day, DayBookings()).add(start, end)
+        rows.append((line, values))
+    return rows, conflicts
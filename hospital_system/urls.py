@@ -1,9 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
 
 app_name = 'hospital_system'
 
+# The booking form's AJAX endpoints run as coroutines under ASGI (asgi.py
+# turns ASYNC_VIEWS on); under WSGI the plain views skip the event loop
+# Django would otherwise start for every request.
+if settings.ASYNC_VIEWS:
+    doctors_by_department_view, available_slots_view = views.aget_doctors_by_department, views.aget_available_slots
+else:
+    doctors_by_department_view, available_slots_view = views.get_doctors_by_department, views.get_available_slots
+
 urlpatterns = [
     # Landing and main pages
     path('', views.landing, name='landing'),
@@ -30,8 +39,14 @@ urlpatterns = [
     path('cost-estimate/', views.cost_estimate, name='cost_estimate'),
     
     # AJAX endpoints
-    path('api/doctors-by-department/<int:dept_id>/', views.get_doctors_by_department, name='get_doctors_by_department'),
-    path('api/available-slots/', views.get_available_slots, name='get_available_slots'),
+    path('api/doctors-by-department/<int:dept_id>/', doctors_by_department_view, name='get_doctors_by_department'),
+    path('api/available-slots/', available_slots_view, name='get_available_slots'),
+    path('api/slot-holds/', views.place_slot_hold, name='place_slot_hold'),
+    path('api/slot-holds/<str:token>/release/', views.release_slot_hold, name='release_slot_hold'),
+    path('api/availability-matrix/<int:dept_id>/', views.get_availability_matrix, name='get_availability_matrix'),
+    path('api/search/', views.search, name='search'),
+    path('api/doctors/', views.doctors_api, name='doctors_api'),
+    path('api/services/', views.services_api, name='services_api'),
 
     # Authentication
     path('accounts/login/', views.login_user, name='login'),
@@ -39,4 +54,57 @@ urlpatterns = [
     path('accounts/register/', views.register, name='register'),
     path('dashboard/', views.patient_dashboard, name='patient_dashboard'),
     path('profile/update/', views.update_profile, name='update_profile'),
+
+    # Instrumentation
+    path('api/query-metrics/', views.query_metrics, name='query_metrics'),
+
+    # Bulk export
+    path('api/appointments/export/', views.export_appointments, name='export_appointments'),
 ]
+
+# Login role each route is exercised with by check_query_budgets
+ROUTE_ROLES = {
+    'home': 'patient',
+    'patient_dashboard': 'patient',
+    'update_profile': 'patient',
+    'query_metrics': 'staff',
+    'export_appointments': 'staff',
+}
+
+# Maximum SQL queries per request for each route, enforced by
+# `manage.py check_query_budgets`. Budgets must not grow with data size.
+# Statements on the cache database count like any other: with the default
+# DatabaseCache, reading the content versions, the session, the logged-in
+# user and each cached template fragment is one SELECT there. They describe a
+# warm process (reference data, slot grids, sessions and identities already
+# cached).
+QUERY_BUDGETS = {
+    'landing': 1,
+    'home': 6,
+    'about': 1,
+    'contact': 1,
+    'departments': 1,
+    'department_detail': 2,
+    'doctors': 2,
+    'doctor_detail': 3,
+    'services': 2,
+    'book_appointment': 2,
+    'appointment_confirmation': 2,
+    'cost_estimate': 1,
+    'get_doctors_by_department': 1,
+    'get_available_slots': 1,
+    'get_availability_matrix': 3,
+    # POSTs, replacing the form's previous hold and releasing a live one
+    'place_slot_hold': 10,
+    'release_slot_hold': 2,
+    'search': 1,
+    'doctors_api': 1,
+    'services_api': 1,
+    'login': 0,
+    'register': 1,
+    'patient_dashboard': 5,
+    'update_profile': 3,
+    'query_metrics': 2,
+    # The rows are read while the response streams
+    'export_appointments': 2,
+}
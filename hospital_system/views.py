@@ -1,7 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.urls import reverse
 from django.views.generic import ListView, DetailView
-from django.http import JsonResponse
-from django.db.models import Q
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 from datetime import datetime, timedelta
 from .models import (
     Hospital, Department, Doctor, Patient, Appointment, 
@@ -10,6 +13,22 @@ from .models import (
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from .forms import UserRegistrationForm
+from .availability import availability_matrix, mask_to_times, schedule_label, slot_index
+from .bookings import SlotUnavailable
+from . import holds
+from .idempotency import idempotent_post
+from .imaging import image_url
+from .pagecache import public_page
+from .querymetrics import metrics
+from . import search as search_index
+from . import tasks
+from . import transfer
+from .pagination import keyset_page, numbered_page
+from .refdata import (
+    aget_department_doctors, content_version, get_department_doctors, get_departments, get_doctor_schedule,
+    get_hospital, get_infrastructure, get_services,
+)
+from django.contrib.admin.views.decorators import staff_member_required
 
 
 # Landing Page (Public)
@@ -18,7 +37,7 @@ def landing(request):
     if request.user.is_authenticated:
         return redirect('hospital_system:home')
     
-    hospital = Hospital.objects.first()
+    hospital = get_hospital()
     context = {
         'hospital': hospital,
     }
@@ -41,30 +60,39 @@ def login_user(request):
             return redirect('hospital_system:home')
         else:
             return render(request, 'landing.html', {
-                'hospital': Hospital.objects.first(),
+                'hospital': get_hospital(),
                 'error': 'Invalid username or password',
             })
     
     return redirect('hospital_system:landing')
 
 
+SEARCH_PAGE_SIZE = 20
+# Deeper pages are never useful and cost an ever larger OFFSET scan
+SEARCH_MAX_PAGE = 50
+DOCTORS_PER_PAGE = 24
+SERVICES_PER_PAGE = 24
+DASHBOARD_PER_PAGE = 10
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Models whose changes alter the cached home page fragments
+HOME_FRAGMENT_MODELS = (
+    'hospital_system.department',
+    'hospital_system.infrastructure',
+    'hospital_system.testimonial',
+)
+
+
 # Home View
 @login_required(login_url='hospital_system:landing')
 def home(request):
     """Home page with hospital info and departments - requires login"""
-    hospital = Hospital.objects.first()
-    departments = Department.objects.all()
-    infrastructure = Infrastructure.objects.all()
-    testimonials = Testimonial.objects.filter(is_published=True)[:6]
-    
-    default_dept_image = 'https://images.unsplash.com/photo-1580281657526-3e6a4e8f2d56?auto=format&fit=crop&w=800&q=60'
-
-    # Build a list of departments with images from model
-    departments_with_images = []
-    for d in departments:
-        # Use department's image if available, otherwise use default
-        img = d.image.url if d.image else default_dept_image
-        departments_with_images.append({'dept': d, 'image': img})
+    hospital = get_hospital()
+    departments = get_departments()
+    infrastructure = get_infrastructure()
+    # Lazy: only evaluated when the testimonials fragment is not cached
+    testimonials = Testimonial.objects.filter(is_published=True).select_related('doctor')[:6]
 
     # Fallback doctor image (used when doctor.image is not provided)
     fallback_doctor_image = 'https://images.unsplash.com/photo-1607746882042-944635dfe10e?auto=format&fit=crop&w=800&q=60'
@@ -72,35 +100,34 @@ def home(request):
     context = {
         'hospital': hospital,
         'departments': departments,
-        'departments_with_images': departments_with_images,
+        # Called by the template only when the department fragment is rebuilt
+        'departments_with_images': lambda: _departments_with_images(departments),
         'infrastructure': infrastructure,
         'testimonials': testimonials,
         'fallback_doctor_image': fallback_doctor_image,
+        'fragment_timeout': getattr(settings, 'HOME_FRAGMENT_CACHE_TIMEOUT', 3600),
+        'home_version': content_version(*HOME_FRAGMENT_MODELS),
     }
     return render(request, 'index.html', context)
 
 
 # Services/Departments
+@public_page('hospital_system.department')
 def departments(request):
     """List all departments"""
-    departments = Department.objects.all()
-    default_dept_image = 'https://images.unsplash.com/photo-1580281657526-3e6a4e8f2d56?auto=format&fit=crop&w=800&q=60'
-    departments_with_images = []
-    for d in departments:
-        # Use department's image if available, otherwise use default
-        img = d.image.url if d.image else default_dept_image
-        departments_with_images.append({'dept': d, 'image': img})
+    departments_with_images = _departments_with_images(get_departments())
     return render(request, 'departments.html', {'departments_with_images': departments_with_images})
 
 
+@public_page('hospital_system.department', 'hospital_system.service', 'hospital_system.doctor')
 def department_detail(request, pk):
     """Department detail view with services and doctors"""
-    department = get_object_or_404(Department, pk=pk)
-    services = Service.objects.filter(department=department)
+    department = _find_or_404(get_departments(), pk)
+    services = [s for s in get_services() if s.department_id == department.pk]
     doctors = Doctor.objects.filter(specialization=department)
     # Use department's image, default to unsplash
     default_dept_image = 'https://images.unsplash.com/photo-1580281657526-3e6a4e8f2d56?auto=format&fit=crop&w=800&q=60'
-    dept_image = department.image.url if department.image else default_dept_image
+    dept_image = image_url(department, 400) or default_dept_image
 
     context = {
         'department': department,
@@ -112,27 +139,17 @@ def department_detail(request, pk):
 
 
 # Doctors
+@public_page('hospital_system.doctor', 'hospital_system.department')
 def doctors(request):
     """List all doctors with filter option"""
-    doctors = Doctor.objects.all()
-    departments = Department.objects.all()
-    
-    # Filter by department
-    dept_id = request.GET.get('department')
-    if dept_id:
-        doctors = doctors.filter(specialization_id=dept_id)
-    
-    # Search by name
-    search = request.GET.get('search')
-    if search:
-        doctors = doctors.filter(
-            Q(name__icontains=search) | 
-            Q(qualification__icontains=search)
-        )
+    page, dept_id, search = _doctors_page(request, Doctor.objects.select_related('specialization'))
+    departments = get_departments()
     
     fallback_doctor_image = 'https://images.unsplash.com/photo-1607746882042-944635dfe10e?auto=format&fit=crop&w=800&q=60'
     context = {
-        'doctors': doctors,
+        'doctors': page,
+        'page': page,
+        **_page_links(request, page),
         'departments': departments,
         'selected_department': dept_id,
         'search': search,
@@ -141,23 +158,63 @@ def doctors(request):
     return render(request, 'doctors.html', context)
 
 
+def doctors_api(request):
+    """JSON variant of the doctors listing (same filters, keyset-paginated)"""
+    doctors = Doctor.objects.select_related('specialization').only(
+        'name', 'qualification', 'experience_years', 'consultation_fee', 'gender',
+        'availability', 'image', 'is_available', 'specialization__name',
+    )
+    page, _, _ = _doctors_page(request, doctors, per_page=_api_page_size(request))
+    data = {
+        'results': [
+            {
+                'id': d.id,
+                'name': f"Dr. {d.name}",
+                'department': d.specialization.name,
+                'department_id': d.specialization_id,
+                'qualification': d.qualification,
+                'experience_years': d.experience_years,
+                'consultation_fee': str(d.consultation_fee),
+                'gender': d.gender,
+                'availability': d.availability,
+                'is_available': d.is_available,
+                'image': d.image.url if d.image else None,
+                'url': reverse('hospital_system:doctor_detail', args=[d.id]),
+            }
+            for d in page
+        ],
+        'next_cursor': page.next_cursor,
+    }
+    return JsonResponse(data)
+
+
+@public_page(
+    'hospital_system.doctor', 'hospital_system.department',
+    lambda kwargs: schedule_label(kwargs['pk']), daily=True,
+)
 def doctor_detail(request, pk):
     """Doctor detail view"""
-    doctor = get_object_or_404(Doctor, pk=pk)
+    doctor = get_object_or_404(Doctor.objects.select_related('specialization'), pk=pk)
     available_dates = _get_available_booking_dates()
-    available_times = _get_available_booking_times()
+    free_masks = availability_matrix([doctor.pk], available_dates)[doctor.pk]
+
+    # Only list days that still have at least one open slot
+    available_slots = [
+        {'date': day, 'times': mask_to_times(mask)}
+        for day, mask in zip(available_dates, free_masks) if mask
+    ]
     
     fallback_doctor_image = 'https://images.unsplash.com/photo-1607746882042-944635dfe10e?auto=format&fit=crop&w=800&q=60'
     context = {
         'doctor': doctor,
-        'available_dates': available_dates,
-        'available_times': available_times,
+        'available_slots': available_slots,
         'fallback_doctor_image': fallback_doctor_image,
     }
     return render(request, 'doctor_detail.html', context)
 
 
 # Appointments
+@idempotent_post
 def book_appointment(request):
     """Book an appointment"""
     from django.db import IntegrityError
@@ -169,6 +226,7 @@ def book_appointment(request):
         q_department = request.GET.get('department')
         q_date = request.GET.get('date')
         q_time = request.GET.get('time')
+        q_service = request.GET.get('service')
         if q_doctor:
             form_data['doctor_id'] = q_doctor
         if q_department:
@@ -177,6 +235,8 @@ def book_appointment(request):
             form_data['appointment_date'] = q_date
         if q_time:
             form_data['appointment_time'] = q_time
+        if q_service:
+            form_data['service_id'] = q_service
 
     if request.method == 'POST':
         patient_name = request.POST.get('patient_name')
@@ -184,9 +244,11 @@ def book_appointment(request):
         patient_phone = request.POST.get('patient_phone')
         doctor_id = request.POST.get('doctor')
         department_id = request.POST.get('department')
+        service_id = request.POST.get('service')
         appointment_date = request.POST.get('appointment_date')
         appointment_time = request.POST.get('appointment_time')
         reason = request.POST.get('reason')
+        hold = request.POST.get('hold') or None
 
         form_data = {
             'patient_name': patient_name,
@@ -194,96 +256,167 @@ def book_appointment(request):
             'patient_phone': patient_phone,
             'doctor_id': doctor_id,
             'department_id': department_id,
+            'service_id': service_id,
             'appointment_date': appointment_date,
             'appointment_time': appointment_time,
             'reason': reason,
+            'hold': hold,
         }
 
         # Basic validation
         if not (patient_name and patient_email and patient_phone and doctor_id and department_id and appointment_date and appointment_time):
             return render(request, 'book_appointment.html', {
                 'error': 'Please fill all required fields.',
-                'departments': Department.objects.all(),
+                'departments': get_departments(),
                 'doctors': Doctor.objects.filter(is_available=True),
-                'available_dates': _get_available_booking_dates(),
-                'available_times': _get_available_booking_times(),
+                **_booking_slots(form_data),
                 'form_data': form_data,
             })
 
         # Parse date/time
         try:
             from datetime import datetime
+            doctor_pk = int(doctor_id)
             appt_date = datetime.strptime(appointment_date, '%Y-%m-%d').date()
             appt_time = datetime.strptime(appointment_time, '%H:%M').time()
         except Exception as e:
             return render(request, 'book_appointment.html', {
                 'error': 'Invalid date or time format.',
-                'departments': Department.objects.all(),
+                'departments': get_departments(),
                 'doctors': Doctor.objects.filter(is_available=True),
-                'available_dates': _get_available_booking_dates(),
-                'available_times': _get_available_booking_times(),
+                **_booking_slots(form_data),
+                'form_data': form_data,
+            })
+
+        # The service sets the appointment's length; without one it takes a
+        # single slot of the doctor's
+        service = _booking_service(service_id)
+        if service_id and (service is None or str(service.department_id) != department_id):
+            return render(request, 'book_appointment.html', {
+                'error': 'The selected service is not offered by this department.',
+                'departments': get_departments(),
+                'doctors': Doctor.objects.filter(is_available=True),
+                **_booking_slots(form_data),
+                'form_data': form_data,
+            })
+        duration = service.duration_minutes if service else get_doctor_schedule(doctor_pk).slot_minutes
+
+        # Only start times the doctor's schedule offers and from which the
+        # whole appointment is free, read from the precomputed grid (the
+        # form's own hold on the time does not count)
+        if not slot_index.is_free(doctor_pk, appt_date, appt_time, duration, hold=hold):
+            return render(request, 'book_appointment.html', {
+                'error': 'Selected slot is not available. Please choose another slot.',
+                'departments': get_departments(),
+                'doctors': Doctor.objects.filter(is_available=True),
+                **_booking_slots(form_data),
                 'form_data': form_data,
             })
 
         try:
-            appointment = Appointment.objects.create(
-                patient_name=patient_name,
-                patient_email=patient_email,
-                patient_phone=patient_phone,
-                doctor_id=doctor_id,
-                department_id=department_id,
-                appointment_date=appt_date,
-                appointment_time=appt_time,
-                reason=reason,
-            )
+            with transaction.atomic():
+                # The time passes from the form's hold to the appointment in
+                # one transaction. Without a live hold (none taken, or it
+                # expired) the save's own overlap check decides.
+                if hold:
+                    holds.claim_hold(hold, doctor_pk)
+                appointment = Appointment.objects.create(
+                    patient=_current_patient(request),
+                    patient_name=patient_name,
+                    patient_email=patient_email,
+                    patient_phone=patient_phone,
+                    doctor_id=doctor_id,
+                    department_id=department_id,
+                    service=service,
+                    appointment_date=appt_date,
+                    appointment_time=appt_time,
+                    duration_minutes=duration,
+                    reason=reason,
+                )
             return redirect('hospital_system:appointment_confirmation', pk=appointment.pk)
         except IntegrityError:
             return render(request, 'book_appointment.html', {
                 'error': 'Selected slot is already booked. Please choose another slot.',
-                'departments': Department.objects.all(),
+                'departments': get_departments(),
                 'doctors': Doctor.objects.filter(is_available=True),
-                'available_dates': _get_available_booking_dates(),
-                'available_times': _get_available_booking_times(),
+                **_booking_slots(form_data),
                 'form_data': form_data,
             })
         except Exception as e:
             return render(request, 'book_appointment.html', {
                 'error': str(e),
-                'departments': Department.objects.all(),
+                'departments': get_departments(),
                 'doctors': Doctor.objects.filter(is_available=True),
-                'available_dates': _get_available_booking_dates(),
-                'available_times': _get_available_booking_times(),
+                **_booking_slots(form_data),
                 'form_data': form_data,
             })
 
     doctors = Doctor.objects.filter(is_available=True)
-    departments = Department.objects.all()
-    available_dates = _get_available_booking_dates()
-    available_times = _get_available_booking_times()
+    departments = get_departments()
 
     context = {
         'doctors': doctors,
         'departments': departments,
-        'available_dates': available_dates,
-        'available_times': available_times,
+        **_booking_slots(form_data),
         'form_data': form_data,
     }
     return render(request, 'book_appointment.html', context)
 
 
+def _booking_slots(form_data):
+    """Service, date and time choices of the booking form
+
+    Every service, every day in the booking window (the page's script greys
+    out the days the chosen doctor has no slot on), and the times on the
+    chosen day from which the chosen doctor is free for the length of the
+    chosen service, if the doctor and day are known.
+    """
+    choices = {'services': get_services(), 'available_dates': _get_available_booking_dates(), 'available_times': []}
+    try:
+        doctor_id = int(form_data.get('doctor_id'))
+        day = datetime.strptime(form_data.get('appointment_date'), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return choices
+    service = _booking_service(form_data.get('service_id'))
+    choices['available_times'] = slot_index.free_slots(doctor_id, day, service and service.duration_minutes)
+    return choices
+
+
+def _booking_service(service_id):
+    """The Service with pk ``service_id`` from the cached list, or None"""
+    try:
+        service_id = int(service_id)
+    except (TypeError, ValueError):
+        return None
+    return next((service for service in get_services() if service.pk == service_id), None)
+
+
+def _current_patient(request):
+    """The logged-in user's Patient record, or None"""
+    if not request.user.is_authenticated:
+        return None
+    try:
+        return request.user.patient
+    except Patient.DoesNotExist:
+        return None
+
+
 def appointment_confirmation(request, pk):
     """Show appointment confirmation"""
-    appointment = get_object_or_404(Appointment, pk=pk)
+    appointment = get_object_or_404(Appointment.objects.select_related('doctor', 'department'), pk=pk)
     return render(request, 'appointment_confirmation.html', {'appointment': appointment})
 
 
 # Contact
 def contact(request):
     """Contact page"""
-    hospital = Hospital.objects.first()
+    hospital = get_hospital()
     
     if request.method == 'POST':
-        # Handle contact form submission
+        # Mailed by the background worker, so a slow mail server cannot hold up the page
+        tasks.deliver_contact_message.enqueue(**{
+            field: request.POST.get(field, '') for field in ('name', 'email', 'phone', 'subject', 'message')
+        })
         return render(request, 'contact_success.html', {
             'name': request.POST.get('name'),
         })
@@ -292,10 +425,11 @@ def contact(request):
 
 
 # About
+@public_page('hospital_system.hospital', 'hospital_system.department')
 def about(request):
     """About hospital page"""
-    hospital = Hospital.objects.first()
-    departments = Department.objects.all()
+    hospital = get_hospital()
+    departments = get_departments()
     
     context = {
         'hospital': hospital,
@@ -305,77 +439,316 @@ def about(request):
 
 
 # Services
+@public_page('hospital_system.service', 'hospital_system.department')
 def services(request):
     """All services page"""
-    services = Service.objects.all()
-    departments = Department.objects.all()
-    
-    dept_id = request.GET.get('department')
-    if dept_id:
-        services = services.filter(department_id=dept_id)
+    page, dept_id = _services_page(request)
+    departments = get_departments()
     
     context = {
-        'services': services,
+        'services': page,
+        'page': page,
+        **_page_links(request, page),
         'departments': departments,
         'selected_department': dept_id,
     }
     return render(request, 'services.html', context)
 
 
+def services_api(request):
+    """JSON variant of the services listing (same filters, keyset-paginated)"""
+    page, _ = _services_page(request, per_page=_api_page_size(request))
+    data = {
+        'results': [
+            {
+                'id': s.id,
+                'name': s.name,
+                'description': s.description,
+                'department': s.department.name,
+                'department_id': s.department_id,
+                'cost_estimate': None if s.cost_estimate is None else str(s.cost_estimate),
+            }
+            for s in page
+        ],
+        'next_cursor': page.next_cursor,
+    }
+    return JsonResponse(data)
+
+
 def get_doctors_by_department(request, dept_id):
     """AJAX endpoint to get doctors by department"""
-    doctors = Doctor.objects.filter(specialization_id=dept_id, is_available=True)
+    return JsonResponse(_doctors_payload(get_department_doctors(dept_id)))
+
+
+async def aget_doctors_by_department(request, dept_id):
+    """Async get_doctors_by_department, routed under ASGI"""
+    return JsonResponse(_doctors_payload(await aget_department_doctors(dept_id)))
+
+
+def _doctors_payload(doctors):
+    return {'doctors': [{'id': doctor_id, 'name': f"Dr. {name}"} for doctor_id, name in doctors]}
+
+
+def get_available_slots(request):
+    """AJAX endpoint to get available appointment slots
+
+    ``available_times`` are the start times from which an appointment of
+    ``duration`` minutes (default: one of the doctor's slots) is free;
+    ``free_gaps`` the stretches of free working time at least that long.
+    """
+    try:
+        doctor_id, appointment_date, duration = _slot_query(request)
+    except ValueError:
+        return _invalid_slot_query()
+
+    # Free slots come straight from the doctor's grid
+    return JsonResponse({
+        'available_times': slot_index.free_slots(doctor_id, appointment_date, duration),
+        'free_gaps': slot_index.free_gaps(doctor_id, appointment_date, duration),
+    })
+
+
+async def aget_available_slots(request):
+    """Async get_available_slots, routed under ASGI
+
+    Loaded grids answer without leaving the event loop; a missing one is read
+    with the async ORM.
+    """
+    try:
+        doctor_id, appointment_date, duration = _slot_query(request)
+    except ValueError:
+        return _invalid_slot_query()
+
+    return JsonResponse({
+        'available_times': await slot_index.afree_slots(doctor_id, appointment_date, duration),
+        'free_gaps': await slot_index.afree_gaps(doctor_id, appointment_date, duration),
+    })
+
+
+def _slot_query(request):
+    """(doctor id, date, duration or None) from the slot endpoint's query string; ValueError if malformed"""
+    try:
+        doctor_id = int(request.GET.get('doctor'))
+        appointment_date = datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date()
+    except TypeError:
+        raise ValueError('missing doctor or date')
+    return doctor_id, appointment_date, _duration_query(request)
+
+
+def _duration_query(request):
+    """Appointment length in minutes from ``?duration=``, or None; ValueError if malformed"""
+    duration = request.GET.get('duration')
+    if not duration:
+        return None
+    duration = int(duration)
+    if not 0 < duration <= 24 * 60:
+        raise ValueError('duration out of range')
+    return duration
+
+
+def _invalid_slot_query():
+    return JsonResponse({'error': 'Invalid doctor, date or duration.', 'available_times': []}, status=400)
+
+
+@require_POST
+def place_slot_hold(request):
+    """AJAX endpoint holding a start time for the booking form (see holds.py)
+
+    Takes ``doctor``, ``date``, ``time``, optionally ``service`` (which sets
+    the length, as in ``book_appointment``) and ``replace``, the form's
+    previous hold. Answers 201 with the hold's token, 409 with the times
+    still free when the time was taken meanwhile, or 429 when the client
+    holds too many times already.
+    """
+    try:
+        doctor_id = int(request.POST.get('doctor'))
+        day = datetime.strptime(request.POST.get('date'), '%Y-%m-%d').date()
+        value = datetime.strptime(request.POST.get('time'), '%H:%M').time()
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid doctor, date or time.'}, status=400)
+    service = _booking_service(request.POST.get('service'))
+    duration = service.duration_minutes if service else get_doctor_schedule(doctor_id).slot_minutes
+    replace = request.POST.get('replace') or None
+    client = request.META.get('REMOTE_ADDR', '')
+
+    # Most lost races are answered from the grid, without a write
+    if slot_index.is_free(doctor_id, day, value, duration, hold=replace):
+        try:
+            hold = holds.place_hold(doctor_id, day, value, duration, replace, client)
+        except SlotUnavailable:
+            pass
+        except holds.HoldLimitReached:
+            return JsonResponse({
+                'error': 'You are holding too many times already. Please book or wait a few minutes.',
+            }, status=429)
+        else:
+            return JsonResponse({
+                'hold': hold.token,
+                'expires_at': hold.expires_at.isoformat(),
+                'expires_in': holds.hold_seconds(),
+            }, status=201)
+    return JsonResponse({
+        'error': 'This time is no longer free. Please choose another.',
+        'available_times': slot_index.free_slots(doctor_id, day, duration),
+    }, status=409)
+
+
+@require_POST
+def release_slot_hold(request, token):
+    """AJAX endpoint giving up a hold the booking form no longer needs"""
+    holds.release_hold(token)
+    return JsonResponse({'released': token})
+
+
+def get_availability_matrix(request, dept_id):
+    """AJAX endpoint with every doctor's free slots in a department for the booking window
+
+    ``times`` lists every start time any of the doctors offers. Each doctor's
+    ``free`` list holds, per entry of ``dates``, the indexes into ``times`` of
+    the start times still open on that day for an appointment of
+    ``?duration=`` minutes (default: one of the doctor's slots).
+    """
+    try:
+        duration = _duration_query(request)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid duration.'}, status=400)
+    doctors = list(
+        Doctor.objects.filter(specialization_id=dept_id, is_available=True)
+        .values_list('id', 'name')
+    )
+    dates = _get_available_booking_dates()
+    matrix = availability_matrix([doctor_id for doctor_id, _ in doctors], dates, duration)
+
+    # Slot lengths and hours differ between doctors: index the department's union of start times
+    offered = 0
+    for masks in matrix.values():
+        for mask in masks:
+            offered |= mask
+    times = mask_to_times(offered)
+    positions = {time: i for i, time in enumerate(times)}
+
     data = {
-        'doctors': [{'id': d.id, 'name': f"Dr. {d.name}"} for d in doctors]
+        'department': dept_id,
+        'dates': [d.isoformat() for d in dates],
+        'times': times,
+        'doctors': [
+            {
+                'id': doctor_id, 'name': f"Dr. {name}",
+                'free': [[positions[time] for time in mask_to_times(mask)] for mask in matrix[doctor_id]],
+            }
+            for doctor_id, name in doctors
+        ],
     }
     return JsonResponse(data)
 
 
-def get_available_slots(request):
-    """AJAX endpoint to get available appointment slots"""
-    doctor_id = request.GET.get('doctor')
-    appointment_date = request.GET.get('date')
-    
-    # Get existing appointments for this doctor on this date
-    existing = Appointment.objects.filter(
-        doctor_id=doctor_id,
-        appointment_date=appointment_date,
-        status='scheduled'
-    ).values_list('appointment_time', flat=True)
-    
-    # Available times (9 AM to 5 PM with 30 min slots)
-    all_times = _get_available_booking_times()
-    available_times = [t for t in all_times if t not in existing]
-    
-    return JsonResponse({'available_times': available_times})
+def search(request):
+    """AJAX endpoint for ranked full-text search across doctors, departments and services"""
+    query = request.GET.get('q', '').strip()
+    kinds = [k for k in request.GET.getlist('kind') if k in search_index.KINDS] or list(search_index.KINDS)
+    try:
+        page = min(max(1, int(request.GET.get('page', 1))), SEARCH_MAX_PAGE)
+    except ValueError:
+        page = 1
+    per_page = SEARCH_PAGE_SIZE
+
+    # One extra row tells us whether there is a next page without a COUNT
+    hits = search_index.search(query, kinds, limit=per_page + 1, offset=(page - 1) * per_page)
+    has_next = len(hits) > per_page and page < SEARCH_MAX_PAGE
+    hits = hits[:per_page]
+
+    for hit in hits:
+        if hit['kind'] == 'doctor':
+            hit['url'] = reverse('hospital_system:doctor_detail', args=[hit['id']])
+        elif hit['kind'] == 'department':
+            hit['url'] = reverse('hospital_system:department_detail', args=[hit['id']])
+        else:
+            hit['url'] = reverse('hospital_system:services')
+
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'has_next': has_next,
+        'results': hits,
+    })
 
 
 # Helper functions
-def _get_available_booking_dates():
-    """Get available dates for appointment booking (next 30 days, excluding Sundays)"""
-    available_dates = []
-    current_date = datetime.now().date() + timedelta(days=1)
-    
-    for i in range(30):
-        check_date = current_date + timedelta(days=i)
-        if check_date.weekday() != 6:  # Exclude Sundays (6)
-            available_dates.append(check_date)
+def _doctors_page(request, doctors, per_page=None):
+    """Apply the department/search filters and return one page
+
+    By name, a keyset page; by relevance, a numbered one up to SEARCH_MAX_PAGE.
+    """
+    # Filter by department
+    dept_id = request.GET.get('department')
+    if dept_id and dept_id.isdigit():
+        doctors = doctors.filter(specialization_id=dept_id)
     
-    return available_dates
+    # Full-text search over name, qualification, bio and department
+    search = request.GET.get('search')
+    cursor = request.GET.get('cursor')
+    per_page = per_page or DOCTORS_PER_PAGE
+    if search:
+        doctors = search_index.filter_doctors(doctors, search)
+    if search and search_index.is_ranked(doctors):
+        page = numbered_page(doctors, cursor, per_page, SEARCH_MAX_PAGE)
+    else:
+        page = keyset_page(doctors, ('name', 'pk'), cursor, per_page)
+    return page, dept_id, search
 
 
-def _get_available_booking_times():
-    """Get available appointment times (30-minute slots from 9 AM to 5 PM)"""
-    times = []
-    start_hour = 9
-    end_hour = 17
-    
-    for hour in range(start_hour, end_hour):
-        for minute in [0, 30]:
-            time_str = f"{hour:02d}:{minute:02d}"
-            times.append(time_str)
-    
-    return times
+def _services_page(request, per_page=None):
+    services = Service.objects.select_related('department')
+    dept_id = request.GET.get('department')
+    if dept_id and dept_id.isdigit():
+        services = services.filter(department_id=dept_id)
+    page = keyset_page(services, ('name', 'pk'), request.GET.get('cursor'), per_page or SERVICES_PER_PAGE)
+    return page, dept_id
+
+
+def _api_page_size(request):
+    try:
+        return min(max(1, int(request.GET.get('limit', API_PAGE_SIZE))), API_MAX_PAGE_SIZE)
+    except ValueError:
+        return API_PAGE_SIZE
+
+
+def _page_links(request, page, param='cursor'):
+    """Query strings for the first and next pages, keeping the current filters"""
+    params = request.GET.copy()
+    params.pop(param, None)
+    links = {'first_page_query': params.urlencode(), 'next_page_query': ''}
+    if page.has_next:
+        params[param] = page.next_cursor
+        links['next_page_query'] = params.urlencode()
+    return links
+
+
+def _departments_with_images(departments):
+    """Pair each department with its image URL, falling back to a stock photo"""
+    default_dept_image = 'https://images.unsplash.com/photo-1580281657526-3e6a4e8f2d56?auto=format&fit=crop&w=800&q=60'
+    departments_with_images = []
+    for d in departments:
+        # Use department's image if available, otherwise use default
+        img = image_url(d, 800) or default_dept_image
+        # 64px icon on the home page; 128px covers high-density screens
+        thumbnail = image_url(d, 128) or default_dept_image
+        departments_with_images.append({'dept': d, 'image': img, 'thumbnail': thumbnail})
+    return departments_with_images
+
+
+def _find_or_404(objects, pk):
+    """Look up a row by primary key in a cached reference-data list"""
+    for obj in objects:
+        if str(obj.pk) == str(pk):
+            return obj
+    raise Http404('No matching record found.')
+
+
+def _get_available_booking_dates():
+    """Get the booking window (next 30 days); each doctor's schedule decides which days have slots"""
+    current_date = datetime.now().date() + timedelta(days=1)
+    return [current_date + timedelta(days=i) for i in range(30)]
 
 
 # Cost Estimate
@@ -383,26 +756,33 @@ def cost_estimate(request):
     """Get cost estimate for a service"""
     if request.method == 'POST':
         service_id = request.POST.get('service')
-        service = get_object_or_404(Service, id=service_id)
+        service = _find_or_404(get_services(), service_id)
         
         return render(request, 'cost_estimate.html', {
             'service': service,
             'estimate': service.cost_estimate,
         })
     
-    services = Service.objects.filter(cost_estimate__isnull=False)
+    services = [s for s in get_services() if s.cost_estimate is not None]
     return render(request, 'cost_estimate_form.html', {'services': services})
 
 
 # Authentication: registration
+@idempotent_post
 def register(request):
     if request.method == 'POST':
         form = UserRegistrationForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            # Auto-login the user after registration
-            login(request, user)
-            return redirect('hospital_system:home')
+            from django.db import IntegrityError
+            try:
+                user = form.save()
+            except IntegrityError:
+                # A concurrent registration took the username after validation
+                form.add_error('username', 'A user with that username already exists.')
+            else:
+                # Auto-login the user after registration
+                login(request, user)
+                return redirect('hospital_system:home')
     else:
         form = UserRegistrationForm()
     return render(request, 'register.html', {'form': form})
@@ -418,14 +798,27 @@ def patient_dashboard(request):
         # Handle case where user doesn't have a patient profile (shouldn't happen with new registration)
         return redirect('hospital_system:home')
     
-    # Get user's appointments
-    appointments = Appointment.objects.filter(
-        patient_email=patient.email
-    ).order_by('-appointment_date')
-    
+    # Both lists walk appointment_patient_date_idx one page at a time
+    appointments = patient.appointments.select_related('doctor', 'department')
+    today = datetime.now().date()
+    upcoming = keyset_page(
+        appointments.filter(appointment_date__gte=today),
+        ('appointment_date', 'appointment_time', 'pk'),
+        request.GET.get('upcoming'), DASHBOARD_PER_PAGE,
+    )
+    past = keyset_page(
+        appointments.filter(appointment_date__lt=today),
+        ('-appointment_date', '-appointment_time', '-pk'),
+        request.GET.get('past'), DASHBOARD_PER_PAGE,
+    )
+
     context = {
         'patient': patient,
-        'appointments': appointments,
+        'appointment_sections': [
+            {'title': 'Upcoming Appointments', 'page': upcoming, **_page_links(request, upcoming, 'upcoming')},
+            {'title': 'Past Appointments', 'page': past, **_page_links(request, past, 'past')},
+        ],
+        'has_appointments': bool(upcoming.items or past.items),
     }
     return render(request, 'patient_dashboard.html', context)
 
@@ -453,3 +846,34 @@ def update_profile(request):
     
     context = {'patient': patient}
     return render(request, 'update_profile.html', context)
+
+
+# Query metrics (staff only)
+@staff_member_required
+def query_metrics(request):
+    """Per-URL-name SQL aggregates recorded by QueryMetricsMiddleware in this process"""
+    if request.method == 'POST' and request.POST.get('reset'):
+        metrics.reset()
+    return JsonResponse({'routes': metrics.snapshot()})
+
+
+# Bulk export (staff only)
+@staff_member_required
+def export_appointments(request):
+    """Stream appointments as CSV or JSONL (?format=, ?from=, ?to=, ?status=, ?doctor=)
+
+    Rows are read in chunks while the response is sent, so memory stays flat
+    however many match.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in transfer.FORMATS:
+        return JsonResponse({'error': f'format must be one of {", ".join(transfer.FORMATS)}.'}, status=400)
+    try:
+        filters = transfer.export_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    rows = transfer.export_queryset(**filters)
+    response = StreamingHttpResponse(transfer.export_lines(rows, fmt), content_type=transfer.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="appointments.{fmt}"'
+    return response